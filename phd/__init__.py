@@ -1,3 +1,35 @@
-from .bn import BayesianNetwork
-from .rbn import RecursiveBayesianNetwork
-from .rel import Relation
+"""Selectivity estimation with Bayesian networks.
+
+The modules are only imported when they are first accessed, so that importing the package doesn't
+pull in networkx, pandas, scikit-learn nor SQLAlchemy. Answering queries with a frozen model only
+requires NumPy:
+
+    from phd import frozen
+    model = frozen.load('model.npz')
+
+"""
+import importlib
+
+
+_LAZY = {
+    'BayesianNetwork': 'bn',
+    'RecursiveBayesianNetwork': 'rbn',
+    'Relation': 'rel'
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(f'.{_LAZY[name]}', __name__), name)
+    try:
+        return importlib.import_module(f'.{name}', __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f'{__name__}.{name}':
+            raise
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
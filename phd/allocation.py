@@ -0,0 +1,133 @@
+"""Allocation of a bucket budget among the distributions of a Bayesian network.
+
+Each attribute is given a number `m` of most common values and a number `n` of equi-height
+buckets. These are used for the histogram of the attribute, whether it is the child or the parent
+of a CPD. A CPD between a parent with `s_p = m_p + n_p` buckets and a child with `s_c` buckets
+holds at most `s_p + (s_p + 1) * s_c` buckets: one histogram of the child per bucket of the
+parent, one for when the parent is null, and the bounds of the parent. The allocation starts with
+a single bucket per attribute and greedily adds the most common value or the equi-height bucket
+which reduces the estimated error the most per bucket spent, until the budget is exhausted.
+
+"""
+import numpy as np
+
+
+def size(dist):
+    """Returns the number of buckets stored in a Histogram, a CPD or a SparseCPD."""
+    if hasattr(dist, 'indices'):
+        return len(dist.by_hist) + len(dist.indices)
+    if hasattr(dist, 'on_hists'):
+        return len(dist.by_hist) + sum(len(h) for h in dist.on_hists) + \
+            (len(dist.on_null_hist) if dist.on_null_hist else 0)
+    return len(dist)
+
+
+def n_buckets(network):
+    """Returns the number of buckets stored in a fitted BayesianNetwork."""
+    return sum(size(network.nodes[node]['dist']) for node in network.nodes)
+
+
+class Attribute():
+    """The frequencies of an attribute along with its current allocation."""
+
+    def __init__(self, frequencies):
+        self.frequencies = np.sort(np.asarray(frequencies, dtype=float))[::-1]
+        self.m = 0
+        self.n = 1
+        self._spread = {}
+
+    @property
+    def size(self):
+        return self.m + self.n
+
+    def spread(self, m):
+        """Returns the total deviation from uniformity of the values which are not MCVs."""
+        if m not in self._spread:
+            rest = self.frequencies[m:]
+            self._spread[m] = float(np.abs(rest - rest.mean()).sum()) if len(rest) else 0.
+        return self._spread[m]
+
+    def error(self, m, n):
+        """Estimates the error made by assuming uniformity inside the equi-height buckets.
+
+        The deviation from uniformity of the values that are not MCVs is assumed to be divided
+        evenly between the buckets. There is no error once each value can have its own bucket.
+        """
+        if len(self.frequencies) - m <= n:
+            return 0.
+        return self.spread(m) / n
+
+    def gains(self):
+        """Yields the error reduction obtained by adding an MCV and by adding a bucket."""
+        error = self.error(self.m, self.n)
+        if self.m < len(self.frequencies):
+            yield 'm', error - self.error(self.m + 1, self.n)
+        yield 'n', error - self.error(self.m, self.n + 1)
+
+
+def allocate(relation, network, budget):
+    """Returns the number of MCVs and equi-height buckets to use for each attribute.
+
+    Parameters:
+        relation (phd.Relation): The data the network is going to be fitted to.
+        network (phd.BayesianNetwork): The structure of the network, the distributions are not
+            needed.
+        budget (int): The maximum number of buckets the fitted network may store.
+
+    Returns:
+        dict: A dictionary mapping each node to a pair `(m, n)`.
+
+    """
+
+    attributes = {
+        node: Attribute(relation[node].value_counts(normalize=True).values)
+        for node in network.nodes
+    }
+    root = network.root
+    parents = {child: parent for parent, child in network.edges}
+
+    def size():
+        total = attributes[root].size
+        for parent, child in network.edges:
+            s_p, s_c = attributes[parent].size, attributes[child].size
+            total += s_p + (s_p + 1) * s_c
+        return total
+
+    def cost(node):
+        """Returns the number of buckets it costs to give one more bucket to a node."""
+        total = 1 if node == root else 0
+        total += sum(1 + attributes[child].size for child in network.successors(node))
+        if node in parents:
+            total += attributes[parents[node]].size + 1
+        return total
+
+    used = size()
+    if used > budget:
+        raise ValueError(f'a budget of at least {used} buckets is required')
+
+    while True:
+
+        best, best_ratio = None, 0.
+        for node, attribute in attributes.items():
+            price = cost(node)
+            if used + price > budget:
+                continue
+            for kind, gain in attribute.gains():
+                if gain / price > best_ratio:
+                    best, best_ratio = (node, kind, price), gain / price
+
+        if best is None:
+            break
+
+        node, kind, price = best
+        setattr(attributes[node], kind, getattr(attributes[node], kind) + 1)
+        used += price
+
+    return {node: (attribute.m, attribute.n) for node, attribute in attributes.items()}
+
+
+def split(budget, relations):
+    """Splits a budget between relations in proportion to their number of attributes."""
+    n_columns = {r.name: len(r.columns) for r in relations}
+    total = sum(n_columns.values())
+    return {name: budget * n // total for name, n in n_columns.items()}
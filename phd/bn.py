@@ -1,33 +1,59 @@
-import decimal
+import collections
+from concurrent import futures
 import itertools
+import time
 
-try:
-    import graphviz
-    GRAPHVIZ_INSTALLED = True
-except ImportError:
-    GRAPHVIZ_INSTALLED = False
 import networkx as nx
+import numpy as np
 import pandas as pd
-from sklearn import metrics
-from sklearn import utils
-import sqlalchemy
 
+from . import allocation
 from . import cpd
+from . import drift
+from . import factor
+from . import frozen
 from . import histogram
-from . import null
+from . import lookup
+from . import op
 from . import rel
+from . import report
+
+
+Selectivities = collections.namedtuple('Selectivities', 'values index probas')
+Selectivities.__doc__ = """The precomputed selectivities of the most common values of an attribute.
+
+`index` locates a value among `values` and `probas[i]` is the selectivity of `values[i]`.
+"""
 
 
 class BayesianNetwork(nx.DiGraph):
 
     def __init__(self, incoming_graph_data=None, cl_max_rows=30000, random_state=None,
-                 unique_ratio_limit=1.0):
+                 unique_ratio_limit=1.0, n_jobs=1, backend='thread', engine='histogram',
+                 budget=None, sparse=False):
+        from sklearn import utils
+
         super().__init__(incoming_graph_data)
         self.cl_max_rows = cl_max_rows
         self.random_state = utils.check_random_state(random_state)
+        self.n_jobs = n_jobs  # Number of workers used to fit the CPDs, -1 means all the cores
+        self.backend = backend  # Either 'thread' or 'process'
+        self.engine = engine  # Either 'histogram' or 'factor'
+        self.budget = budget  # Maximum number of buckets, None means no limit
+        self.sparse = sparse  # Whether to use SparseCPDs instead of CPDs
+        self.precomputed_ = {}
+        self.steiner_trees_ = {}
+        self.fit_times_ = {}
+        self._factor_graph = None
 
     def fit(self, relation):
-        """Fits the BayesianNetwork to a Relation."""
+        """Fits the BayesianNetwork to a Relation.
+
+        A `rel.MappedRelation` is fitted to a uniform sample of `cl_max_rows` of its rows.
+        """
+
+        if isinstance(relation, rel.MappedRelation):
+            relation = relation.sample(self.cl_max_rows, self.random_state)
 
         # Drop the columns with unique values
         n_uniques = relation.nunique() # TODO, consider different n_unique ratio thresholds
@@ -53,50 +79,89 @@ class BayesianNetwork(nx.DiGraph):
 
         # Find the structure
         cl = build_chow_liu(r[attributes])
-        self = BayesianNetwork(
-            incoming_graph_data=cl,
-            cl_max_rows=self.cl_max_rows,
-            random_state=self.random_state
-        )
-
-        return self
+        self = self._like(cl)
 
         # Compute the CPDs
-        self.update(relation)
+        self.update(relation, budget=self.budget)
 
         return self
 
-    def fit_sql(self, sql: str, con: sqlalchemy.engine.base.Connection):
+    def fit_sql(self, sql: str, con: 'sqlalchemy.engine.base.Connection'):
         """Fits the BayesianNetwork to a Relation derived from an SQL query."""
         relation = rel.Relation(pd.read_sql(sql, con=con))
         return self.fit(relation)
 
-    def update(self, relation, by_m=30, by_n=30, on_m=30, on_n=30):
+    def update(self, relation, by_m=30, by_n=30, on_m=30, on_n=30, budget=None):
         """Updates the distributions of the network.
 
         First, the root node is annotated with a histogram. Then, each node is
         annotated with a conditional probability distribution conditioned on it's
-        parent. The tree is traversed in a depth-search manner.
+        parent. Once the structure is known each CPD can be fitted independently,
+        hence they are distributed over `n_jobs` workers.
+
+        By default each parent is described with `by_m` MCVs and `by_n` buckets and each
+        child with `on_m` MCVs and `on_n` buckets. If a `budget` is given then these numbers are
+        determined for each attribute so that the network stores at most `budget` buckets, see
+        `phd.allocation`. If `sparse` was set, each CPD is a `SparseCPD` whose child buckets are
+        shared by all the parent buckets.
         """
 
+        self._factor_graph = None
+        self.precomputed_ = {}
+        self.steiner_trees_ = {}
+        self.fit_times_ = {}
+
         if self.number_of_nodes() == 0:
             return self
 
-        def walk(node, parent):
+        # Determine how many MCVs and buckets each attribute gets
+        if budget is None:
+            sizes = {node: ((by_m, by_n), (on_m, on_n)) for node in self.nodes}
+        else:
+            allocated = allocation.allocate(relation, self, budget)
+            sizes = {node: (mn, mn) for node, mn in allocated.items()}
 
-            by = relation[parent].fillna(null.Null()).values.tolist()
-            on = relation[node].fillna(null.Null()).values.tolist()
+        # Convert each column once, the CPDs of a node and of its children share it. Missing
+        # values are kept as is, the histograms detect them with a mask.
+        columns = {node: relation[node].tolist() for node in self.nodes}
 
-            self.nodes[node]['dist'] = cpd.CPD(by_m, by_n, on_m, on_n).fit(by, on)
+        root = self.root
+        tic = time.perf_counter()
+        self.nodes[root]['dist'] = histogram.Histogram(*sizes[root][1]).fit(columns[root])
+        self.fit_times_[root] = time.perf_counter() - tic
+
+        edges = list(nx.dfs_edges(self, root))
+        params = [(*sizes[parent][0], *sizes[node][1]) for parent, node in edges]
+        n_workers = None if self.n_jobs == -1 else self.n_jobs
+
+        if n_workers == 1 or len(edges) < 2:
+            cpds = [
+                timed(fit_cpd, columns[parent], columns[node], p, self.sparse)
+                for (parent, node), p in zip(edges, params)
+            ]
+
+        elif self.backend == 'thread':
+            with futures.ThreadPoolExecutor(n_workers) as pool:
+                cpds = list(pool.map(
+                    lambda edge, p: timed(fit_cpd, columns[edge[0]], columns[edge[1]], p,
+                                          self.sparse),
+                    edges,
+                    params
+                ))
+
+        elif self.backend == 'process':
+            # The columns are handed to each worker once instead of once per edge
+            with futures.ProcessPoolExecutor(n_workers, initializer=_share_columns,
+                                             initargs=(columns,)) as pool:
+                cpds = list(pool.map(_fit_shared_cpd, edges, params,
+                                     itertools.repeat(self.sparse)))
 
-            for child in self.successors(node):
-                walk(child, node)
+        else:
+            raise ValueError(f"unknown backend '{self.backend}', use 'thread' or 'process'")
 
-        root = self.root
-        root_values = relation[root].fillna(null.Null())
-        self.nodes[root]['dist'] = histogram.Histogram(on_m, on_n).fit(root_values.values.tolist())
-        for child in self.successors(root):
-            walk(child, root)
+        for (_, node), (dist, duration) in zip(edges, cpds):
+            self.nodes[node]['dist'] = dist
+            self.fit_times_[node] = duration
 
         return self
 
@@ -118,43 +183,254 @@ class BayesianNetwork(nx.DiGraph):
 
         return BayesianNetwork(self.subgraph(bunch))
 
-    def infer(self, query):
-        """Returns the estimated selectivity of a query."""
+    def warm_up(self, attribute_sets):
+        """Computes ahead of time the Steiner tree used by `p` for each set of attributes."""
+        for attributes in attribute_sets:
+            key = frozenset(attributes)
+            if key not in self.steiner_trees_:
+                self.steiner_trees_[key] = self.steiner_tree(key)
+        return self
+
+    def cost(self, nodes):
+        """Returns the number of buckets that are visited to answer a query on a set of nodes.
+
+        Inference walks down from the root, hence every node on the path between the root and a
+        queried node is visited.
+        """
+        visited = set()
+        for node in nodes:
+            while node in self and node not in visited:
+                visited.add(node)
+                node = next(self.predecessors(node), None)
+        return sum(allocation.size(self.nodes[node]['dist']) for node in visited)
+
+    def infer(self, query, messages=None, memo=None):
+        """Returns the estimated selectivity of a query.
+
+        The distributions of the network are left untouched, each intermediate result is a new
+        Histogram or CPD. `messages` maps nodes to Histograms over their values, which are
+        multiplied with the distribution of the node as if they were sent by extra children.
+        `memo` is a dict in which the message sent by each subtree is stored, keyed by the
+        conditions of the subtree, so that queries which share conditions can share messages.
+        """
+
+        root = self.root
+        hist = self.nodes[root]['dist']
+
+        for message in self.root_messages(query, messages, memo):
+            hist = hist * message
+
+        condition = query.get(root)
+        if condition is not None:
+            return hist.p(condition)
+        return sum(b.frequency for b in hist.buckets)
+
+    def root_messages(self, query, messages=None, memo=None):
+        """Returns the Histograms sent to the root by its children, see `infer`.
+
+        The messages of the root itself are returned along with them.
+        """
+
+        messages = messages or {}
 
         def walk(node):
 
-            cpd = self.node[node]['dist']
+            if memo is None:
+                return send(node)
+
+            if ('subtree', node) not in memo:
+                memo[('subtree', node)] = nx.descendants(self, node) | {node}
+            try:
+                key = (node, frozenset(
+                    (n, query[n]) for n in memo[('subtree', node)] if n in query
+                ))
+            except TypeError:
+                return send(node)
+            if key not in memo:
+                memo[key] = send(node)
+            return memo[key]
+
+        def send(node):
+
+            cpd = self.nodes[node]['dist']
 
             for child in self.successors(node):
-                cpd *= walk(child)
+                cpd = cpd * walk(child)
+            for message in messages.get(node, ()):
+                cpd = cpd * message
 
             condition = query.get(node)
             if condition is not None:
                 return cpd.p_by(condition)
-
-            hist = cpd.by_hist
-            for i, (bucket, on_hist) in enumerate(zip(cpd.by_hist.buckets, cpd.on_hists)):
-                bucket.frequency = sum(b.frequency for b in on_hist)
-                bucket.cardinality = decimal.Decimal(1)
-                hist.buckets[i] = bucket
-            return hist
+            return cpd.marginalize()
 
         root = self.root
-        hist = self.node[root]['dist']
+        return [walk(child) for child in self.successors(root)] + list(messages.get(root, ()))
 
-        for child in self.successors(root):
-            hist = hist * walk(child)
+    def p(self, *disjunctions, **query):
+        """Eye candy on top of `infer`.
 
-        condition = query.get(root)
-        if condition is not None:
-            return hist.p(condition)
-        return sum(b.frequency for b in hist.buckets)
+        The computation is done by the inference engine of the network. The 'histogram' engine
+        multiplies the Histograms and CPDs of the relevant nodes together. The 'factor' engine
+        performs variable elimination over the factor tables of the network, see `phd.factor`.
+        Queries covered by `precompute` are answered with a lookup instead.
 
-    def p(self, **query):
-        """Eye candy on top of `infer`."""
-        relevant = self.steiner_tree(query.keys())
+        A condition can also be a `phd.op.Predicate`, such as `kind=op.In(['movie', 'episode'])`,
+        and each positional argument is an `op.Or` of queries across attributes, for instance
+        `p(op.Or({'kind': 'movie'}, {'note': 'USA'}), year=2000)`. The disjunctions are expanded
+        by `op.terms` into conjunctive queries, which are answered with `p_many`. Predicates are
+        only supported by the 'histogram' engine.
+        """
+        if disjunctions:
+            terms = op.terms(disjunctions, query)
+            return sum(
+                coefficient * p
+                for (coefficient, _), p in zip(terms, self.p_many([q for _, q in terms]))
+            )
+        if self.precomputed_ and not op.has_predicates(query):
+            p = self._lookup(query)
+            if p is not None:
+                return p
+        if self.engine == 'factor':
+            if op.has_predicates(query):
+                raise ValueError("predicates are only supported by the 'histogram' engine")
+            return self.factor_graph.infer(query)
+        if self.engine != 'histogram':
+            raise ValueError(f"unknown engine '{self.engine}', use 'histogram' or 'factor'")
+        relevant = self.steiner_trees_.get(frozenset(query))
+        if relevant is None:
+            relevant = self.steiner_tree(query.keys())
+        # None of the attributes of the query are in the network
+        if not relevant:
+            return 1.
         return float(relevant.infer(query))
 
+    def p_many(self, queries):
+        """Returns the selectivity of each of several conjunctive queries.
+
+        Each query is answered with the Steiner tree of its own attributes, as `p` would. The
+        queries on the same attributes share a tree, and the message sent by one of its subtrees
+        is computed once for all the queries which have the same conditions in that subtree.
+        """
+        if self.engine != 'histogram':
+            return [self.p(**query) for query in queries]
+        groups = collections.defaultdict(list)
+        for i, query in enumerate(queries):
+            groups[frozenset(query)].append(i)
+        estimates = [1.] * len(queries)
+        for attributes, indexes in groups.items():
+            relevant = self.steiner_trees_.get(attributes)
+            if relevant is None:
+                relevant = self.steiner_tree(attributes)
+            if not relevant:
+                continue
+            memo = {}
+            for i in indexes:
+                estimates[i] = float(relevant.infer(queries[i], memo=memo))
+        return estimates
+
+    def precompute(self, pairs=None, workload=None, max_values=30):
+        """Materializes the selectivities of the most common values and of pairs of them.
+
+        For each attribute, the selectivities of its `max_values` most frequent single-value
+        buckets are stored in an array. For each pair of attributes, the joint selectivities of
+        the combinations of these values are stored in a matrix. The pairs are the edges of the
+        network, the given `pairs`, and the pairs of attributes which appear together in the
+        queries of a `workload`. `p` then answers equality queries on one attribute or on a
+        covered pair with a binary search and an array lookup.
+        """
+
+        if self.engine == 'factor':
+            estimate = lambda queries: [self.factor_graph.infer(q) for q in queries]
+        else:
+            estimate = self.freeze().p_many
+
+        precomputed = {}
+
+        for node in self.nodes:
+            dist = self.nodes[node]['dist']
+            if isinstance(dist, histogram.Histogram):
+                hists = [dist]
+            else:
+                hists = [dist.on_hist] if isinstance(dist, cpd.SparseCPD) else dist.on_hists
+            values = list({b.left for hist in hists for b in hist.buckets if b.cardinality == 1})
+            if not values:
+                continue
+            probas = np.array(estimate([{node: val} for val in values]))
+            order = np.argsort(-probas, kind='stable')[:max_values]
+            values = lookup.as_array([values[i] for i in order])
+            precomputed[node] = Selectivities(values, lookup.Index(values, values), probas[order])
+
+        pairs = itertools.chain(
+            self.edges,
+            pairs or [],
+            (pair for query in workload or [] for pair in itertools.combinations(query, 2))
+        )
+
+        for pair in {tuple(sorted(pair)) for pair in pairs}:
+            a, b = pair
+            if a not in precomputed or b not in precomputed:
+                continue
+            values_a, values_b = precomputed[a].values, precomputed[b].values
+            queries = [{a: x, b: y} for x in values_a.tolist() for y in values_b.tolist()]
+            precomputed[pair] = np.array(estimate(queries)).reshape(len(values_a), len(values_b))
+
+        self.precomputed_ = precomputed
+        return self
+
+    def _lookup(self, query):
+        """Returns the precomputed selectivity of a query, or None if it isn't covered."""
+
+        if not 0 < len(query) <= 2:
+            return None
+
+        key = tuple(sorted(query))
+        positions = []
+        for attribute in key:
+            single = self.precomputed_.get(attribute)
+            if single is None:
+                return None
+            try:
+                i = single.index.locate_one(query[attribute])
+            except TypeError:
+                return None
+            if i < 0:
+                return None
+            positions.append(i)
+
+        if len(key) == 1:
+            return float(self.precomputed_[key[0]].probas[positions[0]])
+        table = self.precomputed_.get(key)
+        return None if table is None else float(table[positions[0], positions[1]])
+
+    @property
+    def factor_graph(self):
+        """Returns the FactorGraph used by the 'factor' engine, it is built upon first use."""
+        if self._factor_graph is None:
+            self._factor_graph = factor.FactorGraph(self.freeze())
+        return self._factor_graph
+
+    def check_drift(self, summaries, threshold=.1):
+        """Returns the divergence of each attribute from a fresh sample or from pg_stats.
+
+        See `phd.drift` for more details.
+        """
+        return drift.check(self, summaries, threshold)
+
+    def report(self, holdout=None, max_values=30):
+        """Returns the footprint and the accuracy of the distribution of each node.
+
+        See `phd.report` for a description of the columns.
+        """
+        return report.report(self, holdout, max_values)
+
+    def freeze(self):
+        """Returns an immutable and thread-safe version of the network.
+
+        See `phd.frozen` for more details.
+        """
+        return frozen.FrozenBayesianNetwork.from_network(self)
+
     @property
     def root(self):
         """Returns the root node of the network."""
@@ -169,17 +445,81 @@ class BayesianNetwork(nx.DiGraph):
 
         Raises a `RuntimeError` if GraphViz is not installed.
         """
-        if not GRAPHVIZ_INSTALLED:
+        try:
+            import graphviz
+        except ImportError:
             raise RuntimeError('graphviz needs to be installed')
         return graphviz.Source(self.to_dot())
 
     def rename(self, mapping):
-        """Renames each node according to a mapping."""
-        return BayesianNetwork(nx.relabel_nodes(self, mapping))
+        """Renames each node according to a mapping, which is either a dict or a function.
+
+        The precomputed selectivities and the Steiner trees are renamed along with the nodes.
+        """
+        relabel = mapping if callable(mapping) else lambda node: mapping.get(node, node)
+        network = self._like(nx.relabel_nodes(self, relabel))
+
+        for key, value in self.precomputed_.items():
+            if isinstance(key, tuple):
+                a, b = relabel(key[0]), relabel(key[1])
+                # The pairs are sorted, the renaming might swap them
+                network.precomputed_[tuple(sorted((a, b)))] = value if a <= b else value.T
+            else:
+                network.precomputed_[relabel(key)] = value
+        network.steiner_trees_ = {
+            frozenset(map(relabel, key)): tree.rename(relabel)
+            for key, tree in self.steiner_trees_.items()
+        }
+        network.fit_times_ = {relabel(node): t for node, t in self.fit_times_.items()}
+        return network
 
     def copy(self):
-        """Returns an independent copy."""
-        return BayesianNetwork(super().copy())
+        """Returns an independent copy, the fitted distributions are shared."""
+        network = self._like(super().copy())
+        network.precomputed_ = dict(self.precomputed_)
+        network.steiner_trees_ = dict(self.steiner_trees_)
+        network.fit_times_ = dict(self.fit_times_)
+        return network
+
+    def _like(self, graph):
+        """Returns a network over `graph` with the same parameters as this one."""
+        return BayesianNetwork(
+            graph,
+            cl_max_rows=self.cl_max_rows,
+            random_state=self.random_state,
+            n_jobs=self.n_jobs,
+            backend=self.backend,
+            engine=self.engine,
+            budget=self.budget,
+            sparse=self.sparse
+        )
+
+
+def fit_cpd(by, on, params, sparse=False):
+    """Fits the CPD of `on` conditioned on `by`."""
+    if sparse:
+        return cpd.SparseCPD(*params).fit(by, on)
+    return cpd.CPD(*params).fit(by, on)
+
+
+def timed(func, *args):
+    """Returns the output of a function along with the number of seconds it took."""
+    tic = time.perf_counter()
+    output = func(*args)
+    return output, time.perf_counter() - tic
+
+
+_SHARED_COLUMNS = {}
+
+
+def _share_columns(columns):
+    """Makes the encoded columns available inside a worker process."""
+    _SHARED_COLUMNS.update(columns)
+
+
+def _fit_shared_cpd(edge, params, sparse):
+    parent, node = edge
+    return timed(fit_cpd, _SHARED_COLUMNS[parent], _SHARED_COLUMNS[node], params, sparse)
 
 
 def build_chow_liu(relation):
@@ -198,6 +538,7 @@ def build_chow_liu(relation):
         networkx.DiGraph: A directed graph with a tree structure.
 
     """
+    from sklearn import metrics
 
     # Create a graph that contains all the mutual information values
     mut_info_graph = nx.Graph()
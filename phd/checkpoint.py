@@ -0,0 +1,95 @@
+"""Checkpoints of the networks of a RecursiveBayesianNetwork which is being fitted.
+
+The network of each relation is pickled to its own file as soon as it is fitted, along with the
+relations it is extended with. Each file is tagged with a fingerprint of the inputs of the network:
+the data of the relation, the parameters it is fitted with, such as the number of rows it is
+sampled to and the random state, and the fingerprints of the relations it references, whose root
+attribute is part of its star join. When the fit is run again with the same checkpoint directory,
+the networks whose fingerprint hasn't changed are read back instead of being fitted, whereas a
+change in a relation invalidates the relations which reference it.
+
+"""
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from . import rel
+
+
+def fingerprint(*parts):
+    """Returns a digest of the representation of some values."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def relation_fingerprint(relation, method='content'):
+    """Returns a fingerprint of a Relation.
+
+    The 'content' method hashes every row, whereas the 'rows' method only uses the number of rows
+    and the columns. The latter is much cheaper but it doesn't notice updates. The content of a
+    `phd.rel.MappedRelation` is fingerprinted by its files instead, so that it isn't read.
+    """
+    columns = list(relation.columns)
+    if method == 'rows':
+        return fingerprint(columns, len(relation))
+    if method == 'content' and isinstance(relation, rel.MappedRelation):
+        return fingerprint(columns, file_fingerprint(relation.directory))
+    if method == 'content':
+        rows = pd.util.hash_pandas_object(pd.DataFrame(relation), index=True).values
+        return fingerprint(columns, hashlib.sha1(rows.tobytes()).hexdigest())
+    raise ValueError(f"unknown fingerprint method '{method}', use 'content' or 'rows'")
+
+
+def random_state_fingerprint(random_state):
+    """Returns a fingerprint of a seed, or of the current state of a `np.random.RandomState`.
+
+    The representation of a RandomState only gives its address, which changes from one run to
+    the next, whereas its state determines the samples it draws.
+    """
+    if isinstance(random_state, np.random.RandomState):
+        return hashlib.sha1(repr(random_state.get_state()).encode()).hexdigest()
+    return fingerprint(random_state)
+
+
+def file_fingerprint(path):
+    """Returns a fingerprint of a file based on its size and its modification time.
+
+    The directory of a mapped relation is fingerprinted by each of its files, hence rewriting the
+    column files is noticed even if `meta.json` stays the same.
+    """
+    if os.path.isdir(path) and os.path.isfile(os.path.join(path, 'meta.json')):
+        return fingerprint(*(
+            file_fingerprint(os.path.join(path, name)) for name in sorted(os.listdir(path))
+        ))
+    stat = os.stat(path)
+    return fingerprint(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+class Checkpoint():
+    """A directory which contains one file per fitted relation."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, f'{name}.pkl')
+
+    def load(self, name, fingerprint):
+        """Returns the entry of a relation, or None if it is missing or out of date."""
+        try:
+            with open(self.path(name), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return entry if entry.get('fingerprint') == fingerprint else None
+
+    def save(self, name, fingerprint, **entry):
+        """Writes the entry of a relation, replacing the previous one at once."""
+        entry['fingerprint'] = fingerprint
+        tmp = f'{self.path(name)}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(name))
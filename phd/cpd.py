@@ -2,11 +2,30 @@ import collections
 import copy
 import decimal
 
+import numpy as np
+
+from . import bucket
 from . import histogram
+from . import lookup
+from . import op
+
 
+def group_by(by_hist, by, on):
+    """Groups the values of `on` according to the bucket of `by_hist` their `by` value is in.
 
-def argsort(arr):
-    return [i[0] for i in sorted(enumerate(arr), key=lambda x:x[1])]
+    The values of `on` for which `by` is null are grouped under the None key.
+    """
+
+    on_values = collections.defaultdict(list)
+    indexes, nulls = by_hist.index.locate(by)
+
+    for i, is_null, on_val in zip(indexes.tolist(), nulls.tolist(), on):
+        if is_null:
+            on_values[None].append(on_val)
+        elif i >= 0:
+            on_values[i].append(on_val)
+
+    return on_values
 
 
 class CPD():
@@ -67,33 +86,17 @@ class CPD():
         """Fits the Histogram to `on` conditioned on `by`."""
         self.by_hist = histogram.Histogram(self.by_m, self.by_n).fit(by)
 
-        on_values = collections.defaultdict(list)
-
-        i = 0
-        order = argsort(by)
-        limit = self.by_hist[i].right
-
-        for j in order:
-
-            by_val, on_val = by[j], on[j]
-
-            if by_val is None:
-                on_values[None].append(on_val)
-                continue
-
-            if by_val > limit:
-                i += 1
-                limit = self.by_hist[i].right
-
-            on_values[i].append(on_val)
+        on_values = group_by(self.by_hist, by, on)
 
         self.on_null_hist = histogram.Histogram(self.on_m, self.on_n)
         if None in on_values:
             self.on_null_hist = self.on_null_hist.fit(on_values.pop(None))
 
+        # Row i holds the values of `on` whose `by` value lies in the i-th bucket of `by_hist`
         self.on_hists = [
-            histogram.Histogram(self.on_m, self.on_n).fit(on_values[by_val])
-            for by_val in sorted(on_values)
+            histogram.Histogram(self.on_m, self.on_n).fit(on_values[i])
+            if on_values.get(i) else histogram.Histogram(self.on_m, self.on_n)
+            for i in range(len(self.by_hist))
         ]
 
         return self
@@ -105,14 +108,189 @@ class CPD():
 
     def p_by(self, on):
         """Returns a Histogram representing P(by, on=val)"""
+        return self._by_histogram([on_hist.p(on) for on_hist in self.on_hists])
+
+    def marginalize(self):
+        """Returns a Histogram representing P(by, on=any value)"""
+        return self._by_histogram([
+            sum(b.frequency for b in on_hist.buckets)
+            for on_hist in self.on_hists
+        ])
+
+    def _by_histogram(self, frequencies):
+        """Returns a Histogram with the bounds of `by_hist` and one frequency per bucket.
+
+        The buckets are new objects so that the CPD itself is never modified.
+        """
+        hist = histogram.Histogram(self.by_hist.m, self.by_hist.n)
+        hist.buckets = [
+            bucket.Bucket(b.left, b.right, frequencies[i] if i < len(frequencies) else 0, 1)
+            for i, b in enumerate(self.by_hist.buckets)
+        ]
+        hist.null_frac = self.by_hist.null_frac
+        return hist
 
-        hist = copy.copy(self.by_hist)
+    def __str__(self):
+        return '\n'.join(f'~~ {by} ~~\n{on}' for by, on in zip(self.by_hist.buckets, self.on_hists))
 
-        for i, (bucket, on_hist) in enumerate(zip(self.by_hist.buckets, self.on_hists)):
-            bucket.frequency = on_hist.p(on)
-            bucket.cardinality = decimal.Decimal(1)
-            hist.buckets[i] = bucket
+    def __repr__(self):
+        return str(self)
+
+
+class SparseCPD():
+    """A CPD where the children of every parent bucket share the same buckets.
+
+    The buckets of the child are fitted once on all the values of `on`. The conditional
+    frequencies are stored in a sparse matrix in CSR format, with one row per bucket of `by_hist`
+    and one column per bucket of `on_hist`. Only the parent/child bucket pairs which co-occur take
+    up memory. Multiplying with a Histogram only requires computing one multiplier per column.
 
+    """
+
+    def __init__(self, by_m, by_n, on_m, on_n):
+        self.by_m = by_m  # Number of MCVs used for the parent
+        self.by_n = by_n  # Number of bins used for the parent
+        self.on_m = on_m  # Number of MCVs used for the child
+        self.on_n = on_n  # Number of bins used for the child
+        self.by_hist = None
+        self.on_hist = None
+        self.indptr = None
+        self.indices = None
+        self.data = None
+        self.null_fracs = None
+        self.on_null_hist = None
+
+    def __len__(self):
+        return len(self.by_hist)
+
+    def __eq__(self, other):
+        return self.by_hist == other.by_hist and \
+            self.on_hist == other.on_hist and \
+            np.array_equal(self.indptr, other.indptr) and \
+            np.array_equal(self.indices, other.indices) and \
+            np.array_equal(self.data, other.data) and \
+            np.array_equal(self.null_fracs, other.null_fracs)
+
+    def __copy__(self):
+        cpd = SparseCPD(self.by_m, self.by_n, self.on_m, self.on_n)
+        cpd.by_hist = self.by_hist
+        cpd.on_hist = self.on_hist
+        cpd.indptr = self.indptr
+        cpd.indices = self.indices
+        cpd.data = self.data.copy()
+        cpd.null_fracs = self.null_fracs
+        return cpd
+
+    def __mul__(self, other):
+        """Multiplies a CPD with a histogram."""
+
+        if not isinstance(other, histogram.Histogram):
+            raise ValueError('can only multiply a CPD with a Histogram')
+
+        multipliers = np.array([float(m) for m in other.multipliers(self.on_hist.buckets)])
+
+        cpd = copy.copy(self)
+        cpd.data = self.data * multipliers[self.indices]
+        return cpd
+
+    @property
+    def rows(self):
+        """Returns the row of each stored frequency."""
+        return np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+    @property
+    def on_hists(self):
+        """Returns one Histogram per parent bucket, as with `CPD`."""
+        hists = []
+        for i, (start, end) in enumerate(zip(self.indptr[:-1], self.indptr[1:])):
+            hist = histogram.Histogram(self.on_m, self.on_n)
+            hist.buckets = [
+                bucket.Bucket(b.left, b.right, freq, b.cardinality)
+                for b, freq in zip(
+                    (self.on_hist[j] for j in self.indices[start:end]),
+                    self.data[start:end]
+                )
+            ]
+            hist.null_frac = decimal.Decimal(str(self.null_fracs[i]))
+            hists.append(hist)
+        return hists
+
+    def column(self, val):
+        """Returns the index of the child bucket which contains `val`, or -1."""
+        j, _ = self.on_hist.find_bucket(val)
+        return j
+
+    def fit(self, by, on):
+        """Fits the sparse matrix to `on` conditioned on `by`.
+
+        Both columns are located in their histograms in one pass each, after which the co-occurring
+        bucket pairs are counted without any Python loop.
+        """
+        self.by_hist = histogram.Histogram(self.by_m, self.by_n).fit(by)
+        self.on_hist = histogram.Histogram(self.on_m, self.on_n).fit(on)
+
+        rows, by_nulls = self.by_hist.index.locate(by)
+        cols, on_nulls = self.on_hist.index.locate(on)
+        n_rows, n_cols = len(self.by_hist), max(len(self.on_hist), 1)
+
+        keep = ~by_nulls & (rows >= 0)
+        totals = np.bincount(rows[keep], minlength=n_rows)
+        null_counts = np.bincount(rows[keep & on_nulls], minlength=n_rows)
+
+        pairs = keep & (cols >= 0)
+        keys, counts = np.unique(rows[pairs] * n_cols + cols[pairs], return_counts=True)
+        pair_rows = keys // n_cols
+
+        self.indptr = np.searchsorted(pair_rows, np.arange(n_rows + 1)).astype(np.int32)
+        self.indices = (keys % n_cols).astype(np.int32)
+        self.data = counts / totals[pair_rows]
+        self.null_fracs = null_counts / np.maximum(totals, 1)
+
+        return self
+
+    def p(self, by, on):
+        """Returns P(on|by)."""
+        i, _ = self.by_hist.find_bucket(by)
+        if i < 0:
+            return 0
+        if lookup.is_null(on):
+            return self.null_fracs[i]
+        j = self.column(on)
+        start, end = self.indptr[i], self.indptr[i + 1]
+        hits = np.flatnonzero(self.indices[start:end] == j)
+        if j < 0 or not len(hits):
+            return 0
+        return self.data[start + hits[0]] / float(self.on_hist[j].cardinality)
+
+    def p_by(self, on):
+        """Returns a Histogram representing P(by, on=val)"""
+        if isinstance(on, op.Predicate):
+            weights, null = on.weights(self.on_hist)
+            frequencies = np.bincount(self.rows, weights=self.data * weights[self.indices],
+                                      minlength=len(self.by_hist))
+            return self._by_histogram(frequencies + null * np.asarray(self.null_fracs))
+        if lookup.is_null(on):
+            return self._by_histogram(self.null_fracs)
+        j = self.column(on)
+        mask = self.indices == j
+        frequencies = np.bincount(self.rows[mask], weights=self.data[mask],
+                                  minlength=len(self.by_hist))
+        if j >= 0:
+            frequencies /= float(self.on_hist[j].cardinality)
+        return self._by_histogram(frequencies)
+
+    def marginalize(self):
+        """Returns a Histogram representing P(by, on=any value)"""
+        return self._by_histogram(np.bincount(self.rows, weights=self.data,
+                                              minlength=len(self.by_hist)))
+
+    def _by_histogram(self, frequencies):
+        hist = histogram.Histogram(self.by_hist.m, self.by_hist.n)
+        hist.buckets = [
+            bucket.Bucket(b.left, b.right, freq, 1)
+            for b, freq in zip(self.by_hist.buckets, frequencies)
+        ]
+        hist.null_frac = self.by_hist.null_frac
         return hist
 
     def __str__(self):
@@ -0,0 +1,213 @@
+"""Detection of the relations whose data has drifted away from their fitted networks.
+
+Each attribute of a relation is summarized by its most common values, their frequencies and its
+fraction of nulls, just like the `most_common_vals`, `most_common_freqs` and `null_frac` columns
+of PostgreSQL's `pg_stats` view. The summaries are either computed from a fresh sample of the
+relation with `summarize`, or read from `pg_stats` with `read_pg_stats`, which doesn't scan any
+table.
+
+The divergence between a summary and a network is half the sum of the absolute differences
+between the observed frequencies and the ones estimated by the network, over the most common
+values, the nulls and the rest of the values taken together. This is a lower bound of the total
+variation distance between the fresh distribution of the attribute and its marginal distribution
+in the network. It is 0 when nothing changed and at most 1.
+
+A relation has drifted as soon as one of its attributes diverges by more than a threshold. Its
+network has to be refitted, as well as the networks of the relations which reference it through
+a foreign key, because their star joins contain the root attribute of the drifted relation.
+
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+
+from . import lookup
+
+
+Summary = collections.namedtuple('Summary', 'values freqs null_frac')
+Summary.__doc__ = """The most common values of an attribute along with their frequencies.
+
+`null_frac` is the fraction of rows for which the attribute is null.
+"""
+
+
+def summarize(frame, max_values=30):
+    """Returns the Summary of each column of a sample."""
+    summaries = {}
+    for col in frame.columns:
+        values = pd.Series(frame[col])
+        nulls = lookup.null_mask(values.tolist())
+        counts = values[~nulls].value_counts().head(max_values)
+        n = max(len(values), 1)
+        summaries[col] = Summary(
+            values=counts.index.tolist(),
+            freqs=(counts.values / n).tolist(),
+            null_frac=float(nulls.sum()) / n
+        )
+    return summaries
+
+
+def read_pg_stats(con: 'sqlalchemy.engine.base.Connection', relation_names=None):
+    """Returns the Summary of each attribute of each relation from the `pg_stats` view.
+
+    The statistics are those of the last `ANALYZE`, hence they are only as fresh as the last
+    time the table was analyzed, be it manually or by the autovacuum daemon.
+    """
+    sql = '''
+        SELECT
+            tablename,
+            attname,
+            null_frac,
+            most_common_vals::text::text[] AS most_common_vals,
+            most_common_freqs
+        FROM
+            pg_stats
+        WHERE
+            pg_stats.schemaname = 'public'
+    '''
+    stats = pd.read_sql(sql, con)
+
+    summaries = collections.defaultdict(dict)
+    for row in stats.itertuples(index=False):
+        if relation_names is not None and row.tablename not in relation_names:
+            continue
+        summaries[row.tablename][row.attname] = Summary(
+            values=list(row.most_common_vals or []),
+            freqs=list(row.most_common_freqs or []),
+            null_frac=float(row.null_frac)
+        )
+    return dict(summaries)
+
+
+def null_frac(dist):
+    """Returns the fraction of nulls of the attribute described by a Histogram or a CPD."""
+    if not hasattr(dist, 'on_hists'):
+        return float(dist.null_frac)
+    return sum(
+        float(b.frequency) * float(h.null_frac)
+        for b, h in zip(dist.by_hist.buckets, dist.on_hists)
+    )
+
+
+def cast(values, bounds):
+    """Converts the values of a Summary to the type of the bounds of an attribute.
+
+    `pg_stats` gives the most common values as text, whereas the bounds of a numeric attribute
+    are numbers. The values which aren't numbers are returned as None.
+    """
+    if bounds.dtype.kind not in 'iuf':
+        return list(values)
+    cast = []
+    for val in values:
+        if isinstance(val, str):
+            try:
+                val = float(val)
+            except ValueError:
+                val = None
+        cast.append(val)
+    return cast
+
+
+def divergence(network, node, summary, frozen=None):
+    """Returns the divergence between the Summary of an attribute and a fitted network.
+
+    A frozen version of the network can be passed to avoid freezing it once per attribute.
+    """
+    frozen = network.freeze() if frozen is None else frozen
+    observed = np.asarray(summary.freqs, dtype=float)
+    values = cast(summary.values, frozen.tables[frozen.index[node]].lefts)
+    # A value which can't be compared with the bounds can't have been fitted
+    known = [i for i, val in enumerate(values) if val is not None]
+    estimated = np.zeros(len(values))
+    estimated[known] = frozen.p_many([{node: values[i]} for i in known])
+    observed_null, estimated_null = summary.null_frac, null_frac(network.nodes[node]['dist'])
+    # The values which are not in the summary are lumped together
+    observed_rest = 1 - observed.sum() - observed_null
+    estimated_rest = 1 - estimated.sum() - estimated_null
+    diff = (
+        np.abs(observed - estimated).sum() +
+        abs(observed_null - estimated_null) +
+        abs(observed_rest - estimated_rest)
+    )
+    return float(diff / 2)
+
+
+def check(network, summaries, threshold=.1):
+    """Returns the divergence of each attribute of a BayesianNetwork which has a Summary.
+
+    `summaries` is either a dict of Summaries or a fresh sample of the relation. The returned
+    DataFrame is indexed by attribute and has a `divergence` and a `drifted` column.
+    """
+    if isinstance(summaries, pd.DataFrame):
+        summaries = summarize(summaries)
+    frozen = network.freeze()
+    rows = [
+        {
+            'attribute': node,
+            'divergence': divergence(network, node, summaries[node], frozen)
+        }
+        for node in frozen.nodes
+        if node in summaries
+    ]
+    report = pd.DataFrame(rows, columns=['attribute', 'divergence']).set_index('attribute')
+    report['drifted'] = report['divergence'] > threshold
+    return report
+
+
+def check_recursive(network, summaries, threshold=.1):
+    """Returns the divergence of each attribute of each relation of a RecursiveBayesianNetwork.
+
+    `summaries` maps the name of a relation to the Summary of each of its attributes, or to a
+    fresh sample of it. The returned DataFrame is indexed by relation and by attribute.
+    """
+    reports = {
+        name: check(network.bns_[name], attributes, threshold)
+        for name, attributes in summaries.items()
+        if name in network.bns_
+    }
+    reports = {name: r for name, r in reports.items() if len(r)}
+    if not reports:
+        index = pd.MultiIndex.from_tuples([], names=['relation', 'attribute'])
+        return pd.DataFrame({'divergence': [], 'drifted': []}, index=index)
+    return pd.concat(reports, names=['relation', 'attribute'])
+
+
+def refit_plan(extensions, drifted):
+    """Returns the relations to refit, in the order in which they have to be fitted.
+
+    Parameters:
+        extensions (dict): Maps each relation to the relations it references, as in the
+            `extensions_` attribute of a RecursiveBayesianNetwork.
+        drifted (iterable): The relations which have drifted.
+
+    """
+
+    dependents = collections.defaultdict(set)
+    for name, related in extensions.items():
+        for other in related:
+            dependents[other].add(name)
+
+    # The dependents of the dependents have to be refitted too
+    stale, queue = set(), list(drifted)
+    while queue:
+        name = queue.pop()
+        if name not in stale:
+            stale.add(name)
+            queue.extend(dependents[name])
+
+    # A relation comes after the relations it references
+    plan = []
+
+    def visit(name):
+        if name in plan:
+            return
+        for other in extensions.get(name, ()):
+            if other in stale:
+                visit(other)
+        plan.append(name)
+
+    for name in sorted(stale):
+        visit(name)
+
+    return plan
@@ -0,0 +1,152 @@
+"""Reading relations from CSV or Parquet files without loading them entirely in memory.
+
+Files are always read in chunks and only the required columns are parsed. Parquet files require
+`pyarrow` to be installed, it is only imported when a Parquet file is read. A directory written by
+`phd.rel.MappedRelation.write` can be used in place of a file.
+
+"""
+import collections
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from . import rel
+
+
+FOREIGN_KEY = re.compile(r'FOREIGN\s+KEY\s*\(\s*(\w+)\s*\)\s*REFERENCES\s+(\w+)\s*\(\s*(\w+)\s*\)',
+                         re.IGNORECASE)
+ALTER_TABLE = re.compile(r'ALTER\s+TABLE\s+(?:ONLY\s+)?(?:\w+\.)?"?(\w+)"?\s+(.*?);',
+                         re.IGNORECASE | re.DOTALL)
+CREATE_TABLE = re.compile(r'CREATE\s+TABLE\s+(?:\w+\.)?"?(\w+)"?\s*\((.*?)\)\s*;',
+                          re.IGNORECASE | re.DOTALL)
+CONSTRAINTS = ('PRIMARY', 'FOREIGN', 'CONSTRAINT', 'UNIQUE', 'CHECK')
+
+
+def read_foreign_keys(path):
+    """Returns the foreign keys of each relation declared in a SQL file.
+
+    Only the `ALTER TABLE x ADD FOREIGN KEY (col) REFERENCES y(id)` statements are taken into
+    account, the rest of the file is ignored.
+    """
+    with open(path) as f:
+        sql = re.sub(r'--[^\n]*', '', f.read())
+
+    foreign_keys = collections.defaultdict(list)
+    for from_rel, clauses in ALTER_TABLE.findall(sql):
+        for from_col, to_rel, to_col in FOREIGN_KEY.findall(clauses):
+            foreign_keys[from_rel].append(rel.ForeignKey(from_rel, from_col, to_rel, to_col))
+
+    return dict(foreign_keys)
+
+
+def read_column_names(path):
+    """Returns the column names of each relation declared in a file of CREATE TABLE statements."""
+    with open(path) as f:
+        sql = re.sub(r'--[^\n]*', '', f.read())
+
+    names = {}
+    for name, body in CREATE_TABLE.findall(sql):
+        definitions = [d.strip() for d in re.split(r',(?![^(]*\))', body) if d.strip()]
+        names[name] = [
+            d.split()[0].strip('"')
+            for d in definitions
+            if d.split()[0].upper() not in CONSTRAINTS
+        ]
+
+    return names
+
+
+def is_parquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def is_mapped(path):
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+def parquet_file(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('pyarrow is required to read Parquet files')
+    return pq.ParquetFile(path)
+
+
+def read_header(path, names=None):
+    """Returns the names of the columns of a file."""
+    if names is not None:
+        return list(names)
+    if is_parquet(path):
+        return list(parquet_file(path).schema_arrow.names)
+    if is_mapped(path):
+        return rel.MappedRelation(path).columns
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_chunks(path, usecols, names=None, chunksize=100000, **kwargs):
+    """Yields DataFrames of at most `chunksize` rows which only contain the `usecols` columns.
+
+    A CSV file is assumed to have a header unless the column `names` are given. The extra keyword
+    arguments are passed to `pandas.read_csv`.
+    """
+    usecols = list(usecols)
+
+    if is_parquet(path):
+        for batch in parquet_file(path).iter_batches(batch_size=chunksize, columns=usecols):
+            yield batch.to_pandas()[usecols]
+        return
+
+    if is_mapped(path):
+        yield from rel.MappedRelation(path, usecols).chunks(chunksize)
+        return
+
+    reader = pd.read_csv(
+        path,
+        header=None if names is not None else 'infer',
+        names=names,
+        usecols=usecols,
+        chunksize=chunksize,
+        **kwargs
+    )
+    for chunk in reader:
+        yield chunk[usecols]
+
+
+def sample(chunks, max_rows, random_state=None):
+    """Returns a uniform sample of at most `max_rows` rows along with the total number of rows.
+
+    The sample is obtained by reservoir sampling: each row is given a random key and only the
+    `max_rows` rows with the lowest keys are kept as the chunks go by, hence memory usage is
+    bounded by the size of the sample plus the size of one chunk. The order of the rows is kept.
+    """
+    from sklearn import utils
+
+    rng = utils.check_random_state(random_state)
+    reservoir, keys = None, np.empty(0)
+    n_rows = 0
+
+    for chunk in chunks:
+        n_rows += len(chunk)
+        chunk = chunk.reset_index(drop=True)
+        chunk.index += n_rows - len(chunk)
+        reservoir = chunk if reservoir is None else pd.concat([reservoir, chunk])
+        keys = np.concatenate([keys, rng.random_sample(len(chunk))])
+        if len(reservoir) > max_rows:
+            keep = np.sort(np.argpartition(keys, max_rows)[:max_rows])
+            reservoir, keys = reservoir.iloc[keep], keys[keep]
+
+    if reservoir is None:
+        return pd.DataFrame(), 0
+
+    return reservoir.reset_index(drop=True), n_rows
+
+
+def read_lookup(chunks, key, col):
+    """Returns a Series which maps each value of `key` to the associated value of `col`."""
+    parts = [chunk.set_index(key)[col] for chunk in chunks]
+    if not parts:
+        return pd.Series(dtype=object)
+    lookup = pd.concat(parts)
+    return lookup[~lookup.index.duplicated()]
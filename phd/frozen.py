@@ -0,0 +1,794 @@
+"""Read-only representations of fitted networks.
+
+A frozen network stores each distribution as a handful of NumPy arrays which are flagged as
+non-writeable. Inference only allocates small scratch arrays for the messages that are passed
+from the leaves to the root, it never modifies the arrays of the model. Hence the `p` and
+`p_many` methods of `FrozenBayesianNetwork` and `FrozenRecursiveBayesianNetwork` can be called
+concurrently from as many threads as needed without any locking nor copying.
+
+Frozen models can be written to a single `.npz` file with `save` and read back with `load`. This
+module only depends on NumPy, hence a worker which only answers queries can load a model without
+importing networkx, pandas nor scikit-learn.
+
+A model can also be published once in shared memory with `share`, after which any number of
+worker processes on the same host can `attach` to it. Each worker then answers queries with
+read-only views of the shared arrays instead of holding its own copy of the model.
+
+Passing `bits` to `save` shrinks the file: the frequencies are quantized on a log scale and the
+numeric bucket bounds are delta-encoded. The bounds are restored exactly, whereas each frequency
+is off by a bounded relative error. `quantize` applies the same compression in memory and
+reports the largest relative error which the rounding can induce on a selectivity. The tables of
+a quantized or a loaded compressed model stay compressed, they are decoded on the fly by the
+queries which visit them.
+
+"""
+import collections
+import functools
+import json
+from multiprocessing import shared_memory
+import operator
+import sys
+import threading
+
+import numpy as np
+
+from . import lookup
+from . import op
+
+
+Table = collections.namedtuple('Table', 'indptr lefts rights freqs cards nulls by_lefts by_rights')
+Table.__doc__ = """The distribution of a node stored in CSR format.
+
+Row `i` of a table corresponds to the `i`-th bucket of the parent, which is delimited by
+`by_lefts[i]` and `by_rights[i]`. The buckets of row `i` are stored in the slice
+`indptr[i]:indptr[i + 1]` of `lefts`, `rights`, `freqs` and `cards`. The root of a network has a
+single row and no parent buckets.
+"""
+
+Link = collections.namedtuple('Link', 'rows cols weights')
+Link.__doc__ = """Maps the parent buckets of a node to the flattened buckets of its parent.
+
+A message over the parent buckets of a node is turned into one multiplier per bucket of the
+parent's table by summing `weights * message[cols]` over `rows`.
+"""
+
+
+def as_array(values):
+    """Converts a list of bounds to a read-only array, avoiding object arrays if possible."""
+    return readonly(lookup.as_array(values))
+
+
+def readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+def table_from_histograms(hists, by_hist=None):
+    """Flattens a list of Histograms, one per parent bucket, into a Table."""
+    buckets = [b for hist in hists for b in hist.buckets]
+    by_buckets = by_hist.buckets if by_hist is not None else []
+    return Table(
+        indptr=readonly(np.cumsum([0] + [len(hist) for hist in hists])),
+        lefts=as_array([b.left for b in buckets]),
+        rights=as_array([b.right for b in buckets]),
+        freqs=readonly(np.array([float(b.frequency) for b in buckets], dtype=float)),
+        cards=readonly(np.array([float(b.cardinality) for b in buckets], dtype=float)),
+        nulls=readonly(np.array([float(hist.null_frac) for hist in hists], dtype=float)),
+        by_lefts=as_array([b.left for b in by_buckets]),
+        by_rights=as_array([b.right for b in by_buckets])
+    )
+
+
+def find_bucket(lefts, rights, val):
+    """Returns the index of the bucket that contains `val`, or -1.
+
+    The lookup follows the same rules as `Histogram.find_bucket`, see `phd.lookup`.
+    """
+    return lookup.Index(lefts, rights).locate_one(val)
+
+
+def link(parent, child):
+    """Returns the Link between the table of a parent and the table of one of its children.
+
+    This mimics `Histogram.__mul__`: a bucket containing a single value is multiplied by the
+    message of the parent bucket which contains the value, whereas a bucket which spans a range
+    is multiplied by the average of the messages of the parent buckets it overlaps.
+    """
+    rows, cols, weights = [], [], []
+    by_lefts, by_rights = child.by_lefts, child.by_rights
+    points, _ = lookup.Index(by_lefts, by_rights).locate(parent.lefts[parent.cards == 1])
+    points = iter(points.tolist())
+
+    for i, (left, right, card) in enumerate(zip(parent.lefts, parent.rights, parent.cards)):
+        if card == 1:
+            hits = [next(points)]
+            hits = hits if hits[0] >= 0 else []
+        else:
+            hits = np.flatnonzero((by_rights >= left) & (by_lefts <= right))
+        if len(hits):
+            rows.extend([i] * len(hits))
+            cols.extend(hits)
+            weights.extend([1. / len(hits)] * len(hits))
+
+    return Link(
+        rows=readonly(np.array(rows, dtype=np.intp)),
+        cols=readonly(np.array(cols, dtype=np.intp)),
+        weights=readonly(np.array(weights, dtype=float))
+    )
+
+
+def reduce_rows(table, values, condition):
+    """Sums `values` per row, or picks the bucket of each row that contains `condition`.
+
+    The buckets of all the rows are scanned in a single masked pass. Within a row, a bucket that
+    only holds `condition` takes precedence over an equi-height bucket whose range contains it.
+    A `phd.op.Predicate` or a collection of values raises a ValueError.
+    """
+    n_rows = len(table.indptr) - 1
+    rows = np.repeat(np.arange(n_rows), np.diff(table.indptr))
+
+    if condition is None:
+        return np.bincount(rows, weights=values, minlength=n_rows)
+
+    if isinstance(condition, (op.Predicate, list, tuple, set, dict, np.ndarray)):
+        raise ValueError(
+            f'frozen networks only support equality conditions, got {condition!r}, '
+            'use BayesianNetwork.p for predicates'
+        )
+
+    message = np.zeros(n_rows)
+    if not len(table.lefts):
+        return message
+    bound = lookup.comparable([condition], table.lefts)[0]
+    hits = np.flatnonzero((table.lefts <= bound) & (bound <= table.rights))
+    if not len(hits):
+        return message
+
+    is_range = (table.lefts[hits] != table.rights[hits]).astype(bool)
+    hits = hits[np.lexsort((is_range, rows[hits]))]
+    _, first = np.unique(rows[hits], return_index=True)
+    hits = hits[first]
+    message[rows[hits]] = values[hits] / table.cards[hits]
+    return message
+
+
+class FrozenBayesianNetwork():
+    """An immutable and thread-safe version of a fitted BayesianNetwork.
+
+    The nodes are stored in topological order, hence the root is always the first node.
+
+    """
+
+    def __init__(self, nodes, parents, tables, links):
+        self.nodes = tuple(nodes)
+        self.parents = tuple(parents)
+        self.tables = tuple(tables)
+        self.links = tuple(links)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        children = [[] for _ in self.nodes]
+        for i, parent in enumerate(self.parents):
+            if parent >= 0:
+                children[parent].append(i)
+        self.children = tuple(tuple(c) for c in children)
+
+    @classmethod
+    def from_network(cls, network):
+        """Freezes a fitted BayesianNetwork."""
+
+        if network.number_of_nodes() == 0:
+            return cls([], [], [], [])
+
+        root = network.root
+        nodes, parents = [root], [-1]
+        for i, node in enumerate(nodes):
+            for child in network.successors(node):
+                nodes.append(child)
+                parents.append(i)
+
+        root_hist = network.nodes[root]['dist']
+        tables = [table_from_histograms([root_hist])]
+        for node in nodes[1:]:
+            cpd = network.nodes[node]['dist']
+            tables.append(table_from_histograms(cpd.on_hists, cpd.by_hist))
+
+        links = [None] + [link(tables[parent], tables[i]) for i, parent in enumerate(parents) if i]
+
+        return cls(nodes, parents, tables, links)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def steiner_nodes(self, nodes):
+        """Returns a mask indicating the minimal part of the tree that contains a set of nodes."""
+        mask = [False] * len(self.nodes)
+        for node in nodes:
+            i = self.index.get(node, -1)
+            while i >= 0 and not mask[i]:
+                mask[i] = True
+                i = self.parents[i]
+        return mask
+
+    def infer(self, query, mask=None):
+        """Returns the estimated selectivity of a query.
+
+        The computation follows the one of `BayesianNetwork.infer`, except that the messages are
+        stored in freshly allocated arrays.
+        """
+
+        if mask is None:
+            mask = self.steiner_nodes(query.keys())
+        if not any(mask):
+            return 1.
+
+        messages = {}
+
+        for i in reversed(range(len(self.nodes))):
+
+            if not mask[i]:
+                continue
+
+            table = self.tables[i]
+            values = table.freqs
+
+            for child in self.children[i]:
+                if not mask[child]:
+                    continue
+                lnk = self.links[child]
+                multipliers = np.bincount(
+                    lnk.rows,
+                    weights=lnk.weights * messages.pop(child)[lnk.cols],
+                    minlength=len(values)
+                )
+                values = values * multipliers
+
+            messages[i] = reduce_rows(table, values, query.get(self.nodes[i]))
+
+        return float(messages[0][0])
+
+    def p(self, **query):
+        """Returns the estimated selectivity of a conjunctive query."""
+        return self.infer(query)
+
+    def p_many(self, queries):
+        """Returns the estimated selectivity of each query in a list of queries."""
+        masks = {}
+        estimates = []
+        for query in queries:
+            attributes = frozenset(query.keys())
+            if attributes not in masks:
+                masks[attributes] = self.steiner_nodes(attributes)
+            estimates.append(self.infer(query, mask=masks[attributes]))
+        return estimates
+
+    def to_arrays(self, prefix=''):
+        """Returns a dict of arrays from which the network can be rebuilt with `from_arrays`."""
+        arrays = {
+            f'{prefix}nodes': np.array(self.nodes, dtype=str),
+            f'{prefix}parents': np.array(self.parents, dtype=np.intp)
+        }
+        for i, table in enumerate(self.tables):
+            for field, arr in table._asdict().items():
+                arrays[f'{prefix}table.{i}.{field}'] = arr
+        for i, lnk in enumerate(self.links):
+            if lnk is not None:
+                for field, arr in lnk._asdict().items():
+                    arrays[f'{prefix}link.{i}.{field}'] = arr
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix=''):
+        """Rebuilds a network from the output of `to_arrays`."""
+        nodes = arrays[f'{prefix}nodes'].tolist()
+        parents = arrays[f'{prefix}parents'].tolist()
+        tables = []
+        for i in range(len(nodes)):
+            key = f'{prefix}table.{i}.'
+            if f'{key}freqs:codes' in arrays:
+                tables.append(CompressedTable(
+                    {k[len(key):]: readonly(arr) for k, arr in arrays.items() if k.startswith(key)},
+                    bits=int(arrays['bits'])
+                ))
+            else:
+                tables.append(Table(**{f: readonly(arrays[f'{key}{f}']) for f in Table._fields}))
+        links = [None] * min(len(nodes), 1) + [
+            Link(**{f: readonly(arrays[f'{prefix}link.{i}.{f}']) for f in Link._fields})
+            for i in range(1, len(nodes))
+        ]
+        return cls(nodes, parents, tables, links)
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the arrays of the tables and of the links."""
+        return sum(
+            table.nbytes if isinstance(table, CompressedTable) else sum(a.nbytes for a in table)
+            for table in self.tables
+        ) + sum(sum(a.nbytes for a in lnk) for lnk in self.links if lnk is not None)
+
+    def rename(self, prefix):
+        """Returns a copy where each node name is prefixed with `prefix` and a dot."""
+        return FrozenBayesianNetwork(
+            nodes=[f'{prefix}.{node}' for node in self.nodes],
+            parents=self.parents,
+            tables=self.tables,
+            links=self.links
+        )
+
+    def graft(self, other):
+        """Hangs the children of the root of `other` under the node with the same name.
+
+        The arrays are shared with `self` and `other`, only the links of the grafted children
+        are computed.
+        """
+        at = self.index[other.nodes[0]]
+        offset = len(self.nodes) - 1
+
+        parents = list(self.parents)
+        links = list(self.links)
+        for i in range(1, len(other.nodes)):
+            parent = other.parents[i]
+            if parent == 0:
+                parents.append(at)
+                links.append(link(self.tables[at], other.tables[i]))
+            else:
+                parents.append(parent + offset)
+                links.append(other.links[i])
+
+        return FrozenBayesianNetwork(
+            nodes=self.nodes + other.nodes[1:],
+            parents=parents,
+            tables=self.tables + other.tables[1:],
+            links=links
+        )
+
+
+class FrozenRecursiveBayesianNetwork():
+    """An immutable and thread-safe version of a fitted RecursiveBayesianNetwork.
+
+    The linked networks of each set of relations are computed once, upon the first query on that
+    set, and kept in `linked` along with their `aliases`. Two threads which query a new set at
+    the same time may both link it, in which case one of the identical results is kept.
+    """
+
+    def __init__(self, bns, extensions):
+        self.bns = dict(bns)
+        self.extensions = {name: tuple(related) for name, related in extensions.items()}
+        self.linked = {}
+
+    @classmethod
+    def from_network(cls, network):
+        """Freezes a fitted RecursiveBayesianNetwork."""
+        return cls(
+            bns={name: FrozenBayesianNetwork.from_network(bn) for name, bn in network.bns_.items()},
+            extensions=network.extensions_
+        )
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the arrays of the networks."""
+        return sum(bn.nbytes for bn in self.bns.values())
+
+    def to_arrays(self):
+        """Returns a dict of arrays from which the network can be rebuilt with `from_arrays`."""
+        arrays = {'relations': np.array(list(self.bns), dtype=str)}
+        for name, bn in self.bns.items():
+            arrays.update(bn.to_arrays(prefix=f'bn.{name}.'))
+            arrays[f'extensions.{name}'] = np.array(self.extensions.get(name, ()), dtype=str)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuilds a network from the output of `to_arrays`."""
+        names = arrays['relations'].tolist()
+        return cls(
+            bns={
+                name: FrozenBayesianNetwork.from_arrays(arrays, prefix=f'bn.{name}.')
+                for name in names
+            },
+            extensions={
+                name: arrays[f'extensions.{name}'].tolist()
+                for name in names
+                if len(arrays[f'extensions.{name}'])
+            }
+        )
+
+    def link(self, relation_names):
+        """Returns the linked networks that cover a set of relations."""
+        return [bn for bn, _ in self._link(relation_names)]
+
+    def _link(self, relation_names):
+        """Returns the linked networks of a set of relations along with the `aliases` of each."""
+        key = frozenset(relation_names)
+        linked = self.linked.get(key)
+        if linked is None:
+            linked = tuple(
+                (bn, aliases(host, bn)) for host, bn in self._graft(relation_names).items()
+            )
+            self.linked[key] = linked
+        return linked
+
+    def _graft(self, relation_names):
+        """Returns the linked networks keyed by the relation whose network they extend."""
+
+        relation_names = set(relation_names)
+        bns = {name: bn for name, bn in self.bns.items() if name in relation_names}
+
+        extensions = {
+            name: [r for r in related if r in relation_names]
+            for name, related in self.extensions.items()
+            if name in relation_names
+        }
+        extensions = {name: related for name, related in extensions.items() if related}
+
+        while extensions:
+            for name in set(extensions.keys()):
+                related = extensions[name]
+                if any(extensions.get(r) for r in related):
+                    continue
+                for other in related:
+                    # A relation referenced by several relations is only grafted once
+                    if other in bns:
+                        bns[name] = bns[name].graft(bns.pop(other).rename(other))
+                extensions.pop(name)
+
+        return bns
+
+    def localize(self, relation_names, query):
+        """Returns each linked network along with the conditions of a query on its nodes.
+
+        The attributes are resolved as in `RecursiveBayesianNetwork.localize`.
+        """
+        return [(bn, resolve(names, query)) for bn, names in self._link(relation_names)]
+
+    def p(self, relation_names, **query):
+        """Returns the estimated selectivity of a query over a set of relations."""
+        query = {k.replace('__', '.'): v for k, v in query.items()}
+        return functools.reduce(
+            operator.mul,
+            (bn.p(**q) for bn, q in self.localize(relation_names, query)),
+            1
+        )
+
+    def p_many(self, relation_names, queries):
+        """Returns the estimated selectivity of each query over the same set of relations."""
+        queries = [{k.replace('__', '.'): v for k, v in query.items()} for query in queries]
+        estimates = [1.] * len(queries)
+        for bn, names in self._link(relation_names):
+            for i, p in enumerate(bn.p_many([resolve(names, q) for q in queries])):
+                estimates[i] *= p
+        return estimates
+
+
+def aliases(host, network):
+    """Maps the names under which the nodes of a linked network can be queried to the nodes.
+
+    A node is named after itself, after the relation the network was fitted on followed by
+    itself, and after each of its suffixes that starts with the name of a grafted relation, i.e.
+    `title.kind_type.kind` is also `kind_type.kind`. The network is either a BayesianNetwork or a
+    FrozenBayesianNetwork.
+    """
+    names = collections.defaultdict(list)
+    for node in network.nodes:
+        names[node].append(node)
+        names[f'{host}.{node}'].append(node)
+        parts = node.split('.')
+        for i in range(1, len(parts) - 1):
+            names['.'.join(parts[i:])].append(node)
+    return {name: list(dict.fromkeys(nodes)) for name, nodes in names.items()}
+
+
+def resolve(names, query):
+    """Returns the conditions of a query on the nodes given by `aliases`."""
+    return {node: v for k, v in query.items() for node in names.get(k, ())}
+
+
+def quantize_freqs(freqs, bits):
+    """Maps frequencies to unsigned integer codes spread evenly over a log scale.
+
+    Code 0 stands for a frequency of 0, the other codes cover the range between the logarithms of
+    the smallest and of the largest positive frequency, which are returned along with the codes.
+    """
+    codes = np.zeros(len(freqs), dtype=np.min_scalar_type(2 ** bits - 1))
+    positive = freqs > 0
+    if not positive.any():
+        return codes, np.zeros(2)
+    logs = np.log(freqs[positive])
+    scale = np.array([logs.min(), logs.max()])
+    step = (scale[1] - scale[0]) / (2 ** bits - 2)
+    codes[positive] = 1 + np.rint((logs - scale[0]) / (step or 1.))
+    return codes, scale
+
+
+def dequantize_freqs(codes, scale, bits):
+    """Inverts `quantize_freqs`, up to the rounding of each frequency to the nearest code."""
+    step = (scale[1] - scale[0]) / (2 ** bits - 2)
+    freqs = np.exp(scale[0] + (codes.astype(float) - 1) * step)
+    freqs[codes == 0] = 0.
+    return freqs
+
+
+def is_integral(arr):
+    """Returns whether an array of bounds only holds integers which a float64 represents exactly."""
+    if arr.dtype.kind in 'iu':
+        return True
+    if arr.dtype.kind != 'f' or not np.isfinite(arr).all():
+        return False
+    return bool((arr == np.rint(arr)).all() and (np.abs(arr) <= 2 ** 53).all())
+
+
+def narrow(deltas):
+    """Casts integers to the smallest dtype which holds all of them."""
+    if not len(deltas):
+        return deltas.astype(np.int8)
+    return deltas.astype(np.result_type(
+        np.min_scalar_type(deltas.min()),
+        np.min_scalar_type(deltas.max())
+    ))
+
+
+BOUNDS = {'lefts': None, 'rights': 'lefts', 'by_lefts': None, 'by_rights': 'by_lefts'}
+ENCODED = set(BOUNDS) | {'cards'}
+
+
+def compress(arrays, bits):
+    """Quantizes the frequencies and delta-encodes the bounds of the output of `to_arrays`.
+
+    The frequencies of each table are replaced by codes of `bits` bits, see `quantize_freqs`. Left
+    bounds which are integers are stored as the differences between consecutive bounds, and right
+    bounds as their differences with the left bounds, which are mostly 0. The cardinalities are
+    integers too. All of them are cast to the smallest integer dtype that holds them, the other
+    bounds, such as strings, are left untouched.
+
+    Returns the compressed arrays along with the largest relative error of a selectivity. Each
+    term of a selectivity is a product of at most one frequency per table, hence the error is the
+    product of the largest relative errors of the tables, minus 1.
+    """
+
+    if not 2 <= bits <= 32:
+        raise ValueError(f'bits should be between 2 and 32, got {bits}')
+
+    compressed = {'bits': np.array(bits)}
+    growth = 1.
+
+    for key, arr in arrays.items():
+        field = key.rsplit('.', 1)[-1]
+
+        if '.table.' in f'.{key}' and field == 'freqs':
+            codes, scale = quantize_freqs(arr, bits)
+            compressed[f'{key}:codes'] = codes
+            compressed[f'{key}:scale'] = scale
+            positive = arr > 0
+            if positive.any():
+                rounded = dequantize_freqs(codes, scale, bits)
+                growth *= 1 + np.abs(rounded[positive] / arr[positive] - 1).max()
+
+        elif '.table.' in f'.{key}' and field in ENCODED and len(arr) and is_integral(arr):
+            values = arr.astype(np.int64)
+            lefts = BOUNDS.get(field) and arrays[f'{key[:-len(field)]}{BOUNDS[field]}']
+            if field == 'cards':
+                compressed[f'{key}:ints'] = narrow(values)
+            elif lefts is not None and is_integral(lefts):
+                compressed[f'{key}:widths'] = narrow(values - lefts.astype(np.int64))
+            else:
+                compressed[f'{key}:deltas'] = narrow(np.diff(values, prepend=0))
+            compressed[f'{key}:dtype'] = np.array(arr.dtype.str)
+
+        else:
+            compressed[key] = arr
+
+    return compressed, growth - 1.
+
+
+class CompressedTable():
+    """A Table whose arrays stay compressed in memory, see `compress`.
+
+    The fields of a Table are decoded each time they are accessed, hence only the codes and the
+    encoded bounds are held in memory. This trades some time per query for the memory of the
+    model, which lets many more models be kept resident.
+    """
+
+    def __init__(self, arrays, bits):
+        self.arrays = arrays
+        self.bits = bits
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the compressed arrays."""
+        return sum(arr.nbytes for arr in self.arrays.values())
+
+    def decode(self, field):
+        """Returns the array of a field of a Table."""
+        arrays = self.arrays
+        if field in arrays:
+            return arrays[field]
+        if f'{field}:codes' in arrays:
+            freqs = dequantize_freqs(arrays[f'{field}:codes'], arrays[f'{field}:scale'], self.bits)
+            return readonly(freqs)
+        if f'{field}:ints' in arrays:
+            values = arrays[f'{field}:ints']
+        elif f'{field}:deltas' in arrays:
+            values = np.cumsum(arrays[f'{field}:deltas'], dtype=np.int64)
+        else:
+            values = arrays[f'{field}:widths'] + self.decode(BOUNDS[field]).astype(np.int64)
+        return readonly(values.astype(str(arrays[f'{field}:dtype'])))
+
+    def _asdict(self):
+        return {field: self.decode(field) for field in Table._fields}
+
+    def __iter__(self):
+        return iter(self._asdict().values())
+
+    indptr = property(lambda self: self.decode('indptr'))
+    lefts = property(lambda self: self.decode('lefts'))
+    rights = property(lambda self: self.decode('rights'))
+    freqs = property(lambda self: self.decode('freqs'))
+    cards = property(lambda self: self.decode('cards'))
+    nulls = property(lambda self: self.decode('nulls'))
+    by_lefts = property(lambda self: self.decode('by_lefts'))
+    by_rights = property(lambda self: self.decode('by_rights'))
+
+
+def quantize(model, bits=16):
+    """Returns a copy of a frozen network whose frequencies are rounded as `save` stores them.
+
+    A fitted BayesianNetwork or RecursiveBayesianNetwork is frozen first. The tables of the copy
+    are CompressedTables, hence it takes less memory than `model` but each query decodes the
+    tables it visits. The second value is the largest relative error which the rounding induces
+    on the selectivity of any query, with respect to the estimates of `model`. It shrinks by
+    half with each extra bit.
+    """
+    if hasattr(model, 'freeze'):
+        model = model.freeze()
+    arrays, error = compress(model.to_arrays(), bits)
+    return type(model).from_arrays(arrays), error
+
+
+KINDS = {
+    'FrozenBayesianNetwork': FrozenBayesianNetwork,
+    'FrozenRecursiveBayesianNetwork': FrozenRecursiveBayesianNetwork
+}
+ALIGNMENT = 64
+ATTACH_LOCK = threading.Lock()
+
+
+def save(model, path, bits=None):
+    """Writes a frozen network to an `.npz` file.
+
+    The bounds of attributes which are neither all strings nor all numbers are stored as object
+    arrays, which are pickled by NumPy.
+
+    When `bits` is given, the arrays are compressed, see `compress`, and the largest relative error
+    of a selectivity is returned. `load` then yields the same model as `quantize`, whose tables
+    stay compressed in memory.
+    """
+    arrays, error = model.to_arrays(), None
+    if bits is not None:
+        arrays, error = compress(arrays, bits)
+    arrays['kind'] = np.array(type(model).__name__)
+    (np.savez if bits is None else np.savez_compressed)(path, **arrays)
+    return error
+
+
+def load(path, allow_pickle=False):
+    """Reads a frozen network written by `save`.
+
+    `allow_pickle` has to be set to True for models with object arrays, it should only be done for
+    files that come from a trusted source.
+    """
+    with np.load(path, allow_pickle=allow_pickle) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    return KINDS[str(arrays.pop('kind'))].from_arrays(arrays)
+
+
+class SharedModel():
+    """A frozen network whose arrays live in a block of shared memory.
+
+    The process which calls `share` owns the block and should call `unlink` once the workers are
+    done with it. Every process, the owner included, should call `close` once it doesn't need
+    `model` anymore. Both can be done by using the object as a context manager.
+    """
+
+    def __init__(self, shm, model, owner):
+        self.shm = shm
+        self.model = model
+        self.owner = owner
+
+    @property
+    def name(self):
+        """The name which workers have to pass to `attach`."""
+        return self.shm.name
+
+    def close(self):
+        # The views of the model have to be released before the block is closed
+        self.model = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+
+def share(model, name=None):
+    """Copies the arrays of a frozen network into a new block of shared memory.
+
+    The block starts with the length of a JSON header, followed by the header which gives the
+    dtype, the shape and the offset of each array, followed by the arrays themselves. Object
+    arrays can't be shared, the bounds of each attribute have to be either all strings or all
+    numbers.
+    """
+
+    arrays = model.to_arrays()
+    layout, offset = {}, 0
+    for key, arr in arrays.items():
+        if arr.dtype.hasobject:
+            raise ValueError(f"'{key}' is an object array, which can't be shared")
+        layout[key] = (arr.dtype.str, arr.shape, offset)
+        offset += -(-arr.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({'kind': type(model).__name__, 'arrays': layout}).encode()
+    start = -(-(8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(start + offset, 1))
+    shm.buf[:8] = len(header).to_bytes(8, 'little')
+    shm.buf[8:8 + len(header)] = header
+    for key, arr in arrays.items():
+        dtype, shape, offset = layout[key]
+        view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start + offset)
+        view[...] = arr
+
+    return SharedModel(shm, model_from_buffer(shm.buf), owner=True)
+
+
+class UntrackedBlock():
+    """Stands for the resource tracker while a block is attached, only that block is skipped.
+
+    The other blocks, which might be created by other threads in the meantime, are registered as
+    usual.
+    """
+
+    def __init__(self, tracker, name):
+        self.tracker = tracker
+        self.name = name.lstrip('/')
+
+    def register(self, name, rtype):
+        if name.lstrip('/') != self.name:
+            self.tracker.register(name, rtype)
+
+    def __getattr__(self, attr):
+        return getattr(self.tracker, attr)
+
+
+def attach(name):
+    """Returns a SharedModel which answers queries with the arrays published by `share`."""
+
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        # Before Python 3.13, attaching registers the block with the resource tracker, which then
+        # destroys it when the worker exits, hence the registration of this block is skipped
+        with ATTACH_LOCK:
+            tracker = shared_memory.resource_tracker
+            shared_memory.resource_tracker = UntrackedBlock(tracker, name)
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                shared_memory.resource_tracker = tracker
+
+    return SharedModel(shm, model_from_buffer(shm.buf), owner=False)
+
+
+def model_from_buffer(buf):
+    """Rebuilds a frozen network from read-only views of a buffer filled by `share`."""
+    size = int.from_bytes(buf[:8], 'little')
+    header = json.loads(bytes(buf[8:8 + size]))
+    start = -(-(8 + size) // ALIGNMENT) * ALIGNMENT
+    arrays = {
+        key: readonly(np.ndarray(shape, dtype=dtype, buffer=buf, offset=start + offset))
+        for key, (dtype, shape, offset) in header['arrays'].items()
+    }
+    return KINDS[header['kind']].from_arrays(arrays)
@@ -1,10 +1,12 @@
-import bisect
 import collections
 import copy
 import decimal
 
+import numpy as np
+
 from . import bucket
-from . import null
+from . import lookup
+from . import op
 
 
 class Histogram():
@@ -15,6 +17,23 @@ class Histogram():
         self.buckets = []
         self.null_frac = decimal.Decimal(0)
 
+    @property
+    def buckets(self):
+        return self._buckets
+
+    @buckets.setter
+    def buckets(self, buckets):
+        self._buckets = buckets
+        self._index = None
+
+    @property
+    def index(self):
+        """Returns the sorted boundary arrays used to locate values, built on first use."""
+        if self._index is None:
+            self._index = lookup.Index([b.left for b in self.buckets],
+                                       [b.right for b in self.buckets])
+        return self._index
+
     def __copy__(self):
         hist = Histogram(self.m, self.n)
         hist.buckets = [copy.copy(b) for b in self.buckets]
@@ -39,14 +58,8 @@ class Histogram():
 
         hist = copy.copy(self)
 
-        for i, bucket in enumerate(hist.buckets):
-            if bucket.cardinality == 1:
-                p = other.p(bucket.left)
-            else:
-                _, buckets = other.find_buckets(bucket.left, bucket.right)
-                p = sum(b.frequency for b in buckets) / len(buckets)
-
-            hist.buckets[i].frequency *= p
+        for buck, multiplier in zip(hist.buckets, other.multipliers(hist.buckets)):
+            buck.frequency *= multiplier
 
         # TODO: what should we do with Nones?
 
@@ -65,14 +78,10 @@ class Histogram():
         if not values:
             raise ValueError('values is an empty sequence')
 
-        # Count the occurences of each value
-        counter = collections.Counter(values)
-
-        # Store the number of null values
-        try:
-            self.null_frac = decimal.Decimal(counter.pop(null.Null()))
-        except KeyError:
-            pass
+        # Count the occurences of each value, apart from the null values
+        nulls = lookup.null_mask(values)
+        counter = collections.Counter(v for v, is_null in zip(values, nulls) if not is_null)
+        self.null_frac = decimal.Decimal(int(nulls.sum()))
 
         # Store the m most frequent values
         self.buckets = []
@@ -105,11 +114,34 @@ class Histogram():
             self[i].frequency /= total
         self.null_frac /= total
 
-        # Sort the buckets so that binary search can be applied
-        self.buckets.sort(key=lambda x: x.left)
+        # Sort the buckets, which also resets the lookup index
+        self.buckets = sorted(self.buckets, key=lambda x: x.left)
 
         return self
 
+    def multipliers(self, buckets):
+        """Returns the factors by which buckets are scaled when multiplied by the Histogram.
+
+        A bucket containing a single value is scaled by the probability of the value, whereas a
+        bucket which spans a range is scaled by the average frequency of the buckets it overlaps.
+        The single values are all located in one call.
+        """
+        points = [i for i, b in enumerate(buckets) if b.cardinality == 1]
+        indexes, _ = self.index.locate([buckets[i].left for i in points])
+
+        multipliers = [0] * len(buckets)
+        for i, j in zip(points, indexes.tolist()):
+            if j >= 0:
+                multipliers[i] = self[j].frequency / self[j].cardinality
+
+        for i, buck in enumerate(buckets):
+            if buck.cardinality > 1:
+                _, overlap = self.find_buckets(buck.left, buck.right)
+                if overlap:
+                    multipliers[i] = sum(b.frequency for b in overlap) / len(overlap)
+
+        return multipliers
+
     def find_buckets(self, left, right):
         """Returns the buckets that contain at least one value in [left, right]."""
         indexes = []
@@ -121,20 +153,35 @@ class Histogram():
         return indexes, buckets
 
     def find_bucket(self, val):
-        """Returns the bucket that contains val using binary search."""
-        if val < self[0] or val > self[-1]:
-            return -1, None
+        """Returns the bucket that contains val using binary search.
 
-        i = bisect.bisect_left(self, val)
-
-        if val < self[i] or val > self[i]:
+        A most common value is found in its own bucket even if it lies within the bounds of an
+        equi-height bucket.
+        """
+        i = self.index.locate_one(val)
+        if i < 0:
             return -1, None
-
         return i, self[i]
 
+    def lookup(self, values):
+        """Returns the index of the bucket of each value along with P(value), in one pass.
+
+        The index is -1 for the values which are null or which are not in any bucket. The
+        probability of a null value (None, NaN or Null) is the null fraction.
+        """
+        indexes, nulls = self.index.locate(values)
+        probas = np.array([float(b.frequency / b.cardinality) for b in self.buckets] + [0.])
+        probas = probas[indexes]
+        probas[nulls] = float(self.null_frac)
+        return indexes, probas
+
     def p(self, val):
-        """Returns P(val)."""
-        if val is None:
+        """Returns P(val), where val is either a value or a `phd.op.Predicate`."""
+        if isinstance(val, op.Predicate):
+            weights, null = val.weights(self)
+            frequencies = np.array([float(b.frequency) for b in self.buckets])
+            return decimal.Decimal(float(frequencies @ weights) + float(self.null_frac) * null)
+        if lookup.is_null(val):
             return self.null_frac
 
         _, buck = self.find_bucket(val)
@@ -0,0 +1,142 @@
+"""Vectorized lookup of the buckets which contain given values.
+
+The buckets of a histogram are made of most common values, which hold a single value, and of
+equi-height buckets, which span disjoint ranges. A most common value may lie within the range of
+an equi-height bucket. A value is therefore located in the bucket that holds only this value if
+there is one, and otherwise in the equi-height bucket whose range contains it. Each kind of bucket
+is kept in its own sorted boundary array, so that many values can be located with two calls to
+`np.searchsorted`.
+
+Missing values are represented with a boolean mask rather than with a sentinel. None, NaN and
+`null.Null` are all considered missing.
+
+This module only depends on NumPy.
+
+"""
+import bisect
+import decimal
+import numbers
+
+import numpy as np
+
+from . import null
+
+
+def is_null(val):
+    """Determines if a value is missing."""
+    return val is None or isinstance(val, null.Null) or (isinstance(val, float) and val != val)
+
+
+def null_mask(values):
+    """Returns a boolean array indicating which values are missing."""
+    return np.fromiter((is_null(v) for v in values), dtype=bool, count=len(values))
+
+
+def as_array(values):
+    """Converts a list of bounds to an array, avoiding object arrays if possible."""
+    if values and all(isinstance(v, str) for v in values):
+        return np.array(values, dtype=str)
+    if all(isinstance(v, numbers.Number) and not isinstance(v, decimal.Decimal) for v in values):
+        return np.array(values, dtype=float if not values else None)
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def comparable(values, bounds):
+    """Converts values to an array which can be compared with an array of bounds."""
+    if bounds.dtype == object:
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = values
+        return arr
+    arr = as_array(list(values))
+    if len(arr) and len(bounds) and (arr.dtype.kind == 'U') != (bounds.dtype.kind == 'U'):
+        raise TypeError(f'cannot compare values of type {arr.dtype} with bounds of type '
+                        f'{bounds.dtype}')
+    return arr
+
+
+def widen(bounds, values):
+    """Casts string bounds so that `np.searchsorted` doesn't truncate longer values."""
+    if bounds.dtype.kind == 'U' and values.dtype.itemsize > bounds.dtype.itemsize:
+        return bounds.astype(values.dtype)
+    return bounds
+
+
+class Index():
+    """Locates values among buckets thanks to sorted boundary arrays.
+
+    Parameters:
+        lefts (list or numpy.ndarray): The left bound of each bucket.
+        rights (list or numpy.ndarray): The right bound of each bucket.
+
+    """
+
+    def __init__(self, lefts, rights):
+        lefts = lefts if isinstance(lefts, np.ndarray) else as_array(list(lefts))
+        rights = rights if isinstance(rights, np.ndarray) else as_array(list(rights))
+        ids = np.arange(len(lefts))
+        points = (lefts == rights).astype(bool) if len(lefts) else np.zeros(0, dtype=bool)
+
+        order = np.argsort(lefts[points], kind='stable')
+        self.points = lefts[points][order]
+        self.point_ids = ids[points][order]
+
+        order = np.argsort(lefts[~points], kind='stable')
+        self.range_lefts = lefts[~points][order]
+        self.range_rights = rights[~points][order]
+        self.range_ids = ids[~points][order]
+
+        # Plain lists are faster than arrays when locating a single value with bisect
+        self._points = self.points.tolist()
+        self._range_rights = self.range_rights.tolist()
+
+    def __len__(self):
+        return len(self.points) + len(self.range_lefts)
+
+    def locate(self, values):
+        """Returns the index of the bucket of each value along with a mask of missing values.
+
+        The index is -1 for the values which are missing or which are not in any bucket.
+        """
+
+        nulls = null_mask(values)
+        indexes = np.full(len(values), -1, dtype=np.intp)
+        if nulls.all() or not len(self):
+            return indexes, nulls
+
+        present = np.flatnonzero(~nulls)
+        vals = comparable([values[i] for i in present], self.points if len(self.points) else
+                          self.range_lefts)
+        found = np.full(len(vals), -1, dtype=np.intp)
+
+        if len(self.range_lefts):
+            pos = np.searchsorted(widen(self.range_rights, vals), vals, side='left')
+            ok = pos < len(self.range_rights)
+            ok[ok] = self.range_lefts[pos[ok]] <= vals[ok]
+            found[ok] = self.range_ids[pos[ok]]
+
+        if len(self.points):
+            pos = np.searchsorted(widen(self.points, vals), vals, side='left')
+            ok = pos < len(self.points)
+            ok[ok] = self.points[pos[ok]] == vals[ok]
+            found[ok] = self.point_ids[pos[ok]]
+
+        indexes[present] = found
+        return indexes, nulls
+
+    def locate_one(self, val):
+        """Returns the index of the bucket of a single value, or -1."""
+
+        if is_null(val):
+            return -1
+
+        i = bisect.bisect_left(self._points, val)
+        if i < len(self._points) and self._points[i] == val:
+            return int(self.point_ids[i])
+
+        i = bisect.bisect_left(self._range_rights, val)
+        if i < len(self._range_rights) and self.range_lefts[i] <= val:
+            return int(self.range_ids[i])
+
+        return -1
@@ -1 +1,231 @@
+"""Predicates which go beyond an equality between an attribute and a value.
+
+The condition of an attribute in a query is either a value, which the attribute has to be equal
+to, or a Predicate. A Predicate is evaluated against a Histogram in one pass over its buckets:
+`weights` returns the fraction of the values of each bucket which satisfy it, along with whether
+the nulls do. For instance, `kind=In(['movie', 'episode'])` and `kind=Or('movie', 'episode')`
+locate both values at once instead of requiring one inference per value.
+
+Disjunctions across attributes are written as an `Or` of queries, which are dicts that map
+attributes to conditions, such as `Or({'kind': 'movie'}, {'note': 'USA'})`. They are passed to
+`BayesianNetwork.p` as positional arguments, which are combined with each other and with the
+keyword arguments by a conjunction. `terms` expands them into a signed sum of conjunctive
+queries, which the networks answer in a batch.
+
+"""
 import abc
+import itertools
+
+import numpy as np
+
+
+class Predicate(abc.ABC):
+    """A condition on a single attribute."""
+
+    def __init__(self, *args):
+        self.args = args
+
+    @abc.abstractmethod
+    def weights(self, hist):
+        """Returns the fraction of each bucket of a Histogram which satisfies the predicate.
+
+        The second value is the fraction of the nulls which satisfy it, which is 0 or 1.
+        """
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.args == other.args
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.args))
+
+    def __repr__(self):
+        return f'{type(self).__name__}{self.args!r}'
+
+
+class In(Predicate):
+    """The attribute is equal to one of several values, which is `IN (...)` in SQL."""
+
+    def __init__(self, values):
+        super().__init__(tuple(dict.fromkeys(values)))
+
+    @property
+    def values(self):
+        return self.args[0]
+
+    def weights(self, hist):
+        indexes, nulls = hist.index.locate(list(self.values))
+        # Each value accounts for one of the distinct values of its bucket
+        counts = np.bincount(indexes[indexes >= 0], minlength=len(hist)).astype(float)
+        cardinalities = np.array([float(b.cardinality) for b in hist.buckets])
+        weights = np.divide(counts, cardinalities, out=np.zeros(len(hist)),
+                            where=cardinalities > 0)
+        return np.minimum(weights, 1.), float(nulls.any())
+
+
+class Not(Predicate):
+    """The rows which don't satisfy a condition, including those for which the attribute is null.
+
+    Unlike a SQL `NOT`, the nulls satisfy the negation of a condition which they don't satisfy,
+    hence the selectivities of a condition and of its negation always sum up to 1.
+    """
+
+    def __init__(self, condition):
+        super().__init__(as_predicate(condition))
+
+    def weights(self, hist):
+        weights, null = self.args[0].weights(hist)
+        return 1. - weights, 1. - null
+
+
+class And(Predicate):
+    """Several conditions on the same attribute, assumed independent within each bucket."""
+
+    def __init__(self, *conditions):
+        super().__init__(*map(as_predicate, conditions))
+
+    def weights(self, hist):
+        weights, null = np.ones(len(hist)), 1.
+        for predicate in self.args:
+            w, n = predicate.weights(hist)
+            weights, null = weights * w, null * n
+        return weights, null
+
+
+class Or(Predicate):
+    """A disjunction of conditions on the same attribute, or of queries across attributes.
+
+    The operands are either all values and Predicates, in which case the Or is the condition of
+    an attribute, or all dicts, in which case the Or is passed to `p` on its own. Nested Ors of
+    the same kind are flattened.
+    """
+
+    def __init__(self, *operands):
+        flat = []
+        for operand in operands:
+            if isinstance(operand, Or):
+                flat.extend(operand.args)
+            elif isinstance(operand, dict):
+                flat.append(tuple(operand.items()))
+            else:
+                flat.append(operand)
+        kinds = {isinstance(operand, tuple) for operand in flat}
+        if len(kinds) > 1:
+            raise ValueError('an Or either combines queries or conditions, not both')
+        super().__init__(*flat)
+
+    @property
+    def queries(self):
+        """Returns the operands of a disjunction across attributes as dicts."""
+        if not all(isinstance(operand, tuple) for operand in self.args):
+            raise ValueError('the operands of the Or are conditions, not queries')
+        return [dict(operand) for operand in self.args]
+
+    def weights(self, hist):
+        if any(isinstance(operand, tuple) for operand in self.args):
+            raise ValueError('an Or of queries is not the condition of an attribute')
+        values = [v for v in self.args if not isinstance(v, Predicate)]
+        predicates = [v for v in self.args if isinstance(v, Predicate)]
+        if values:
+            predicates.append(In(values))
+        # A bucket fraction satisfies the Or unless it satisfies none of the operands
+        none, null = np.ones(len(hist)), 1.
+        for predicate in predicates:
+            w, n = predicate.weights(hist)
+            none, null = none * (1. - w), null * (1. - n)
+        return 1. - none, 1. - null
+
+
+def as_predicate(condition):
+    """Returns a condition as a Predicate, a value being an equality."""
+    if isinstance(condition, Predicate):
+        return condition
+    return In([condition])
+
+
+def has_predicates(query):
+    """Returns whether one of the conditions of a query is a Predicate."""
+    return any(isinstance(condition, Predicate) for condition in query.values())
+
+
+def conjunction(*queries):
+    """Returns the query which is satisfied when all the given queries are."""
+    merged = {}
+    for query in queries:
+        for attribute, condition in query.items():
+            if attribute not in merged:
+                merged[attribute] = condition
+            elif merged[attribute] != condition:
+                merged[attribute] = And(merged[attribute], condition)
+    return merged
+
+
+def disjuncts(disjunction):
+    """Returns the operands of an Or of queries, with the ones on a single attribute merged.
+
+    `{'a': 1}` and `{'a': 2}` are the same as `{'a': In([1, 2])}`, which is cheaper to evaluate.
+    """
+    singles, others = {}, []
+    for query in disjunction.queries:
+        if len(query) == 1:
+            (attribute, condition), = query.items()
+            singles.setdefault(attribute, []).append(condition)
+        else:
+            others.append(query)
+    return [
+        {attribute: merge(conditions)} for attribute, conditions in singles.items()
+    ] + others
+
+
+def merge(conditions):
+    """Returns the disjunction of several conditions on the same attribute.
+
+    Values are gathered in an `In`, which locates all of them in a single pass.
+    """
+    if len(conditions) == 1:
+        return conditions[0]
+    if not any(isinstance(condition, Predicate) for condition in conditions):
+        return In(conditions)
+    return Or(*conditions)
+
+
+def terms(disjunctions, query):
+    """Returns the conjunctive queries whose signed sum is the selectivity of a query.
+
+    The query is the conjunction of `query` and of each Or of `disjunctions`. The result is a list
+    of `(coefficient, query)` pairs where identical queries are merged. The operands of each Or
+    are combined by inclusion–exclusion, which yields one term per subset of operands, after the
+    operands on the same single attribute have been merged by `disjuncts`.
+
+    The complement of the conjunction of the negated operands would only need two terms, but the
+    nulls of an attribute satisfy the negation of its condition, whereas a network estimates the
+    selectivity of the attributes which a query leaves out as if none of their values were null.
+    """
+
+    expanded = [(1, dict(query))]
+
+    for disjunction in disjunctions:
+        operands = disjuncts(disjunction)
+        signed = [
+            ((-1) ** (len(subset) + 1), conjunction(*subset))
+            for r in range(1, len(operands) + 1)
+            for subset in itertools.combinations(operands, r)
+        ]
+        expanded = [
+            (coefficient * sign, conjunction(q, operand))
+            for coefficient, q in expanded
+            for sign, operand in signed
+        ]
+
+    # Identical queries only have to be answered once
+    merged = {}
+    for coefficient, q in expanded:
+        try:
+            key = frozenset(q.items())
+        except TypeError:
+            key = id(q)
+        if key in merged:
+            merged[key] = (merged[key][0] + coefficient, q)
+        else:
+            merged[key] = (coefficient, q)
+
+    return [(coefficient, q) for coefficient, q in merged.values() if coefficient]
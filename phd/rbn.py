@@ -1,22 +1,47 @@
 import collections
 import functools
+import itertools
 import operator
+import pickle
+import time
 
+import networkx as nx
+import numpy as np
 import pandas as pd
-import sqlalchemy
 
 from . import bn
+from . import allocation
+from . import checkpoint as checkpoints
+from . import drift
+from . import files
+from . import frozen
+from . import op
 from . import rel
+from . import report
+
+
+Estimate = collections.namedtuple('Estimate', 'selectivity method work elapsed')
+Estimate.__doc__ = """The result of `RecursiveBayesianNetwork.estimate`.
+
+`method` is the most accurate method that fitted in the budget, either 'linked', 'relations' or
+'independence', or 'feedback' if the true cardinality of the query was observed. `work` is the
+number of buckets visited and `elapsed` is the time spent in seconds.
+"""
 
 
 class RecursiveBayesianNetwork():
 
-    def __init__(self, max_rows=30000, sampling_method='SYSTEM', random_state=None):
+    def __init__(self, max_rows=30000, sampling_method='SYSTEM', random_state=None,
+                 cache_size=128, budget=None, feedback_size=10000):
         self.max_rows = max_rows
         self.sampling_method = sampling_method
         self.random_state = random_state
+        self.cache_size = cache_size  # Number of linked networks to keep in memory
+        self.budget = budget  # Maximum number of buckets for all the networks together
+        self.feedback_size = feedback_size  # Number of observed cardinalities to keep in memory
+        self.feedback_ = collections.OrderedDict()
 
-    def fit_database(self, con: sqlalchemy.engine.base.Connection):
+    def fit_database(self, con: 'sqlalchemy.engine.base.Connection'):
 
         # Retrieve the foreign keys of each relation
         sql = '''
@@ -92,8 +117,13 @@ class RecursiveBayesianNetwork():
 
         # Query the relations
         relation_names = list(columns.keys())
+        self.sizes_ = {name: int(size) for name, size in sizes.items()}
         self.bns_ = {}
         self.extensions_ = collections.defaultdict(list)
+        self.fanouts_ = collections.defaultdict(dict)
+        self.linked_ = collections.OrderedDict()
+        self.aliases_ = collections.OrderedDict()
+        self.feedback_ = collections.OrderedDict()
 
         # Continue while there isn't one Bayesian network per relation
         while len(self.bns_) != len(relation_names):
@@ -144,10 +174,32 @@ class RecursiveBayesianNetwork():
 
         return self
 
-    def fit(self, relations):
+    def fit(self, relations, checkpoint=None, fingerprint='content'):
+        """Fits a network to each relation, joined with the root of the relations it references.
+
+        A `rel.MappedRelation` is never loaded: its network is fitted to a uniform sample of
+        `max_rows` of its rows, and the root attribute of a mapped relation is looked up for the
+        star joins of the relations which reference it.
+
+        If a `checkpoint` directory is given, the network of each relation is saved in it as soon
+        as it is fitted. A network is read back from the checkpoint instead of being fitted if
+        neither the relation, nor its budget, nor `max_rows`, nor `random_state`, nor the relations
+        it references have changed. The relations are compared with the given `fingerprint` method,
+        see `phd.checkpoint`.
+        """
+        budgets = allocation.split(self.budget, relations) if self.budget else {}
         relations = {r.name: r for r in relations}
+        self.sizes_ = {name: len(r) for name, r in relations.items()}
         self.bns_ = {}
         self.extensions_ = collections.defaultdict(list)
+        self.fanouts_ = collections.defaultdict(dict)
+        self.linked_ = collections.OrderedDict()
+        self.aliases_ = collections.OrderedDict()
+        self.feedback_ = collections.OrderedDict()
+        if isinstance(checkpoint, str):
+            checkpoint = checkpoints.Checkpoint(checkpoint)
+        fingerprints = {}
+        seed = checkpoints.random_state_fingerprint(self.random_state)
 
         # Continue while there isn't one Bayesian network per relation
         while len(self.bns_) != len(relations):
@@ -160,44 +212,259 @@ class RecursiveBayesianNetwork():
                 relation = relations[name]
                 f_keys = relation.foreign_keys
 
-                # Build a simple BN if there are no foreign keys
-                if not f_keys:
-                    self.bns_[name] = bn.BayesianNetwork().fit(relation)
-                    continue
-
                 # Skip if any of the related Bayesian networks hasn't been built yet
                 if not all(self.bns_.get(f_key.to_rel) for f_key in f_keys):
                     continue
 
+                # The relation is fitted before it is modified, hence it is fingerprinted first
+                if checkpoint is not None:
+                    fingerprints[name] = checkpoints.fingerprint(
+                        checkpoints.relation_fingerprint(relation, fingerprint),
+                        self.max_rows,
+                        seed,
+                        budgets.get(name),
+                        [fingerprints[f_key.to_rel] for f_key in f_keys]
+                    )
+                    if self._restore(checkpoint, name, fingerprints[name]):
+                        continue
+
+                if isinstance(relation, rel.MappedRelation):
+                    relation = relation.sample(self.max_rows, self.random_state)
+
+                # Build a simple BN if there are no foreign keys
+                if not f_keys:
+                    self.bns_[name] = bn.BayesianNetwork(budget=budgets.get(name)).fit(relation)
+                    self._save(checkpoint, name, fingerprints.get(name))
+                    continue
+
                 # Join the with the root attribute of each related table
                 star = relation
                 for f_key in f_keys:
                     other_relation = relations[f_key.to_rel]
                     other_root = self.bns_[f_key.to_rel].root
                     self.extensions_[name].append(f_key.to_rel)
+                    if isinstance(other_relation, rel.MappedRelation):
+                        star = star.copy()
+                        star[f'{f_key.to_rel}.{other_root}'] = other_relation.lookup(
+                            star[f_key.from_col],
+                            other_root
+                        )
+                        continue
                     star = star.join(
                         other=other_relation[[other_root]].add_prefix(f'{f_key.to_rel}.'),
                         on=f_key.from_col
                     )
+                for f_key in f_keys:
+                    self.fanouts_[name][f_key.to_rel] = fanout(
+                        self.bns_[f_key.to_rel],
+                        star[f'{f_key.to_rel}.{self.bns_[f_key.to_rel].root}'],
+                        self.sizes_[name]
+                    )
 
                 # Fit a Bayesian network to the star join
-                self.bns_[name] = bn.BayesianNetwork().fit(star)
+                self.bns_[name] = bn.BayesianNetwork(budget=budgets.get(name)).fit(star)
+                self._save(checkpoint, name, fingerprints.get(name))
 
         return self
 
-    def p(self, relation_names, **query):
+    def fit_files(self, paths, foreign_keys, columns=None, names=None, chunksize=100000,
+                  checkpoint=None, **kwargs):
+        """Fits the networks to relations stored in CSV or Parquet files, without any database.
+
+        Each file is read in a single pass, chunk by chunk, and only the modelled columns and the
+        foreign keys are parsed. A uniform sample of at most `max_rows` rows is kept for each
+        relation. The star joins are made with a lookup from the referenced key to the root
+        attribute of the referenced relation, which requires one more pass over two columns of
+        the referenced file.
+
+        Parameters:
+            paths (dict): The path to the file of each relation.
+            foreign_keys (str or list): The path to a SQL file with `ALTER TABLE ... ADD FOREIGN
+                KEY` statements, such as `job/foreign_keys.sql`, or a list of `rel.ForeignKey`.
+            columns (dict): The columns to model for each relation. By default every column that
+                is neither a foreign key nor referenced by one is modelled.
+            names (str or dict): The column names of each CSV file, or the path to a SQL file with
+                `CREATE TABLE` statements. This is required for CSV files without a header, such
+                as the ones of the JOB benchmark.
+            chunksize (int): The number of rows read at once.
+            checkpoint (str): A directory where the network of each relation is saved as soon as
+                it is fitted. The relations whose file, columns and budget haven't changed since,
+                along with those of the relations they reference, are neither read nor fitted
+                again. Files are compared by size and modification time.
+            kwargs: Extra keyword arguments passed to `pandas.read_csv`.
+
+        """
+
+        if isinstance(foreign_keys, str):
+            foreign_keys = [fk for fks in files.read_foreign_keys(foreign_keys).values()
+                            for fk in fks]
+        if isinstance(names, str):
+            names = files.read_column_names(names)
+        names = names or {}
+        columns = columns or {}
+
+        # Self-references can't be modelled by star joins, and a relation can only be joined once
+        f_keys = collections.defaultdict(list)
+        for fk in foreign_keys:
+            if fk.from_rel in paths and fk.to_rel in paths and fk.from_rel != fk.to_rel and \
+                    fk.to_rel not in [f.to_rel for f in f_keys[fk.from_rel]]:
+                f_keys[fk.from_rel].append(fk)
+        referenced = collections.defaultdict(set)
+        for fks in f_keys.values():
+            for fk in fks:
+                referenced[fk.to_rel].add(fk.to_col)
+
+        def read(name, usecols):
+            return files.read_chunks(paths[name], usecols, names.get(name), chunksize, **kwargs)
+
+        # Determine the columns to read from each file
+        usecols = {}
+        for name in paths:
+            keys = [fk.from_col for fk in f_keys[name]]
+            attributes = columns.get(name) or [
+                col for col in files.read_header(paths[name], names.get(name))
+                if col not in keys and col not in referenced[name]
+            ]
+            usecols[name] = attributes + keys
+
+        budgets = allocation.split(
+            self.budget,
+            [rel.Relation(columns=cols, name=name) for name, cols in usecols.items()]
+        ) if self.budget else {}
+
+        # Fingerprint each relation along with the relations it references
+        if isinstance(checkpoint, str):
+            checkpoint = checkpoints.Checkpoint(checkpoint)
+        fingerprints = {}
+        seed = checkpoints.random_state_fingerprint(self.random_state)
+
+        def fingerprint(name, path=()):
+            if name in path:
+                raise ValueError('the foreign keys contain a cycle')
+            if name not in fingerprints:
+                fingerprints[name] = checkpoints.fingerprint(
+                    checkpoints.file_fingerprint(paths[name]),
+                    usecols[name],
+                    self.max_rows,
+                    seed,
+                    budgets.get(name),
+                    [fingerprint(fk.to_rel, path + (name,)) for fk in f_keys[name]]
+                )
+            return fingerprints[name]
+
+        restored = {}
+        if checkpoint is not None:
+            for name in paths:
+                entry = checkpoint.load(name, fingerprint(name))
+                if entry is not None:
+                    restored[name] = entry
+
+        # Sample each relation in one pass over its file
+        relations = {}
+        self.sizes_ = {name: entry['size'] for name, entry in restored.items()}
+        for name in paths:
+            if name in restored:
+                continue
+            sample, self.sizes_[name] = files.sample(
+                read(name, usecols[name]),
+                max_rows=self.max_rows,
+                random_state=self.random_state
+            )
+            relations[name] = rel.Relation(
+                sample,
+                name=name,
+                foreign_keys=[(fk.from_col, fk.to_rel) for fk in f_keys[name]]
+            )
 
-        # Use a set for faster lookups
-        relation_names = set(relation_names)
+        self.bns_ = {}
+        self.extensions_ = collections.defaultdict(list)
+        self.fanouts_ = collections.defaultdict(dict)
+        self.linked_ = collections.OrderedDict()
+        self.aliases_ = collections.OrderedDict()
+        self.feedback_ = collections.OrderedDict()
+
+        # Continue while there isn't one Bayesian network per relation
+        while len(self.bns_) != len(paths):
+
+            ready = [
+                name for name in paths
+                if name not in self.bns_ and all(fk.to_rel in self.bns_ for fk in f_keys[name])
+            ]
+            if not ready:
+                raise ValueError('the foreign keys contain a cycle')
+
+            for name in ready:
+
+                if name in restored:
+                    self._restore(checkpoint, name, fingerprints[name], restored[name])
+                    continue
+
+                # Join with the root attribute of each related relation, through a lookup
+                star = relations[name]
+                for fk in f_keys[name]:
+                    root = self.bns_[fk.to_rel].root
+                    lookup = files.read_lookup(read(fk.to_rel, [fk.to_col, root]), fk.to_col, root)
+                    star[f'{fk.to_rel}.{root}'] = star[fk.from_col].map(lookup)
+                    self.extensions_[name].append(fk.to_rel)
+                    self.fanouts_[name][fk.to_rel] = fanout(
+                        self.bns_[fk.to_rel],
+                        star[f'{fk.to_rel}.{root}'],
+                        self.sizes_[name]
+                    )
+
+                self.bns_[name] = bn.BayesianNetwork(budget=budgets.get(name)).fit(star)
+                self._save(checkpoint, name, fingerprints.get(name))
+
+        return self
+
+    def _restore(self, checkpoint, name, fingerprint, entry=None):
+        """Reads the network of a relation from a checkpoint, returns False if it is stale."""
+        entry = entry or checkpoint.load(name, fingerprint)
+        if entry is None:
+            return False
+        self.bns_[name] = entry['bn']
+        if entry['extensions']:
+            self.extensions_[name] = list(entry['extensions'])
+        if entry.get('fanouts'):
+            self.fanouts_[name] = dict(entry['fanouts'])
+        return True
+
+    def _save(self, checkpoint, name, fingerprint):
+        if checkpoint is not None:
+            checkpoint.save(
+                name,
+                fingerprint,
+                bn=self.bns_[name],
+                extensions=self.extensions_.get(name, []),
+                fanouts=self.fanouts_.get(name, {}),
+                size=self.sizes_.get(name)
+            )
+
+    def link(self, relation_names):
+        """Returns the networks obtained by linking the networks of a set of relations.
+
+        The result is cached for each distinct set of relations. Once more than `cache_size` sets
+        are cached, the least recently used one is evicted.
+        """
+        return self._link(relation_names)[0]
+
+    def _link(self, relation_names):
+        """Returns the linked networks of a set of relations along with the `aliases` of each."""
+
+        key = frozenset(relation_names)
+        if key in self.linked_:
+            self.linked_.move_to_end(key)
+            self.aliases_.move_to_end(key)
+            return self.linked_[key], self.aliases_[key]
 
         # Determine which BNs to use
-        bns = {name: bn.copy() for name, bn in self.bns_.items() if name in relation_names}
+        bns = {name: bn for name, bn in self.bns_.items() if name in key}
 
         # Determine which extensions can be applied
         extensions = {
-            name: [r for r in related if r in relation_names]
+            name: [r for r in related if r in key]
             for name, related in self.extensions_.items()
-            if name in relation_names
+            if name in key
         }
         extensions = {name: related for name, related in extensions.items() if related}
 
@@ -212,21 +479,501 @@ class RecursiveBayesianNetwork():
                 if any(extensions.get(r) for r in related):
                     continue
 
-                # Apply the extensions
+                # Apply the extensions, the whole subtree below the root of the other network
+                # is grafted onto the node that holds the root values in the star join
+                bns[name] = bns[name].copy()
                 for other in related:
+                    # A relation referenced by several relations is only grafted once
+                    if other not in bns:
+                        continue
                     bn = bns.pop(other).rename(lambda x: f'{other}.{x}')
                     root = bn.root
-                    for child in bn.successors(root):
-                        bns[name].add_node(child, **bn.node[child])
-                        bns[name].add_edge(root, child)
+                    for parent, child in nx.dfs_edges(bn, root):
+                        bns[name].add_node(child, **bn.nodes[child])
+                        bns[name].add_edge(parent, child)
                 extensions.pop(name)
 
+        linked = tuple(bns.values())
+        names = tuple(frozen.aliases(host, bn) for host, bn in bns.items())
+        self.linked_[key] = linked
+        self.aliases_[key] = names
+        while len(self.linked_) > self.cache_size:
+            self.linked_.popitem(last=False)
+            self.aliases_.popitem(last=False)
+
+        return linked, names
+
+    def localize(self, relation_names, query):
+        """Returns each linked network along with the conditions of a query on its nodes.
+
+        The attributes of the query are either the names of nodes or `relation.attribute`. The
+        latter are resolved in each network, whether the relation is the one the network was
+        fitted on or one that was grafted onto it. The conditions on the root of a relation which
+        is referenced by several relations are sent to each of their networks.
+        """
+        return [
+            (bn, frozen.resolve(names, query)) for bn, names in zip(*self._link(relation_names))
+        ]
+
+    def warm_up(self, workload):
+        """Links the networks of each set of relations in a workload ahead of time.
+
+        The workload is either an iterable or the path to a file which contains one
+        comma-separated set of relation names per line. Each item of the iterable is either a set
+        of relation names, or a pair made of a set of relation names and of the attributes that
+        are queried, in which case the Steiner trees used by `p` to answer queries on these
+        attributes are also computed. The attributes are named as in the queries given to `p`.
+        """
+
+        if isinstance(workload, str):
+            with open(workload) as f:
+                lines = [line.split('#')[0] for line in f]
+            workload = [
+                [name.strip() for name in line.split(',') if name.strip()]
+                for line in lines
+            ]
+
+        for item in workload:
+            if len(item) == 2 and not isinstance(item[0], str):
+                relation_names, attributes = item
+            else:
+                relation_names, attributes = item, None
+            if not relation_names:
+                continue
+            self.link(relation_names)
+            if attributes:
+                query = {attribute.replace('__', '.'): None for attribute in attributes}
+                for bn, local in self.localize(relation_names, query):
+                    bn.warm_up([list(local)])
+
+        return self
+
+    def save(self, path):
+        """Pickles the model along with the state built by `link` and `warm_up`."""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a model pickled with `save`, which should come from a trusted source."""
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def observe(self, relation_names, query, cardinality):
+        """Stores the true cardinality of a query, which `p` then uses instead of an estimate.
+
+        The observations are keyed by the set of relations and the set of predicates of the
+        queries, in the format expected by `p`. Once more than `feedback_size` queries are stored,
+        the least recently used one is evicted. The observations are discarded when the model is
+        fitted again. Queries with unhashable values are ignored.
+
+        `p` divides the cardinality by `join_size`, hence observing the cardinality given by
+        `estimate_cardinality` doesn't change the selectivity.
+        """
+        key = signature(relation_names, query)
+        if key is None:
+            return self
+        self.feedback_[key] = cardinality
+        self.feedback_.move_to_end(key)
+        while len(self.feedback_) > self.feedback_size:
+            self.feedback_.popitem(last=False)
+        return self
+
+    def base_size(self, relation_names):
+        """Returns the number of rows which the selectivity of a query is relative to.
+
+        Following a foreign key doesn't change the number of rows, hence this is the product of
+        the sizes of the relations which no other relation of the set references.
+        """
+        referenced = {
+            other
+            for name in relation_names
+            for other in self.extensions_.get(name, [])
+            if other in relation_names
+        }
+        return functools.reduce(
+            operator.mul,
+            (self.sizes_[name] for name in relation_names if name not in referenced),
+            1
+        )
+
+    def _feedback(self, relation_names, query):
+        """Returns the selectivity of a query whose cardinality was observed, or None."""
+        key = signature(relation_names, query)
+        if key is None or key not in self.feedback_:
+            return None
+        self.feedback_.move_to_end(key)
+        scale = self.join_size(relation_names, query)
+        return self.feedback_[key] / scale if scale else 0.
+
+    def join_size(self, relation_names, query):
+        """Returns the number of rows by which the selectivity of a query is multiplied.
+
+        This is `base_size` times the selectivity of the joins on each relation which several
+        relations of the set reference, see `estimate_cardinality`. The joins depend on the
+        condition of the query on the root of the shared relation, if any.
+        """
+        size = self.base_size(relation_names)
+        for other in relation_names:
+            referencing = [
+                name for name in relation_names
+                if other in self.extensions_.get(name, [])
+            ]
+            if len(referencing) > 1:
+                root = self.bns_[other].root
+                size *= self.join_selectivity(other, referencing, query.get(f'{other}.{root}'))
+        return size
+
+    def p(self, relation_names, *disjunctions, **query):
+        """Returns the selectivity of a query over the join of some relations.
+
+        As with `BayesianNetwork.p`, each positional argument is a `phd.op.Or` of queries across
+        attributes. Each conjunctive query of their expansion is answered by every linked network
+        in a single batch.
+        """
+
         # Format the query
         query = {k.replace('__', '.'): v for k, v in query.items()}
+        disjunctions = [
+            op.Or(*({k.replace('__', '.'): v for k, v in q.items()} for q in d.queries))
+            for d in disjunctions
+        ]
+
+        # Use the true cardinality if it was observed
+        if not disjunctions:
+            p = self._feedback(relation_names, query)
+            if p is not None:
+                return p
 
         # Compute and return the selectivity
+        if disjunctions:
+            terms = op.terms(disjunctions, query)
+            products = np.ones(len(terms))
+            for bn, names in zip(*self._link(relation_names)):
+                products *= bn.p_many([frozen.resolve(names, q) for _, q in terms])
+            return float(sum(c * p for (c, _), p in zip(terms, products)))
         return functools.reduce(
             operator.mul,
-            (bn.p(**query) for bn in bns.values()),
+            (bn.p(**q) for bn, q in self.localize(relation_names, query)),
             1
         )
+
+    def estimate_cardinality(self, relation_names, *disjunctions, **query):
+        """Returns the number of rows of the join of some relations which satisfy a query.
+
+        The cardinality is the selectivity given by `p` times `base_size`, which is exact when the
+        relations are joined by following foreign keys from a single relation. When several
+        relations of the set reference the same relation, such as `movie_companies` and
+        `movie_info` which both reference `title`, their networks are linked separately and the
+        product of their sizes is the size of their cross product. It is then scaled by the
+        selectivity of the joins on the shared relation, which is given by the fanouts measured
+        during the fit. No join is executed.
+        """
+
+        # Format the query
+        query = {k.replace('__', '.'): v for k, v in query.items()}
+
+        # Use the true cardinality if it was observed
+        key = None if disjunctions else signature(relation_names, query)
+        if key in self.feedback_:
+            self.feedback_.move_to_end(key)
+            return self.feedback_[key]
+
+        return self.p(relation_names, *disjunctions, **query) * \
+            self.join_size(relation_names, query)
+
+    def join_selectivity(self, other, relation_names, condition=None):
+        """Returns the probability that rows of relations which reference another one join.
+
+        The rows are taken one from each relation and they join if they reference the same row of
+        the other relation. The referenced rows are assumed to have the same number of referencing
+        rows within each bucket of the root attribute of the other relation. If the root
+        attribute is conditioned on a value, then the rows are taken among those which reference
+        a row with that value, or with a value which satisfies that `phd.op.Predicate`.
+        """
+
+        hist = self.bns_[other].nodes[self.bns_[other].root]['dist']
+        parents = np.array([float(b.frequency) for b in hist.buckets]) * self.sizes_[other]
+        children = np.array([self.fanouts_[name][other] for name in relation_names])
+
+        if condition is not None:
+            weights, _ = op.as_predicate(condition).weights(hist)
+            parents, children = parents * weights, children * weights
+
+        # Number of tuples of rows which reference the same row, over the number of tuples
+        degrees = np.divide(children, parents, out=np.zeros_like(children), where=parents > 0)
+        joined = (parents * degrees.prod(axis=0)).sum()
+        total = children.sum(axis=1).prod()
+        return float(joined / total) if total else 0.
+
+    def estimate(self, relation_names, query, time_budget=None, work_budget=None):
+        """Returns an Estimate of the selectivity of a query within an optional budget.
+
+        The estimate is refined in up to three stages, each more accurate and more expensive than
+        the previous one:
+
+        1. 'independence' multiplies the selectivity of each attribute taken alone.
+        2. 'relations' multiplies the selectivities given by the network of each relation, which
+           ignores the correlations between relations.
+        3. 'linked' uses the linked networks, just like `p`.
+
+        A stage is only run if its work, which is the number of buckets it visits, fits in what is
+        left of `work_budget`, and if its predicted duration fits in what is left of `time_budget`.
+        The duration is predicted from the time per bucket measured during the previous stages.
+        The first stage is always run so that there is an estimate to return. Without any budget,
+        the linked networks are used directly. A query whose cardinality was given to `observe`
+        is answered with it, whatever the budget.
+
+        Parameters:
+            relation_names (list): The relations involved in the query.
+            query (dict): The value of each attribute, in the format expected by `p`.
+            time_budget (float): The number of seconds the estimate may take.
+            work_budget (int): The number of buckets the estimate may visit.
+
+        """
+
+        tic = time.perf_counter()
+        query = {k.replace('__', '.'): v for k, v in query.items()}
+
+        p = self._feedback(relation_names, query)
+        if p is not None:
+            return Estimate(p, 'feedback', 0, time.perf_counter() - tic)
+
+        if time_budget is None and work_budget is None:
+            work = sum(bn.cost(q.keys()) for bn, q in self.localize(relation_names, query))
+            p = self.p(relation_names, **query)
+            return Estimate(p, 'linked', work, time.perf_counter() - tic)
+
+        parts = self._split(relation_names, query)
+        stages = [
+            ('independence', self._independence_stage(parts)),
+            ('relations', self._relations_stage(parts)),
+            ('linked', self._linked_stage(relation_names, query, parts))
+        ]
+        if len(parts) == 1:
+            stages.pop(1)
+
+        best = None
+        work_done = 0
+        for method, (work, run) in stages:
+            elapsed = time.perf_counter() - tic
+            if best is not None:
+                if work_budget is not None and work_done + work > work_budget:
+                    break
+                rate = elapsed / max(work_done, 1)
+                if time_budget is not None and elapsed + work * rate > time_budget:
+                    break
+            best = (run(), method)
+            work_done += work
+
+        return Estimate(best[0], best[1], work_done, time.perf_counter() - tic)
+
+    def p_subsets(self, relation_names, query):
+        """Returns the selectivity of a query restricted to each connected subset of its relations.
+
+        This is what a join optimizer needs to cost the plans of a query. Two relations are
+        connected if one references the other. The query restricted to a subset only keeps the
+        attributes of the relations of the subset, the attributes being assigned to relations
+        just like in `estimate`. Hence an attribute is named `relation.attribute` or
+        `relation__attribute` whether or not the relation is grafted onto another one.
+
+        Within a subset, each relation is grafted onto the first relation of `relation_names`
+        that references it, instead of linking the networks of the subset together. The messages
+        a relation sends to the relation it is grafted onto only depend on the relations grafted
+        below it. They are computed once and reused by all the subsets that share that subtree,
+        and so is the estimate of each network which isn't grafted onto another.
+
+        Returns:
+            dict: The selectivity of each connected subset, keyed by frozenset of relation names.
+
+        """
+
+        relation_names = list(relation_names)
+        query = {k.replace('__', '.'): v for k, v in query.items()}
+        parts = self._split(relation_names, query)
+        references = {
+            name: [other for other in self.extensions_.get(name, []) if other in parts]
+            for name in relation_names
+        }
+
+        graph = nx.Graph()
+        graph.add_nodes_from(relation_names)
+        graph.add_edges_from(
+            (name, other) for name, others in references.items() for other in others
+        )
+
+        memo = {}
+        estimates = {}
+        for size in range(1, len(relation_names) + 1):
+            for subset in itertools.combinations(relation_names, size):
+                if nx.is_connected(graph.subgraph(subset)):
+                    estimates[frozenset(subset)] = self._p_subset(subset, parts, references, memo)
+        return estimates
+
+    def _p_subset(self, subset, parts, references, memo):
+
+        # Each relation is grafted onto the first relation which references it
+        children = collections.defaultdict(list)
+        grafted = set()
+        for name in subset:
+            for other in references[name]:
+                if other in subset and other not in grafted:
+                    children[name].append(other)
+                    grafted.add(other)
+
+        def subtree(name):
+            return frozenset([name]).union(*(subtree(child) for child in children[name]))
+
+        def local(name):
+            """Returns the query and the messages of a relation, given the relations below it."""
+            query = dict(parts[name])
+            messages = {}
+            for child in children[name]:
+                node = f'{child}.{self.bns_[child].root}'
+                child_messages, condition = send(child)
+                if child_messages:
+                    messages[node] = child_messages
+                if condition is not None:
+                    query[node] = condition
+            return query, messages
+
+        def send(name):
+            """Returns the messages and the condition a relation sends to the one above it."""
+            key = ('send', name, subtree(name))
+            if key not in memo:
+                net = self.bns_[name]
+                root = net.root
+                query, messages = local(name)
+                condition = query.pop(root, None)
+                relevant = [n for n in itertools.chain(query, messages) if n in net and n != root]
+                if relevant:
+                    sent = net.steiner_tree(relevant).root_messages(query, messages)
+                else:
+                    sent = list(messages.get(root, ()))
+                memo[key] = sent, condition
+            return memo[key]
+
+        def estimate(name):
+            key = ('p', name, subtree(name))
+            if key not in memo:
+                net = self.bns_[name]
+                query, messages = local(name)
+                relevant = [n for n in itertools.chain(query, messages) if n in net]
+                memo[key] = (
+                    float(net.steiner_tree(relevant).infer(query, messages))
+                    if relevant else 1.
+                )
+            return memo[key]
+
+        return functools.reduce(
+            operator.mul,
+            (estimate(name) for name in subset if name not in grafted),
+            1.
+        )
+
+    def _split(self, relation_names, query):
+        """Assigns each attribute of a query to the network of the relation it belongs to.
+
+        An attribute prefixed with the name of a relation belongs to that relation, otherwise it
+        belongs to the first relation whose network contains it.
+        """
+        parts = {name: {} for name in relation_names}
+        for key, val in query.items():
+            prefix, _, attribute = key.partition('.')
+            if attribute and prefix in parts:
+                parts[prefix][attribute] = val
+                continue
+            for name in parts:
+                if key in self.bns_[name]:
+                    parts[name][key] = val
+                    break
+        return parts
+
+    def _independence_stage(self, parts):
+        pairs = [
+            (self.bns_[name], {attr: val})
+            for name, q in parts.items()
+            for attr, val in q.items()
+        ]
+        work = sum(bn.cost(q.keys()) for bn, q in pairs)
+        return work, lambda: functools.reduce(operator.mul, (bn.p(**q) for bn, q in pairs), 1.)
+
+    def _relations_stage(self, parts):
+        pairs = [(self.bns_[name], q) for name, q in parts.items() if q]
+        work = sum(bn.cost(q.keys()) for bn, q in pairs)
+        return work, lambda: functools.reduce(operator.mul, (bn.p(**q) for bn, q in pairs), 1.)
+
+    def _linked_stage(self, relation_names, query, parts):
+        key = frozenset(relation_names)
+        if key in self.linked_:
+            work = sum(
+                bn.cost(frozen.resolve(names, query).keys())
+                for bn, names in zip(self.linked_[key], self.aliases_[key])
+            )
+        else:
+            # Linking has to copy the networks, which are then queried with their own attributes
+            work = sum(
+                self.bns_[name].number_of_nodes() + self.bns_[name].cost(parts[name].keys())
+                for name in key
+            )
+        return work, lambda: self.p(relation_names, **query)
+
+    def check_drift(self, summaries, threshold=.1):
+        """Returns the divergence of each attribute of each relation, see `phd.drift`.
+
+        `summaries` maps the name of a relation to a fresh sample of it or to the Summaries of its
+        attributes, as returned by `drift.read_pg_stats`. The relations which are not in
+        `summaries` are not checked.
+        """
+        return drift.check_recursive(self, summaries, threshold)
+
+    def refit_plan(self, drift_report):
+        """Returns the relations to refit in order, given the output of `check_drift`.
+
+        The plan contains the relations which have drifted along with the relations which
+        reference them, directly or not.
+        """
+        drifted = drift_report.index[drift_report['drifted']].get_level_values('relation')
+        return drift.refit_plan(self.extensions_, set(drifted))
+
+    def report(self, holdouts=None, max_values=30):
+        """Returns the footprint and the accuracy of each node of the network of each relation.
+
+        `holdouts` maps the name of a relation to held-out rows of it. See `phd.report` for a
+        description of the columns.
+        """
+        return report.report_recursive(self, holdouts, max_values)
+
+    def freeze(self):
+        """Returns an immutable and thread-safe version of the network.
+
+        See `phd.frozen` for more details.
+        """
+        return frozen.FrozenRecursiveBayesianNetwork.from_network(self)
+
+
+def signature(relation_names, query):
+    """Returns a key which identifies a query whatever the order of its relations and predicates.
+
+    None is returned if one of the values of the query isn't hashable.
+    """
+    try:
+        return (
+            frozenset(relation_names),
+            frozenset((k.replace('__', '.'), v) for k, v in query.items())
+        )
+    except TypeError:
+        return None
+
+
+def fanout(network, values, size):
+    """Returns the number of referencing rows per bucket of the root of a referenced network.
+
+    `values` are the root values of the referenced rows in the star join of a sample of the
+    referencing relation, which has `size` rows in total. Rows without a referenced row are
+    ignored.
+    """
+    hist = network.nodes[network.root]['dist']
+    indexes, _ = hist.index.locate(list(values))
+    counts = np.bincount(indexes[indexes >= 0], minlength=len(hist.buckets)).astype(float)
+    return counts * size / max(len(values), 1)
@@ -1,3 +1,7 @@
+import json
+import os
+
+import numpy as np
 import pandas as pd
 
 
@@ -39,3 +43,193 @@ class ForeignKey():
 
     def __repr__(self):
         return str(self)
+
+
+INDEX = '__index__'
+
+
+class MappedRelation():
+    """A relation whose columns are memory-mapped files, hence which is never loaded in memory.
+
+    A mapped relation is a directory written by `write`, with one binary file per column and a
+    `meta.json` file which holds the name of the relation, its foreign keys, its number of rows
+    and the type of each column. Numbers are stored as float64 with NaN for nulls. The other
+    values are dictionary-encoded: each row holds the int32 code of its value, -1 for nulls, and
+    the distinct values are listed in `meta.json`. The row labels are stored in `__index__.bin`,
+    they have to be increasing integers so that foreign keys are looked up by binary search.
+
+    Only what the fitters need is supported: `len`, projection with `relation[columns]`,
+    `sample`, `chunks`, and `lookup` which replaces the star joins.
+
+    Parameters:
+        directory (str): The directory written by `write`.
+        columns (list): The columns to expose, all of them by default.
+
+    """
+
+    def __init__(self, directory, columns=None):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.name = self.meta['name']
+        self.foreign_keys = [
+            ForeignKey(from_rel=self.name, from_col=from_col, to_rel=to_rel, to_col='index')
+            for from_col, to_rel in self.meta['foreign_keys']
+        ]
+        self.columns = list(self.meta['columns'] if columns is None else columns)
+        unknown = set(self.columns) - set(self.meta['columns'])
+        if unknown:
+            raise KeyError(f'unknown columns: {sorted(unknown)}')
+        self._arrays = {}
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def __getitem__(self, columns):
+        """Returns a projection of the relation, which maps the same files."""
+        return MappedRelation(self.directory, columns)
+
+    def path(self, col):
+        return os.path.join(self.directory, f'{col}.bin')
+
+    def array(self, col):
+        """Returns the memory-mapped array of a column, which holds the codes of encoded ones."""
+        if col not in self._arrays:
+            dtype = 'int64' if col == INDEX else self.meta['columns'][col]['dtype']
+            self._arrays[col] = (
+                np.memmap(self.path(col), dtype=dtype, mode='r', shape=(len(self),))
+                if len(self) else np.empty(0, dtype=dtype)
+            )
+        return self._arrays[col]
+
+    def decode(self, col, raw):
+        """Returns the values of a column from some of its raw elements."""
+        categories = self.meta['columns'][col].get('categories')
+        if categories is None:
+            return np.array(raw, dtype=float)
+        # The code -1 points to the trailing None
+        return np.array(categories + [None], dtype=object)[raw]
+
+    def take(self, positions):
+        """Returns the rows at some positions, or in a slice, as a DataFrame."""
+        return pd.DataFrame(
+            {col: self.decode(col, self.array(col)[positions]) for col in self.columns},
+            index=np.array(self.array(INDEX)[positions]),
+            columns=self.columns
+        )
+
+    def sample(self, n, random_state=None):
+        """Returns a uniform sample of at most `n` rows as a Relation, read in storage order."""
+        from sklearn import utils
+
+        rng = utils.check_random_state(random_state)
+        positions = np.sort(rng.choice(len(self), size=min(n, len(self)), replace=False))
+        return Relation(
+            self.take(positions),
+            name=self.name,
+            foreign_keys=[(fk.from_col, fk.to_rel) for fk in self.foreign_keys]
+        )
+
+    def chunks(self, chunksize=100000):
+        """Yields the rows as DataFrames of at most `chunksize` rows."""
+        for start in range(0, len(self), chunksize):
+            yield self.take(slice(start, start + chunksize))
+
+    def lookup(self, keys, col):
+        """Returns the value of a column for the row labelled by each key, or null if none is."""
+        keys = np.asarray(keys, dtype=float)
+        index = self.array(INDEX)
+        raw = np.full(len(keys), -1 if 'categories' in self.meta['columns'][col] else np.nan)
+
+        rows = np.flatnonzero(~np.isnan(keys))
+        positions = np.minimum(np.searchsorted(index, keys[rows]), max(len(index) - 1, 0))
+        if len(index):
+            found = index[positions] == keys[rows]
+            raw[rows[found]] = self.array(col)[positions[found]]
+        return self.decode(col, raw.astype(self.meta['columns'][col]['dtype']))
+
+    @classmethod
+    def write(cls, chunks, directory, name=None, foreign_keys=None):
+        """Writes a DataFrame, or an iterable of DataFrames, to a directory and maps it.
+
+        Only one chunk is held in memory at a time, along with the distinct values of the
+        encoded columns. The name and the foreign keys default to those of a Relation.
+        """
+
+        if isinstance(chunks, pd.DataFrame):
+            if name is None:
+                name = getattr(chunks, 'name', None)
+            if foreign_keys is None:
+                foreign_keys = [
+                    (fk.from_col, fk.to_rel) for fk in getattr(chunks, 'foreign_keys', [])
+                ]
+            chunks = [chunks]
+
+        os.makedirs(directory, exist_ok=True)
+        columns, encodings, files = {}, {}, {}
+        n_rows, last = 0, None
+
+        def open_column(col):
+            files[col] = open(os.path.join(directory, f'{col}.bin'), 'wb')
+
+        try:
+            open_column(INDEX)
+            for chunk in chunks:
+
+                index = chunk.index
+                if len(index) and (
+                    not pd.api.types.is_integer_dtype(index) or
+                    not index.is_monotonic_increasing or
+                    (last is not None and index[0] <= last)
+                ):
+                    raise ValueError('the row labels have to be increasing integers')
+                if len(index):
+                    last = index[-1]
+                np.asarray(index, dtype='int64').tofile(files[INDEX])
+
+                if not columns:
+                    for col in chunk.columns:
+                        numeric = pd.api.types.is_numeric_dtype(chunk[col]) and \
+                            not pd.api.types.is_bool_dtype(chunk[col])
+                        columns[col] = {'dtype': 'float64' if numeric else 'int32'}
+                        if not numeric:
+                            encodings[col] = {}
+                        open_column(col)
+                elif list(chunk.columns) != list(columns):
+                    raise ValueError('the chunks have different columns')
+
+                for col in chunk.columns:
+                    if col not in encodings:
+                        pd.to_numeric(chunk[col]).to_numpy(dtype='float64', na_value=np.nan)\
+                            .tofile(files[col])
+                        continue
+                    codes, uniques = pd.factorize(chunk[col])
+                    # The code -1 of the nulls points to the trailing -1
+                    mapping = np.array(
+                        [encodings[col].setdefault(u, len(encodings[col])) for u in uniques] +
+                        [-1],
+                        dtype='int32'
+                    )
+                    mapping[codes].tofile(files[col])
+
+                n_rows += len(chunk)
+        finally:
+            for f in files.values():
+                f.close()
+
+        for col, encoding in encodings.items():
+            columns[col]['categories'] = [
+                value.item() if isinstance(value, np.generic) else value
+                for value in encoding
+            ]
+
+        meta = {
+            'name': name,
+            'foreign_keys': [list(fk) for fk in foreign_keys or []],
+            'n_rows': n_rows,
+            'columns': columns
+        }
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, default=str)
+
+        return cls(directory)
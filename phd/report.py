@@ -0,0 +1,147 @@
+"""Introspection of the memory footprint and of the accuracy of fitted networks.
+
+The report of a network has one row per node, which describes the distribution of the node: the
+root Histogram, or the CPD conditioned on the parent of the node. The columns are:
+
+- `parent`: the parent of the node, None for the root.
+- `kind`: the class of the distribution.
+- `buckets`: the number of buckets stored, as counted by `phd.allocation.size`.
+- `bytes`: the memory used by the Python objects of the distribution.
+- `frozen_bytes`: the memory used by the arrays of the distribution in a frozen network.
+- `mcv_coverage`: the share of the non-null rows that fall in buckets which hold a single value.
+  The selectivity of these values is exact, whereas the other values are assumed to be uniform.
+- `fit_time`: the number of seconds it took to fit the distribution.
+
+If a held-out sample is provided, the selectivity of the most common values of each attribute in
+the sample is estimated with the network and compared to the true selectivity. The median and
+the maximum q-error are reported in the `median_q_error` and `max_q_error` columns.
+
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+from . import allocation
+
+
+COLUMNS = ['node', 'parent', 'kind', 'buckets', 'bytes', 'frozen_bytes', 'mcv_coverage',
+           'fit_time']
+
+
+def n_bytes(obj, seen=None):
+    """Returns the memory used by an object and by everything it references, in bytes."""
+
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(n_bytes(k, seen) + n_bytes(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(n_bytes(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += n_bytes(vars(obj), seen)
+
+    return size
+
+
+def mass(hist, single=False):
+    """Returns the total frequency of the buckets of a Histogram, or of its single-value ones."""
+    return float(sum(
+        b.frequency for b in hist.buckets
+        if not single or (b.left == b.right and b.cardinality == 1)
+    ))
+
+
+def mcv_coverage(dist):
+    """Returns the share of the non-null rows covered by the single-value buckets of the child.
+
+    For a CPD, the coverage of each histogram of the child is weighted by the frequency of the
+    parent bucket it is conditioned on.
+    """
+    if not hasattr(dist, 'on_hists'):
+        total = mass(dist)
+        return mass(dist, single=True) / total if total else 0.
+
+    weights = [float(b.frequency) for b in dist.by_hist.buckets]
+    total = sum(w * mass(h) for w, h in zip(weights, dist.on_hists))
+    single = sum(w * mass(h, single=True) for w, h in zip(weights, dist.on_hists))
+    return single / total if total else 0.
+
+
+def q_errors(network, node, values, max_values=30):
+    """Returns the q-errors of the estimated selectivities of the most common values."""
+    values = pd.Series(values)
+    n = len(values)
+    errors = []
+    for val, count in values.value_counts().head(max_values).items():
+        true = count / n
+        estimate = max(network.p(**{node: val}), 1. / n)
+        errors.append(max(estimate / true, true / estimate))
+    return errors
+
+
+def report(network, holdout=None, max_values=30):
+    """Returns a DataFrame which describes the distribution of each node of a BayesianNetwork.
+
+    Parameters:
+        network (phd.BayesianNetwork): A fitted network.
+        holdout (pandas.DataFrame): Rows which were not used to fit the network, optional.
+        max_values (int): The number of most common values of the holdout for which the
+            selectivity is checked.
+
+    """
+
+    frozen = network.freeze()
+    arrays = {
+        node: sum(arr.nbytes for arr in table) + sum(arr.nbytes for arr in link or ())
+        for node, table, link in zip(frozen.nodes, frozen.tables, frozen.links)
+    }
+    parents = {child: parent for parent, child in network.edges}
+    fit_times = getattr(network, 'fit_times_', {})
+
+    rows = []
+    for node in frozen.nodes:
+        dist = network.nodes[node]['dist']
+        row = {
+            'node': node,
+            'parent': parents.get(node),
+            'kind': type(dist).__name__,
+            'buckets': allocation.size(dist),
+            'bytes': n_bytes(dist),
+            'frozen_bytes': arrays[node],
+            'mcv_coverage': mcv_coverage(dist),
+            'fit_time': fit_times.get(node, np.nan)
+        }
+        if holdout is not None:
+            errors = (
+                q_errors(network, node, holdout[node], max_values)
+                if node in holdout.columns else []
+            )
+            row['median_q_error'] = np.median(errors) if errors else np.nan
+            row['max_q_error'] = max(errors) if errors else np.nan
+        rows.append(row)
+
+    columns = COLUMNS + (['median_q_error', 'max_q_error'] if holdout is not None else [])
+    return pd.DataFrame(rows, columns=columns).set_index('node')
+
+
+def report_recursive(network, holdouts=None, max_values=30):
+    """Returns the reports of the networks of a RecursiveBayesianNetwork, one after the other.
+
+    The rows are indexed by relation and by node. `holdouts` maps the name of a relation to its
+    held-out rows. The memory used by each relation is `.groupby(level='relation')['bytes'].sum()`.
+    """
+    holdouts = holdouts or {}
+    reports = {
+        name: report(bn, holdouts.get(name), max_values)
+        for name, bn in network.bns_.items()
+    }
+    reports = {name: r for name, r in reports.items() if len(r)}
+    if not reports:
+        return pd.DataFrame()
+    return pd.concat(reports, names=['relation', 'node'], sort=False)
@@ -0,0 +1,48 @@
+import unittest
+
+from phd import allocation
+from phd import bn
+from phd import rbn
+from phd.tests import test_factor
+from phd.tests import test_rbn
+
+
+class TestAllocate(unittest.TestCase):
+
+    def test_budget_is_respected(self):
+        relation = test_factor.make_correlated()
+        for budget in (20, 50, 200):
+            net = bn.BayesianNetwork(random_state=42, budget=budget).fit(relation.copy())
+            self.assertLessEqual(allocation.n_buckets(net), budget)
+
+    def test_budget_too_small(self):
+        relation = test_factor.make_correlated()
+        with self.assertRaises(ValueError):
+            bn.BayesianNetwork(random_state=42, budget=3).fit(relation.copy())
+
+    def test_no_more_buckets_than_values(self):
+        relation = test_factor.make_correlated()
+        net = bn.BayesianNetwork(random_state=42).fit(relation.copy())
+        sizes = allocation.allocate(relation, net, budget=100000)
+        for node, (m, n) in sizes.items():
+            self.assertLessEqual(m + n, relation[node].nunique() + 1)
+
+    def test_frequent_values_first(self):
+        attribute = allocation.Attribute([.5, .3, .1, .05, .05])
+        gains = dict(attribute.gains())
+        self.assertGreater(gains['m'], 0)
+        attribute.m = 5
+        self.assertEqual(dict(attribute.gains())['n'], 0)
+
+
+class TestSplit(unittest.TestCase):
+
+    def test_recursive_budget(self):
+        model = rbn.RecursiveBayesianNetwork(budget=600).fit(test_rbn.make_relations())
+        total = sum(allocation.n_buckets(net) for net in model.bns_.values())
+        self.assertLessEqual(total, 600)
+        self.assertAlmostEqual(
+            16 * model.p(['passengers', 'flights', 'routes'],
+                         passengers__nationality='Swedish', routes__origin='Stockholm'),
+            9.
+        )
@@ -1,7 +1,125 @@
 import unittest
 
 from phd import bn
+from phd import rel
+
+
+def make_passengers():
+    return rel.Relation(
+        name='passengers',
+        data={
+            'nationality': ('Swedish', 'Swedish', 'Swedish', 'Swedish', 'Swedish',
+                            'American', 'American', 'American', 'American', 'American'),
+            'gender': ('Male', 'Female', 'Male', 'Female', 'Female',
+                       'Male', 'Male', 'Female', 'Male', 'Female'),
+            'hair': ('Blond', 'Blond', 'Blond', 'Brown', 'Blond',
+                     'Brown', 'Dark', 'Brown', 'Brown', 'Blond')
+        }
+    )
 
 
 class TestChowLiu(unittest.TestCase):
     pass
+
+
+class TestUpdate(unittest.TestCase):
+
+    def assertSameDists(self, a, b):
+        self.assertEqual(set(a.nodes), set(b.nodes))
+        for node in a.nodes:
+            self.assertEqual(a.nodes[node]['dist'], b.nodes[node]['dist'])
+
+    def test_fit_computes_dists(self):
+        net = bn.BayesianNetwork().fit(make_passengers())
+        for node in net.nodes:
+            self.assertIn('dist', net.nodes[node])
+
+    def test_thread_backend(self):
+        sequential = bn.BayesianNetwork().fit(make_passengers())
+        parallel = bn.BayesianNetwork(n_jobs=2, backend='thread').fit(make_passengers())
+        self.assertSameDists(sequential, parallel)
+
+    def test_process_backend(self):
+        sequential = bn.BayesianNetwork().fit(make_passengers())
+        parallel = bn.BayesianNetwork(n_jobs=2, backend='process').fit(make_passengers())
+        self.assertSameDists(sequential, parallel)
+
+    def test_unknown_backend(self):
+        net = bn.BayesianNetwork(n_jobs=2, backend='gpu')
+        with self.assertRaises(ValueError):
+            net.fit(make_passengers())
+
+
+class TestPrecompute(unittest.TestCase):
+
+    def setUp(self):
+        self.bn = bn.BayesianNetwork().fit(make_passengers())
+        self.queries = [
+            {'nationality': 'Swedish'},
+            {'hair': 'Blond'},
+            {'nationality': 'Swedish', 'hair': 'Blond'},
+            {'gender': 'Female', 'hair': 'Dark'},
+            {'nationality': 'American', 'gender': 'Male'},
+            {'nationality': 'American', 'gender': 'Male', 'hair': 'Brown'},
+            {'hair': 'Red'}
+        ]
+        self.expected = [self.bn.p(**query) for query in self.queries]
+
+    def test_same_estimates(self):
+        self.bn.precompute(workload=self.queries)
+        for query, expected in zip(self.queries, self.expected):
+            self.assertAlmostEqual(self.bn.p(**query), expected)
+
+    def test_lookup(self):
+        self.bn.precompute(workload=self.queries)
+        self.assertIsNotNone(self.bn._lookup({'hair': 'Blond'}))
+        self.assertIsNotNone(self.bn._lookup({'nationality': 'Swedish', 'hair': 'Blond'}))
+        self.assertIsNone(self.bn._lookup({'hair': 'Red'}))
+        self.assertIsNone(self.bn._lookup(self.queries[5]))
+
+    def test_max_values(self):
+        self.bn.precompute(max_values=1)
+        for node in self.bn.nodes:
+            self.assertLessEqual(len(self.bn.precomputed_[node].values), 1)
+        for query, expected in zip(self.queries, self.expected):
+            self.assertAlmostEqual(self.bn.p(**query), expected)
+
+    def test_update_resets(self):
+        self.bn.precompute()
+        self.bn.update(make_passengers())
+        self.assertEqual(self.bn.precomputed_, {})
+
+
+class TestCopy(unittest.TestCase):
+
+    def setUp(self):
+        self.bn = bn.BayesianNetwork(budget=50).fit(make_passengers())
+        self.bn.precompute()
+        self.bn.warm_up([['nationality', 'hair']])
+
+    def test_copy(self):
+        copy = self.bn.copy()
+        self.assertEqual(copy.budget, 50)
+        self.assertEqual(set(copy.precomputed_), set(self.bn.precomputed_))
+        self.assertEqual(set(copy.steiner_trees_), set(self.bn.steiner_trees_))
+        self.assertIsNotNone(copy._lookup({'gender': 'Male', 'hair': 'Blond'}))
+        sparse = bn.BayesianNetwork(sparse=True).fit(make_passengers())
+        self.assertTrue(sparse.copy().sparse)
+        self.assertTrue(sparse.rename(str.upper).sparse)
+
+    def test_rename(self):
+        # The renaming swaps the order of the attributes of the pair
+        mapping = {'nationality': 'x.nationality', 'gender': 'z.gender', 'hair': 'a.hair'}
+        renamed = self.bn.rename(mapping)
+        self.assertEqual(renamed.budget, 50)
+        self.assertIn(frozenset(['x.nationality', 'a.hair']), renamed.steiner_trees_)
+        self.assertEqual(
+            set(renamed.precomputed_),
+            {'z.gender', 'a.hair', ('a.hair', 'z.gender')}
+        )
+        for gender in ('Male', 'Female'):
+            for hair in ('Blond', 'Brown', 'Dark'):
+                self.assertEqual(
+                    renamed._lookup({'z.gender': gender, 'a.hair': hair}),
+                    self.bn._lookup({'gender': gender, 'hair': hair})
+                )
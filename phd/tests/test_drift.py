@@ -0,0 +1,78 @@
+import unittest
+
+import pandas as pd
+
+from phd import drift
+from phd import rbn
+from phd.tests import test_bn
+from phd.tests import test_rbn
+
+
+class TestSummarize(unittest.TestCase):
+
+    def test_nulls(self):
+        summary = drift.summarize(pd.DataFrame({'x': ['a', 'a', 'b', None]}))['x']
+        self.assertEqual(summary.values, ['a', 'b'])
+        self.assertEqual(summary.freqs, [.5, .25])
+        self.assertEqual(summary.null_frac, .25)
+
+    def test_max_values(self):
+        summary = drift.summarize(pd.DataFrame({'x': [1, 1, 2, 3]}), max_values=1)['x']
+        self.assertEqual(summary.values, [1])
+
+
+class TestCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+
+    def test_no_drift(self):
+        report = self.model.check_drift({'passengers': test_bn.make_passengers()})
+        self.assertEqual(report.index.names, ['relation', 'attribute'])
+        self.assertEqual(len(report), 3)
+        for divergence in report['divergence']:
+            self.assertAlmostEqual(divergence, 0.)
+        self.assertEqual(self.model.refit_plan(report), [])
+
+    def test_drift(self):
+        passengers = test_bn.make_passengers()
+        passengers['nationality'] = 'American'
+        report = self.model.check_drift({'passengers': passengers})
+        self.assertAlmostEqual(report.loc[('passengers', 'nationality'), 'divergence'], .5)
+        self.assertTrue(report.loc[('passengers', 'nationality'), 'drifted'])
+        self.assertFalse(report.loc[('passengers', 'hair'), 'drifted'])
+        self.assertEqual(self.model.refit_plan(report), ['passengers', 'flights'])
+
+    def test_bn(self):
+        bn = self.model.bns_['routes']
+        routes = pd.DataFrame({'origin': ['Fresno'] * 4, 'minutes': [None] * 4})
+        report = bn.check_drift(routes, threshold=.4)
+        self.assertEqual(set(report.index), {'origin', 'minutes'})
+        self.assertAlmostEqual(report.loc['origin', 'divergence'], .5)
+        self.assertTrue(report.loc['minutes', 'drifted'])
+
+    def test_pg_stats_text(self):
+        # pg_stats gives the most common values of every attribute as text
+        routes = pd.DataFrame(test_rbn.make_relations()[1])
+        counts = routes['minutes'].value_counts(normalize=True)
+        summary = drift.Summary(
+            values=[str(val) for val in counts.index] + ['oops'],
+            freqs=counts.tolist() + [0.],
+            null_frac=float(routes['minutes'].isnull().mean())
+        )
+        report = self.model.check_drift({'routes': {'minutes': summary}})
+        self.assertAlmostEqual(report.loc[('routes', 'minutes'), 'divergence'], 0.)
+
+    def test_unknown_relation(self):
+        report = self.model.check_drift({'airports': test_bn.make_passengers()})
+        self.assertEqual(len(report), 0)
+        self.assertEqual(self.model.refit_plan(report), [])
+
+
+class TestRefitPlan(unittest.TestCase):
+
+    def test_transitive(self):
+        extensions = {'c': ['b', 'a'], 'b': ['a'], 'e': ['d']}
+        self.assertEqual(drift.refit_plan(extensions, ['a']), ['a', 'b', 'c'])
+        self.assertEqual(drift.refit_plan(extensions, ['b']), ['b', 'c'])
+        self.assertEqual(drift.refit_plan(extensions, ['c', 'd']), ['c', 'd', 'e'])
@@ -0,0 +1,81 @@
+import itertools
+import random
+import unittest
+
+from phd import bn
+from phd import rel
+from phd.tests import test_bn
+
+
+def make_correlated(n=500, seed=42):
+    """Returns a relation with low cardinality attributes, hence only most common values."""
+    rng = random.Random(seed)
+    a = [rng.randint(0, 9) for _ in range(n)]
+    b = [(x + rng.randint(0, 2)) % 7 for x in a]
+    c = [y * 2 + rng.randint(0, 1) for y in b]
+    d = [rng.choice('xyz') if y < 3 else 'w' for y in b]
+    return rel.Relation(name='correlated', data={'a': a, 'b': b, 'c': c, 'd': d})
+
+
+def make_numeric(n=2000, seed=0):
+    """Returns a relation with high cardinality attributes, hence equi-height range buckets."""
+    rng = random.Random(seed)
+    a = [rng.randint(0, 300) for _ in range(n)]
+    b = [x // 7 + rng.randint(0, 5) for x in a]
+    c = [y * 3 + rng.randint(0, 40) for y in b]
+    return rel.Relation(name='numeric', data={'a': a, 'b': b, 'c': c})
+
+
+class TestFactorEngine(unittest.TestCase):
+
+    def assertEnginesAgree(self, relation, queries):
+        histogram = bn.BayesianNetwork(random_state=42).fit(relation.copy())
+        factor = bn.BayesianNetwork(random_state=42, engine='factor').fit(relation.copy())
+        for query in queries:
+            self.assertAlmostEqual(factor.p(**query), histogram.p(**query), places=10)
+
+    def test_passengers(self):
+        relation = test_bn.make_passengers()
+        queries = [
+            {'nationality': 'Swedish'},
+            {'nationality': 'Swedish', 'hair': 'Blond'},
+            {'gender': 'Male', 'hair': 'Brown'},
+            {'nationality': 'American', 'gender': 'Female', 'hair': 'Dark'},
+            {'hair': 'Red'}
+        ]
+        self.assertEnginesAgree(relation, queries)
+
+    def test_correlated(self):
+        relation = make_correlated()
+        values = {col: sorted(set(relation[col])) for col in relation.columns}
+        queries = []
+        for r in range(1, 4):
+            for cols in itertools.combinations(sorted(values), r):
+                for vals in itertools.islice(itertools.product(*(values[c] for c in cols)), 20):
+                    queries.append(dict(zip(cols, vals)))
+        self.assertEnginesAgree(relation, queries)
+
+    def test_range_buckets(self):
+        relation = make_numeric()
+        net = bn.BayesianNetwork(random_state=42).fit(relation.copy())
+        self.assertTrue(any(b.cardinality > 1 for b in net.nodes[net.root]['dist'].buckets))
+        rng = random.Random(42)
+        queries = []
+        for _ in range(200):
+            query = {'a': rng.randint(0, 300), 'b': rng.randint(0, 50)}
+            if rng.random() < .5:
+                query['c'] = rng.randint(0, 200)
+            queries.append(query)
+        queries += [{'b': 20}, {'c': 90}, {'a': 150, 'c': 90}]
+        self.assertEnginesAgree(relation, queries)
+
+    def test_unknown_engine(self):
+        net = bn.BayesianNetwork(engine='magic').fit(test_bn.make_passengers())
+        with self.assertRaises(ValueError):
+            net.p(hair='Blond')
+
+    def test_refit_resets_factors(self):
+        net = bn.BayesianNetwork(engine='factor').fit(test_bn.make_passengers())
+        before = net.p(hair='Blond')
+        net.update(test_bn.make_passengers().iloc[:5])
+        self.assertNotEqual(net.p(hair='Blond'), before)
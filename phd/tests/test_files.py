@@ -0,0 +1,162 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from phd import files
+from phd import rbn
+from phd.tests import test_rbn
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FOREIGN_KEYS = os.path.join(HERE, '..', '..', 'job', 'foreign_keys.sql')
+
+SCHEMA = '''
+CREATE TABLE passengers (
+    id integer NOT NULL PRIMARY KEY,
+    nationality character varying(32),
+    gender character varying(6),
+    hair character varying(5)
+);
+CREATE TABLE routes (
+    id integer NOT NULL PRIMARY KEY,
+    origin character varying(32),
+    destination character varying(32),
+    minutes numeric(6, 2)
+);
+CREATE TABLE flights (
+    id integer NOT NULL PRIMARY KEY,
+    passenger_id integer NOT NULL,
+    route_id integer NOT NULL
+);
+'''
+
+FLIGHTS_KEYS = '''
+-- Both keys are declared in one statement
+ALTER TABLE flights
+ADD FOREIGN KEY (passenger_id) REFERENCES passengers(id),
+ADD FOREIGN KEY (route_id) REFERENCES routes(id);
+'''
+
+
+class TestSchema(unittest.TestCase):
+
+    def test_read_foreign_keys(self):
+        foreign_keys = files.read_foreign_keys(FOREIGN_KEYS)
+        self.assertEqual(
+            sorted((fk.from_col, fk.to_rel, fk.to_col) for fk in foreign_keys['cast_info']),
+            [('movie_id', 'title', 'id'), ('person_id', 'name', 'id'),
+             ('person_role_id', 'char_name', 'id'), ('role_id', 'role_type', 'id')]
+        )
+        self.assertIn(
+            ('episode_of_id', 'aka_title', 'id'),
+            [(fk.from_col, fk.to_rel, fk.to_col) for fk in foreign_keys['aka_title']]
+        )
+
+    def test_read_column_names(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schema.sql')
+            with open(path, 'w') as f:
+                f.write(SCHEMA)
+            names = files.read_column_names(path)
+        self.assertEqual(names['routes'], ['id', 'origin', 'destination', 'minutes'])
+        self.assertEqual(names['flights'], ['id', 'passenger_id', 'route_id'])
+
+
+class TestSample(unittest.TestCase):
+
+    def test_sample(self):
+        frame = pd.DataFrame({'x': range(1000), 'y': range(1000, 2000)})
+        chunks = (frame[i:i + 64] for i in range(0, len(frame), 64))
+        sample, n_rows = files.sample(chunks, max_rows=100, random_state=42)
+        self.assertEqual(n_rows, 1000)
+        self.assertEqual(len(sample), 100)
+        self.assertTrue(sample['x'].is_monotonic_increasing)
+        self.assertTrue((sample['y'] - sample['x'] == 1000).all())
+
+    def test_small(self):
+        frame = pd.DataFrame({'x': range(10)})
+        sample, n_rows = files.sample([frame[:4], frame[4:]], max_rows=100)
+        self.assertEqual(sample['x'].tolist(), list(range(10)))
+        self.assertEqual(n_rows, 10)
+
+
+def write_files(directory):
+    """Writes the relations of `test_rbn` to headerless CSV files, along with their schema."""
+    paths = {}
+    for relation in test_rbn.make_relations():
+        paths[relation.name] = os.path.join(directory, f'{relation.name}.csv')
+        frame = pd.DataFrame(relation).rename_axis('id').reset_index()
+        frame.to_csv(paths[relation.name], header=False, index=False)
+    for name, content in (('schema.sql', SCHEMA), ('fkeys.sql', FLIGHTS_KEYS)):
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(content)
+    return paths
+
+
+class TestFitFiles(unittest.TestCase):
+
+    def test_same_as_fit(self):
+        expected = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_files(directory)
+            model = rbn.RecursiveBayesianNetwork().fit_files(
+                paths=paths,
+                foreign_keys=os.path.join(directory, 'fkeys.sql'),
+                names=os.path.join(directory, 'schema.sql'),
+                chunksize=4
+            )
+
+        self.assertEqual(model.sizes_, {'passengers': 10, 'routes': 6, 'flights': 16})
+        self.assertEqual(model.extensions_['flights'], ['passengers', 'routes'])
+        queries = [
+            (['passengers', 'flights', 'routes'],
+             {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}),
+            (['passengers'], {'nationality': 'Swedish', 'hair': 'Blond'}),
+            (['flights', 'routes'], {'routes__origin': 'Fresno'})
+        ]
+        for relation_names, query in queries:
+            self.assertAlmostEqual(
+                model.p(relation_names, **query),
+                expected.p(relation_names, **query)
+            )
+
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_files(directory)
+            checkpoint = os.path.join(directory, 'checkpoint')
+
+            def fit():
+                sample = files.sample
+                sampled = []
+
+                def spy(chunks, max_rows, random_state=None):
+                    sampled.append(len(sampled))
+                    return sample(chunks, max_rows, random_state)
+
+                with mock.patch.object(files, 'sample', spy):
+                    model = rbn.RecursiveBayesianNetwork().fit_files(
+                        paths=paths,
+                        foreign_keys=os.path.join(directory, 'fkeys.sql'),
+                        names=os.path.join(directory, 'schema.sql'),
+                        checkpoint=checkpoint
+                    )
+                return model, len(sampled)
+
+            expected, n_sampled = fit()
+            self.assertEqual(n_sampled, 3)
+            model, n_sampled = fit()
+            self.assertEqual(n_sampled, 0)
+            self.assertEqual(model.sizes_, expected.sizes_)
+            self.assertEqual(model.extensions_, expected.extensions_)
+
+            # Rewriting the routes invalidates the flights, which reference them
+            frame = pd.read_csv(paths['routes'], header=None)
+            frame.iloc[0, 3] = 516
+            frame.to_csv(paths['routes'], header=False, index=False)
+            os.utime(paths['routes'], ns=(0, 0))
+            _, n_sampled = fit()
+            self.assertEqual(n_sampled, 2)
@@ -0,0 +1,305 @@
+from concurrent import futures
+import copy
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from phd import bn
+from phd import factor
+from phd import frozen
+from phd import op
+from phd import rbn
+from phd.tests import test_bn
+from phd.tests import test_rbn
+
+
+QUERIES = [
+    {'nationality': 'Swedish'},
+    {'hair': 'Blond'},
+    {'nationality': 'Swedish', 'hair': 'Blond'},
+    {'nationality': 'American', 'gender': 'Male', 'hair': 'Brown'},
+    {'gender': 'Female', 'hair': 'Dark'},
+    {'hair': 'Red'}
+]
+
+
+class TestFrozenBayesianNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.bn = bn.BayesianNetwork().fit(test_bn.make_passengers())
+        self.frozen = self.bn.freeze()
+
+    def test_root_first(self):
+        self.assertEqual(self.frozen.nodes[0], self.bn.root)
+
+    def test_p(self):
+        for query in QUERIES:
+            self.assertAlmostEqual(self.frozen.p(**query), self.bn.p(**query))
+
+    def test_p_many(self):
+        self.assertEqual(self.frozen.p_many(QUERIES), [self.frozen.p(**q) for q in QUERIES])
+
+    def test_predicates(self):
+        for condition in (op.In(['Blond', 'Dark']), op.Not('Blond'), ['Blond']):
+            with self.assertRaises(ValueError):
+                self.frozen.p(hair=condition)
+            with self.assertRaises(ValueError):
+                factor.FactorGraph(self.frozen).infer({'hair': condition})
+
+    def test_arrays_are_readonly(self):
+        for table in self.frozen.tables:
+            for arr in table:
+                self.assertFalse(arr.flags.writeable)
+
+    def test_infer_leaves_dists_untouched(self):
+        dists = {node: copy.copy(self.bn.nodes[node]['dist']) for node in self.bn.nodes}
+        for query in QUERIES:
+            self.bn.p(**query)
+        for node, dist in dists.items():
+            self.assertEqual(self.bn.nodes[node]['dist'], dist)
+
+    def test_concurrent_p(self):
+        expected = self.frozen.p_many(QUERIES)
+        with futures.ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: self.frozen.p_many(QUERIES), range(200)))
+        for result in results:
+            self.assertEqual(result, expected)
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npz')
+            frozen.save(self.frozen, path)
+            loaded = frozen.load(path)
+        self.assertEqual(loaded.nodes, self.frozen.nodes)
+        self.assertEqual(loaded.p_many(QUERIES), self.frozen.p_many(QUERIES))
+        for table in loaded.tables:
+            for arr in table:
+                self.assertFalse(arr.flags.writeable)
+
+
+class TestFrozenRecursiveBayesianNetwork(unittest.TestCase):
+
+    def test_p(self):
+        model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+        frozen = model.freeze()
+        queries = [
+            (['passengers', 'flights', 'routes'],
+             {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}),
+            (['passengers'], {'nationality': 'Swedish', 'hair': 'Blond'}),
+            (['flights', 'routes'], {'routes__origin': 'Fresno'})
+        ]
+        for relation_names, query in queries:
+            self.assertAlmostEqual(
+                frozen.p(relation_names, **query),
+                model.p(relation_names, **query)
+            )
+
+    def test_qualified_attributes(self):
+        model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+        frozen = model.freeze()
+        queries = [
+            (['passengers'], {'passengers__nationality': 'Swedish'}),
+            (['passengers'], {'nationality': 'Swedish'}),
+            (['flights', 'passengers'], {'passengers__hair': 'Blond', 'flights__x': 1}),
+            (['flights', 'routes'], {'routes.origin': 'Fresno'})
+        ]
+        for relation_names, query in queries:
+            self.assertAlmostEqual(
+                frozen.p(relation_names, **query),
+                model.p(relation_names, **query)
+            )
+            self.assertAlmostEqual(
+                frozen.p_many(relation_names, [query])[0],
+                model.p(relation_names, **query)
+            )
+
+    def test_linked_once(self):
+        frozen = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations()).freeze()
+        relation_names = ['passengers', 'flights', 'routes']
+        query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        p = frozen.p(relation_names, **query)
+        linked = frozen.link(relation_names)
+        self.assertEqual(frozen.p(relation_names[::-1], **query), p)
+        self.assertEqual(frozen.p_many(relation_names, [query]), [p])
+        self.assertEqual(len(frozen.linked), 1)
+        for bn, other in zip(frozen.link(relation_names), linked):
+            self.assertIs(bn, other)
+
+    def test_save_load(self):
+        model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations()).freeze()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npz')
+            frozen.save(model, path)
+            loaded = frozen.load(path)
+        self.assertEqual(loaded.extensions, model.extensions)
+        relation_names = ['passengers', 'flights', 'routes']
+        query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        self.assertEqual(loaded.p(relation_names, **query), model.p(relation_names, **query))
+
+
+class TestQuantize(unittest.TestCase):
+
+    def setUp(self):
+        self.model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+        self.queries = [
+            (['passengers', 'flights', 'routes'],
+             {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}),
+            (['passengers'], {'nationality': 'Swedish', 'hair': 'Blond'}),
+            (['flights', 'routes'], {'routes__minutes': 830}),
+            (['routes'], {'minutes': 45})
+        ]
+
+    def test_error_bound(self):
+        exact = self.model.freeze()
+        errors = []
+        for bits in (4, 8, 16):
+            quantized, error = frozen.quantize(self.model, bits=bits)
+            errors.append(error)
+            for relation_names, query in self.queries:
+                p = exact.p(relation_names, **query)
+                self.assertLessEqual(
+                    abs(quantized.p(relation_names, **query) - p),
+                    error * p + 1e-12
+                )
+        self.assertGreater(errors[0], errors[1])
+        self.assertGreater(errors[1], errors[2])
+        self.assertLess(errors[2], 1e-3)
+
+    def test_save_load(self):
+        model = self.model.freeze()
+        quantized, error = frozen.quantize(model, bits=12)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npz')
+            frozen.save(model, path)
+            compressed = os.path.join(directory, 'compressed.npz')
+            self.assertEqual(frozen.save(model, compressed, bits=12), error)
+            self.assertLess(os.path.getsize(compressed), os.path.getsize(path))
+            loaded = frozen.load(compressed)
+        for relation_names, query in self.queries:
+            self.assertEqual(
+                loaded.p(relation_names, **query),
+                quantized.p(relation_names, **query)
+            )
+        # The bounds are restored exactly
+        for name, bn in model.bns.items():
+            for table, other in zip(bn.tables, loaded.bns[name].tables):
+                for field in ('lefts', 'rights', 'by_lefts', 'by_rights', 'cards'):
+                    self.assertEqual(getattr(table, field).dtype, getattr(other, field).dtype)
+                    self.assertEqual(getattr(table, field).tolist(), getattr(other, field).tolist())
+                self.assertFalse(other.freqs.flags.writeable)
+
+    def test_resident(self):
+        model = self.model.freeze()
+        quantized, _ = frozen.quantize(model, bits=8)
+        self.assertLess(quantized.nbytes, model.nbytes)
+        table = quantized.bns['routes'].tables[1]
+        self.assertIsInstance(table, frozen.CompressedTable)
+        self.assertNotIn('freqs', table.arrays)
+        self.assertEqual(table.arrays['freqs:codes'].dtype, np.uint8)
+        self.assertFalse(table.freqs.flags.writeable)
+        self.assertEqual(table.lefts.tolist(), model.bns['routes'].tables[1].lefts.tolist())
+        # The factor engine works on the decoded tables
+        net = quantized.bns['routes']
+        self.assertAlmostEqual(factor.FactorGraph(net).infer({'minutes': 45}), net.p(minutes=45))
+
+    def test_bits(self):
+        with self.assertRaises(ValueError):
+            frozen.quantize(self.model, bits=1)
+
+
+def p_from_shared(name, relation_names, query):
+    with frozen.attach(name) as shared:
+        return shared.model.p(relation_names, **query)
+
+
+class TestSharedMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations()).freeze()
+        self.relation_names = ['passengers', 'flights', 'routes']
+        self.query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+
+    def test_attach(self):
+        with frozen.share(self.model) as published:
+            with frozen.attach(published.name) as shared:
+                self.assertEqual(
+                    shared.model.p(self.relation_names, **self.query),
+                    self.model.p(self.relation_names, **self.query)
+                )
+                table = shared.model.bns['passengers'].tables[0]
+                self.assertFalse(table.freqs.flags.writeable)
+                self.assertFalse(table.freqs.flags.owndata)
+
+    def test_workers(self):
+        expected = self.model.p(self.relation_names, **self.query)
+        context = multiprocessing.get_context('spawn')
+        with frozen.share(self.model) as published:
+            with context.Pool(2) as pool:
+                results = pool.starmap(
+                    p_from_shared,
+                    [(published.name, self.relation_names, self.query)] * 4
+                )
+        self.assertEqual(results, [expected] * 4)
+
+    def test_tracker_untouched(self):
+        from multiprocessing import resource_tracker, shared_memory
+        register = resource_tracker.register
+        with frozen.share(self.model) as published:
+            with frozen.attach(published.name):
+                self.assertIs(shared_memory.resource_tracker, resource_tracker)
+                self.assertIs(resource_tracker.register, register)
+        # Only the block which is attached is skipped
+        registered = []
+        tracker = mock.Mock(register=lambda name, rtype: registered.append(name))
+        untracked = frozen.UntrackedBlock(tracker, 'psm_1')
+        untracked.register('/psm_1', 'shared_memory')
+        untracked.register('/psm_2', 'shared_memory')
+        untracked.unregister('/psm_2', 'shared_memory')
+        self.assertEqual(registered, ['/psm_2'])
+        tracker.unregister.assert_called_once_with('/psm_2', 'shared_memory')
+
+    def test_object_arrays(self):
+        net = bn.BayesianNetwork().fit(test_bn.make_passengers()).freeze()
+        tables = [t._replace(lefts=t.lefts.astype(object)) for t in net.tables]
+        net = frozen.FrozenBayesianNetwork(net.nodes, net.parents, tables, net.links)
+        with self.assertRaises(ValueError):
+            frozen.share(net)
+
+
+class TestImport(unittest.TestCase):
+
+    def run_python(self, code):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.environ.get('PYTHONPATH', '')]))
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                env=env, check=True)
+        return output.stdout.strip().splitlines()
+
+    def test_frozen_only_needs_numpy(self):
+        heavy, duration = self.run_python(
+            'import sys, time\n'
+            'tic = time.perf_counter()\n'
+            'from phd import frozen\n'
+            'toc = time.perf_counter()\n'
+            'print(sorted(m for m in ("pandas", "networkx", "sklearn", "sqlalchemy") '
+            'if m in sys.modules))\n'
+            'print(toc - tic)'
+        )
+        self.assertEqual(heavy, '[]')
+        self.assertLess(float(duration), 1.)
+
+    def test_lazy_package(self):
+        before, after = self.run_python(
+            'import sys\n'
+            'import phd\n'
+            'print("networkx" in sys.modules)\n'
+            'phd.BayesianNetwork\n'
+            'print("networkx" in sys.modules)'
+        )
+        self.assertEqual((before, after), ('False', 'True'))
@@ -0,0 +1,105 @@
+import math
+import unittest
+
+import numpy as np
+
+from phd import bucket
+from phd import cpd
+from phd import histogram
+from phd import lookup
+from phd import null
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        # 13 is a most common value that lies within the [11, 15] equi-height bucket
+        self.lefts = [0, 4, 7, 11, 13, 16]
+        self.rights = [3, 4, 10, 15, 13, 20]
+        self.index = lookup.Index(self.lefts, self.rights)
+
+    def test_locate(self):
+        values = [0, 3, 4, 5, 8, 11, 12, 13, 15, 16, 20, 21, -1]
+        expected = [0, 0, 1, -1, 2, 3, 3, 4, 3, 5, 5, -1, -1]
+        indexes, nulls = self.index.locate(values)
+        self.assertEqual(indexes.tolist(), expected)
+        self.assertFalse(nulls.any())
+
+    def test_locate_one(self):
+        values = [0, 3, 4, 5, 8, 11, 12, 13, 15, 16, 20, 21, -1]
+        indexes, _ = self.index.locate(values)
+        self.assertEqual([self.index.locate_one(v) for v in values], indexes.tolist())
+
+    def test_nulls(self):
+        indexes, nulls = self.index.locate([1, None, math.nan, null.Null(), 13])
+        self.assertEqual(indexes.tolist(), [0, -1, -1, -1, 4])
+        self.assertEqual(nulls.tolist(), [False, True, True, True, False])
+
+    def test_strings(self):
+        index = lookup.Index(['a', 'c', 'd'], ['b', 'c', 'f'])
+        indexes, _ = index.locate(['a', 'ab', 'c', 'e', 'g'])
+        self.assertEqual(indexes.tolist(), [0, 0, 1, 2, -1])
+
+    def test_mixed_types(self):
+        with self.assertRaises(TypeError):
+            self.index.locate(['a'])
+
+    def test_empty(self):
+        indexes, _ = lookup.Index([], []).locate([1, 2])
+        self.assertEqual(indexes.tolist(), [-1, -1])
+
+
+class TestHistogramLookup(unittest.TestCase):
+
+    def test_lookup(self):
+        values = [1, 1, 1, 2, 2, 3, 4, 5, 6, None]
+        hist = histogram.Histogram(2, 2).fit(values)
+        indexes, probas = hist.lookup([1, 3, 6, 42, None])
+        for i, val in enumerate([1, 3, 6, 42, None]):
+            self.assertAlmostEqual(probas[i], float(hist.p(val)))
+            self.assertEqual(indexes[i], hist.find_bucket(val)[0])
+
+    def test_mcv_within_range(self):
+        hist = histogram.new_histogram([
+            bucket.Bucket(0, 10, 0.5, 5),
+            bucket.Bucket(3, 3, 0.3, 1),
+            bucket.Bucket(11, 13, 0.2, 3)
+        ])
+        self.assertEqual(hist.find_bucket(3)[0], 1)
+        self.assertEqual(hist.find_bucket(13)[0], 2)
+        self.assertAlmostEqual(float(hist.p(7)), 0.1)
+
+    def test_index_is_reset(self):
+        hist = histogram.Histogram(1, 1).fit([1, 1, 2])
+        self.assertEqual(hist.find_bucket(3)[0], -1)
+        hist.buckets = hist.buckets + [bucket.Bucket(3, 3, 0, 1)]
+        self.assertEqual(hist.find_bucket(3)[0], 2)
+
+
+class TestGroupBy(unittest.TestCase):
+
+    def test_group_by(self):
+        by = [1, 5, None, 1, 9, 5]
+        on = ['a', 'b', 'c', 'd', 'e', 'f']
+        by_hist = histogram.Histogram(1, 2).fit(by)
+        groups = cpd.group_by(by_hist, by, on)
+        self.assertEqual(groups[None], ['c'])
+        self.assertEqual(sorted(v for i in range(len(by_hist)) for v in groups[i]),
+                         ['a', 'b', 'd', 'e', 'f'])
+        for i, values in groups.items():
+            if i is not None:
+                for val in values:
+                    self.assertEqual(by_hist.find_bucket(by[on.index(val)])[0], i)
+
+    def test_cpd_rows_are_aligned(self):
+        rng = np.random.RandomState(42)
+        by = rng.randint(0, 30, 500).tolist()
+        on = [b % 7 for b in by]
+        c = cpd.CPD(5, 5, 7, 0).fit(by, on)
+        self.assertEqual(len(c.on_hists), len(c.by_hist))
+        for val in set(by):
+            self.assertGreater(c.p(val, val % 7), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from phd import bn
+from phd import cpd
+from phd import histogram
+from phd import op
+from phd import rbn
+from phd import rel
+from phd.tests import test_bn
+from phd.tests import test_rbn
+
+
+class TestPredicates(unittest.TestCase):
+
+    def test_in(self):
+        hist = histogram.Histogram(1, 1).fit([1, 1, 2, 3, None])
+        self.assertAlmostEqual(float(hist.p(op.In([1, 2]))), float(hist.p(1) + hist.p(2)))
+        self.assertAlmostEqual(float(hist.p(op.In([1, None]))), .6)
+        self.assertEqual(float(hist.p(op.In([5]))), 0.)
+
+    def test_or(self):
+        hist = histogram.Histogram(1, 1).fit([1, 1, 2, 3])
+        self.assertEqual(op.Or(op.Or(1, 2), 3), op.Or(1, 2, 3))
+        self.assertAlmostEqual(float(hist.p(op.Or(1, 2))), float(hist.p(op.In([1, 2]))))
+
+    def test_not(self):
+        hist = histogram.Histogram(1, 1).fit([1, 1, 2, 3, None])
+        self.assertAlmostEqual(float(hist.p(op.Not(1)) + hist.p(1)), 1.)
+        self.assertAlmostEqual(float(hist.p(op.Not(op.In([1, None])))), .4)
+
+    def test_sparse(self):
+        by = ['a', 'a', 'a', 'b', 'b', 'b', 'c', 'c']
+        on = [1, 2, 2, 3, 3, None, 1, 4]
+        dense = cpd.CPD(3, 0, 4, 0).fit(by, on)
+        sparse = cpd.SparseCPD(3, 0, 4, 0).fit(by, on)
+        for condition in [op.In([1, 3]), op.Not(2), op.Or(None, 4)]:
+            for b1, b2 in zip(dense.p_by(condition).buckets, sparse.p_by(condition).buckets):
+                self.assertAlmostEqual(float(b1.frequency), float(b2.frequency))
+
+    def test_mixed(self):
+        with self.assertRaises(ValueError):
+            op.Or({'a': 1}, 2)
+        with self.assertRaises(ValueError):
+            histogram.Histogram(1, 1).fit([1]).p(op.Or({'a': 1}))
+
+
+class TestTerms(unittest.TestCase):
+
+    def test_single_attributes(self):
+        # The operands on the same attribute are merged before inclusion–exclusion
+        terms = op.terms([op.Or({'a': 1}, {'b': 2}, {'a': 3}, {'c': 4})], {'d': 5})
+        self.assertEqual(len(terms), 7)
+        self.assertEqual(terms[0], (1, {'d': 5, 'a': op.In([1, 3])}))
+        self.assertEqual(terms[-1], (1, {'d': 5, 'a': op.In([1, 3]), 'b': 2, 'c': 4}))
+        self.assertEqual(op.terms([op.Or({'a': 1}, {'a': 2})], {}), [(1, {'a': op.In([1, 2])})])
+
+    def test_inclusion_exclusion(self):
+        terms = op.terms([op.Or({'a': 1, 'b': 2}, {'a': 1, 'c': 3})], {})
+        self.assertEqual(
+            terms,
+            [(1, {'a': 1, 'b': 2}), (1, {'a': 1, 'c': 3}), (-1, {'a': 1, 'b': 2, 'c': 3})]
+        )
+
+    def test_merged(self):
+        # The conjunction of an Or with itself yields the same queries several times
+        terms = op.terms([op.Or({'a': 1}), op.Or({'a': 1})], {})
+        self.assertEqual(terms, [(1, {'a': 1})])
+
+
+class TestP(unittest.TestCase):
+
+    def setUp(self):
+        self.passengers = pd.DataFrame(test_bn.make_passengers())
+        self.bn = bn.BayesianNetwork().fit(test_bn.make_passengers())
+
+    def test_single_attribute(self):
+        self.assertAlmostEqual(
+            self.bn.p(hair=op.Or('Blond', 'Brown'), nationality='Swedish'),
+            self.bn.p(hair='Blond', nationality='Swedish') +
+            self.bn.p(hair='Brown', nationality='Swedish')
+        )
+
+    def test_across_attributes(self):
+        p = self.bn.p(op.Or({'hair': 'Blond'}, {'hair': 'Dark'}, {'gender': 'Male'}))
+        truth = (self.passengers['hair'].isin(['Blond', 'Dark']) |
+                 (self.passengers['gender'] == 'Male')).mean()
+        self.assertAlmostEqual(p, truth)
+
+    def test_inclusion_exclusion(self):
+        disjunction = op.Or(
+            {'hair': 'Blond', 'gender': 'Female'},
+            {'gender': 'Male', 'nationality': 'American'}
+        )
+        self.assertAlmostEqual(
+            self.bn.p(disjunction),
+            self.bn.p(hair='Blond', gender='Female') +
+            self.bn.p(gender='Male', nationality='American')
+        )
+
+    def test_p_many(self):
+        queries = [
+            {'hair': 'Blond', 'gender': 'Male'},
+            {'hair': 'Blond', 'gender': 'Female'},
+            {'nationality': 'Swedish', 'gender': op.Not('Male')}
+        ]
+        for query, p in zip(queries, self.bn.p_many(queries)):
+            self.assertAlmostEqual(p, self.bn.p(**query))
+
+    def test_recursive(self):
+        model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+        tables = ['flights', 'passengers', 'routes']
+        self.assertAlmostEqual(
+            model.p(tables, op.Or({'passengers__hair': 'Blond'}, {'routes__origin': 'Fresno'})),
+            model.p(tables, passengers__hair='Blond') +
+            model.p(tables, routes__origin='Fresno') -
+            model.p(tables, passengers__hair='Blond', routes__origin='Fresno')
+        )
+
+
+class TestNulls(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        a = rng.randint(1, 5, 500).astype(float)
+        a[rng.rand(500) < .2] = np.nan
+        self.frame = pd.DataFrame({'a': a, 'b': rng.randint(1, 4, 500)})
+        self.bn = bn.BayesianNetwork().fit(rel.Relation(self.frame, name='r'))
+
+    def test_single_attribute(self):
+        p = self.bn.p(op.Or({'a': 1.}, {'a': 2.}))
+        self.assertAlmostEqual(p, self.bn.p(a=op.In([1., 2.])))
+        self.assertAlmostEqual(p, self.frame['a'].isin([1., 2.]).mean())
+
+    def test_across_attributes(self):
+        p = self.bn.p(op.Or({'a': 1.}, {'b': 2}))
+        self.assertAlmostEqual(
+            p,
+            self.bn.p(a=1.) + self.bn.p(b=2) - self.bn.p(a=1., b=2)
+        )
+        self.assertGreaterEqual(p, max(self.bn.p(a=1.), self.bn.p(b=2)))
+        self.assertLessEqual(p, 1.)
+
+    def test_p_many(self):
+        # Each query is answered with its own Steiner tree
+        queries = [{'a': 1.}, {'b': 2}, {'a': 1., 'b': 2}]
+        for query, p in zip(queries, self.bn.p_many(queries)):
+            self.assertAlmostEqual(p, self.bn.p(**query))
@@ -0,0 +1,471 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from phd import bn
+from phd import rbn
+from phd import rel
+from phd.tests import test_bn
+
+
+def make_relations():
+    passengers = test_bn.make_passengers()
+    routes = rel.Relation(
+        name='routes',
+        data={
+            'origin': ['Stockholm', 'Stockholm', 'Stockholm', 'Fresno', 'Fresno', 'Fresno'],
+            'destination': ['Boston', 'San Francisco', 'New-York', 'Seattle', 'San Francisco',
+                            'Portland'],
+            'minutes': [515, 830, 515, 130, 60, 110],
+        }
+    )
+    flights = rel.Relation(
+        name='flights',
+        data={
+            'passenger_id': [0, 0, 0, 1, 1, 1, 2, 3, 4, 5, 5, 6, 7, 7, 8, 9],
+            'route_id': [0, 1, 2, 0, 1, 2, 2, 0, 1, 3, 5, 3, 3, 5, 4, 4]
+        },
+        foreign_keys=[
+            ('passenger_id', 'passengers'),
+            ('route_id', 'routes')
+        ]
+    )
+    return [passengers, routes, flights]
+
+
+class TestLink(unittest.TestCase):
+
+    def test_cached(self):
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        linked = model.link(['flights', 'passengers'])
+        self.assertIs(model.link(['passengers', 'flights']), linked)
+
+    def test_originals_untouched(self):
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        n_nodes = model.bns_['flights'].number_of_nodes()
+        linked, = model.link(['flights', 'passengers', 'routes'])
+        self.assertGreater(linked.number_of_nodes(), n_nodes)
+        self.assertEqual(model.bns_['flights'].number_of_nodes(), n_nodes)
+
+    def test_bounded(self):
+        model = rbn.RecursiveBayesianNetwork(cache_size=2).fit(make_relations())
+        model.link(['passengers'])
+        model.link(['routes'])
+        model.link(['passengers'])
+        model.link(['flights'])
+        self.assertEqual(
+            list(model.linked_.keys()),
+            [frozenset(['passengers']), frozenset(['flights'])]
+        )
+
+    def test_p_uses_cache(self):
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        tables = ['passengers', 'flights', 'routes']
+        query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        first = model.p(tables, **query)
+        self.assertIn(frozenset(tables), model.linked_)
+        self.assertEqual(model.p(tables, **query), first)
+        self.assertAlmostEqual(16 * first, 9.)
+
+    def test_warm_up_file(self):
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'workload.txt')
+            with open(path, 'w') as f:
+                f.write('# Relation sets\n')
+                f.write('flights, passengers\n')
+                f.write('\n')
+                f.write('flights,routes,passengers\n')
+            model.warm_up(path)
+        self.assertEqual(
+            set(model.linked_.keys()),
+            {frozenset(['flights', 'passengers']), frozenset(['flights', 'routes', 'passengers'])}
+        )
+
+    def test_warm_up_attributes(self):
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        tables = ['passengers', 'flights', 'routes']
+        query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        expected = model.p(tables, **query)
+
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        model.warm_up([(tables, list(query))])
+        linked, = model.linked_[frozenset(tables)]
+        self.assertIn(frozenset(['passengers.nationality', 'routes.origin']), linked.steiner_trees_)
+        self.assertEqual(model.p(tables, **query), expected)
+
+    def test_qualified_attributes(self):
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        self.assertEqual(
+            model.p(['passengers'], passengers__hair='Blond'),
+            model.p(['passengers'], hair='Blond')
+        )
+        # The attributes of the relation a network was fitted on are bare nodes
+        tables = ['flights', 'passengers']
+        (bn, query), = model.localize(tables, {'passengers.hair': 'Blond', 'flights.x': 1})
+        self.assertEqual(query, {'passengers.hair': 'Blond'})
+        (bn, query), = model.localize(['passengers'], {'passengers.hair': 'Blond'})
+        self.assertEqual(query, {'hair': 'Blond'})
+
+    def test_no_cache(self):
+        model = rbn.RecursiveBayesianNetwork(cache_size=0).fit(make_relations())
+        expected = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        tables = ['flights', 'passengers', 'routes']
+        query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        self.assertEqual(model.p(tables, **query), expected.p(tables, **query))
+        self.assertEqual(
+            model.p(['passengers'], passengers__hair='Blond'),
+            expected.p(['passengers'], passengers__hair='Blond')
+        )
+        self.assertFalse(model.linked_)
+
+    def test_save_load(self):
+        model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        tables = ['passengers', 'flights']
+        model.warm_up([(tables, ['passengers.hair'])])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.pkl')
+            model.save(path)
+            loaded = rbn.RecursiveBayesianNetwork.load(path)
+        self.assertEqual(list(loaded.linked_.keys()), list(model.linked_.keys()))
+        linked, = loaded.linked_[frozenset(tables)]
+        self.assertIn(frozenset(['passengers.hair']), linked.steiner_trees_)
+        self.assertEqual(
+            loaded.p(tables, passengers__hair='Blond'),
+            model.p(tables, passengers__hair='Blond')
+        )
+
+
+class TestEstimate(unittest.TestCase):
+
+    def setUp(self):
+        self.model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        self.tables = ['passengers', 'flights', 'routes']
+        self.query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+
+    def test_no_budget(self):
+        estimate = self.model.estimate(self.tables, self.query)
+        self.assertEqual(estimate.method, 'linked')
+        self.assertEqual(estimate.selectivity, self.model.p(self.tables, **self.query))
+
+    def test_large_budget(self):
+        estimate = self.model.estimate(self.tables, self.query, work_budget=10 ** 6)
+        self.assertEqual(estimate.method, 'linked')
+        self.assertAlmostEqual(estimate.selectivity, self.model.p(self.tables, **self.query))
+        self.assertLessEqual(estimate.work, 10 ** 6)
+
+    def test_fallback(self):
+        independence = self.model.estimate(self.tables, self.query, work_budget=0)
+        self.assertEqual(independence.method, 'independence')
+        p_nationality = self.model.bns_['passengers'].p(nationality='Swedish')
+        p_origin = self.model.bns_['routes'].p(origin='Stockholm')
+        self.assertAlmostEqual(independence.selectivity, p_nationality * p_origin)
+
+        relations = self.model.estimate(self.tables, self.query, work_budget=independence.work * 2)
+        self.assertEqual(relations.method, 'relations')
+        self.assertLessEqual(relations.work, independence.work * 2)
+
+    def test_time_budget(self):
+        estimate = self.model.estimate(self.tables, self.query, time_budget=0.)
+        self.assertEqual(estimate.method, 'independence')
+
+    def test_qualified_attributes(self):
+        qualified = {'passengers__hair': 'Blond', 'passengers__gender': 'Male'}
+        bare = {'hair': 'Blond', 'gender': 'Male'}
+
+        def estimate(query, linked, work_budget):
+            # Linking the networks changes the work of the next estimates
+            self.model.linked_.clear()
+            self.model.aliases_.clear()
+            if linked:
+                self.model.link(['passengers'])
+            return self.model.estimate(['passengers'], query, work_budget=work_budget)
+
+        for linked in (False, True):
+            self.assertEqual(
+                estimate(qualified, linked, 10 ** 6).work,
+                estimate(bare, linked, 10 ** 6).work
+            )
+            independence = estimate(qualified, linked, 0)
+            self.assertGreater(independence.work, 0)
+            fallback = estimate(qualified, linked, independence.work)
+            self.assertEqual(fallback.method, 'independence')
+        self.assertEqual(
+            self.model.estimate(['passengers'], qualified).work,
+            self.model.estimate(['passengers'], bare).work
+        )
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        self.tables = ['passengers', 'flights', 'routes']
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fit(self, relations, params=None, **kwargs):
+        """Returns the fitted model along with the relations whose network had to be fitted."""
+        fit = bn.BayesianNetwork.fit
+        fitted = []
+
+        def spy(net, relation):
+            fitted.append(relation.name.split('_')[0])
+            return fit(net, relation)
+
+        with mock.patch.object(bn.BayesianNetwork, 'fit', spy):
+            model = rbn.RecursiveBayesianNetwork(**(params or {})).fit(
+                relations,
+                checkpoint=self.directory.name,
+                **kwargs
+            )
+        return model, sorted(fitted)
+
+    def test_resume(self):
+        expected, fitted = self.fit(make_relations())
+        self.assertEqual(fitted, ['flights', 'passengers', 'routes'])
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ['flights.pkl', 'passengers.pkl', 'routes.pkl']
+        )
+
+        model, fitted = self.fit(make_relations())
+        self.assertEqual(fitted, [])
+        self.assertEqual(model.extensions_['flights'], ['passengers', 'routes'])
+        self.assertEqual(
+            model.fanouts_['flights']['routes'].tolist(),
+            expected.fanouts_['flights']['routes'].tolist()
+        )
+        self.assertEqual(model.p(self.tables, **self.query), expected.p(self.tables, **self.query))
+
+    def test_changed_relation(self):
+        self.fit(make_relations())
+        passengers, routes, flights = make_relations()
+        routes.loc[0, 'minutes'] = 516
+        _, fitted = self.fit([passengers, routes, flights])
+        self.assertEqual(fitted, ['flights', 'routes'])
+
+    def test_failure(self):
+        fit = bn.BayesianNetwork.fit
+
+        def fail_on_flights(net, relation):
+            if relation.name.startswith('flights'):
+                raise MemoryError
+            return fit(net, relation)
+
+        with mock.patch.object(bn.BayesianNetwork, 'fit', fail_on_flights):
+            with self.assertRaises(MemoryError):
+                rbn.RecursiveBayesianNetwork().fit(make_relations(), checkpoint=self.directory.name)
+
+        _, fitted = self.fit(make_relations())
+        self.assertEqual(fitted, ['flights'])
+
+    def test_changed_parameters(self):
+        self.fit(make_relations(), params={'max_rows': 100, 'random_state': 42})
+        _, fitted = self.fit(make_relations(), params={'max_rows': 100, 'random_state': 42})
+        self.assertEqual(fitted, [])
+        _, fitted = self.fit(make_relations(), params={'max_rows': 50, 'random_state': 42})
+        self.assertEqual(fitted, ['flights', 'passengers', 'routes'])
+        _, fitted = self.fit(make_relations(), params={'max_rows': 50, 'random_state': 43})
+        self.assertEqual(fitted, ['flights', 'passengers', 'routes'])
+        state = np.random.RandomState(7)
+        self.fit(make_relations(), params={'random_state': state})
+        _, fitted = self.fit(make_relations(), params={'random_state': np.random.RandomState(7)})
+        self.assertEqual(fitted, [])
+
+    def test_row_count_fingerprint(self):
+        self.fit(make_relations(), fingerprint='rows')
+        passengers, routes, flights = make_relations()
+        routes.loc[0, 'minutes'] = 516
+        _, fitted = self.fit([passengers, routes, flights], fingerprint='rows')
+        self.assertEqual(fitted, [])
+
+
+class TestFitDatabase(unittest.TestCase):
+
+    def test_sizes(self):
+        # The catalog of a database which only holds the passengers
+        catalog = {
+            'FOREIGN KEY': pd.DataFrame(columns=['from_rel', 'from_col', 'to_rel', 'to_col']),
+            'PRIMARY KEY': pd.DataFrame({'table_name': ['passengers'], 'column_name': ['id']}),
+            'pg_stats': pd.DataFrame({
+                'tablename': ['passengers'] * 3,
+                'attname': ['id', 'nationality', 'hair']
+            }),
+            'pg_class': pd.DataFrame({'relname': ['passengers'], 'reltuples': [10.]})
+        }
+
+        def read_sql(sql, con):
+            return next(frame for key, frame in catalog.items() if key in sql)
+
+        def fit_sql(net, sql, con):
+            return bn.BayesianNetwork().fit(test_bn.make_passengers())
+
+        with mock.patch.object(pd, 'read_sql', read_sql), \
+                mock.patch.object(bn.BayesianNetwork, 'fit_sql', fit_sql):
+            model = rbn.RecursiveBayesianNetwork().fit_database(con=None)
+
+        self.assertEqual(model.sizes_, {'passengers': 10})
+        self.assertEqual(model.base_size(['passengers']), 10)
+        self.assertAlmostEqual(
+            model.estimate_cardinality(['passengers'], nationality='Swedish'),
+            5
+        )
+
+
+class TestFeedback(unittest.TestCase):
+
+    def setUp(self):
+        self.model = rbn.RecursiveBayesianNetwork(feedback_size=2).fit(make_relations())
+        self.tables = ['passengers', 'flights', 'routes']
+        self.query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+
+    def test_base_size(self):
+        self.assertEqual(self.model.base_size(self.tables), 16)
+        self.assertEqual(self.model.base_size(['passengers']), 10)
+        self.assertEqual(self.model.base_size(['passengers', 'routes']), 60)
+
+    def test_p(self):
+        self.model.observe(self.tables, self.query, 8)
+        self.assertEqual(self.model.p(self.tables, **self.query), .5)
+        # The order of the relations and the format of the attributes don't matter
+        self.assertEqual(
+            self.model.p(
+                list(reversed(self.tables)),
+                routes__origin='Stockholm',
+                **{'passengers.nationality': 'Swedish'}
+            ),
+            .5
+        )
+        estimate = self.model.estimate(self.tables, self.query, work_budget=0)
+        self.assertEqual(estimate.method, 'feedback')
+        self.assertEqual(estimate.selectivity, .5)
+
+    def test_bounded(self):
+        self.model.observe(['passengers'], {'hair': 'Blond'}, 1)
+        self.model.observe(['passengers'], {'hair': 'Brown'}, 2)
+        self.model.p(['passengers'], hair='Blond')
+        self.model.observe(['passengers'], {'hair': 'Dark'}, 3)
+        self.assertEqual(
+            [dict(query) for _, query in self.model.feedback_],
+            [{'hair': 'Blond'}, {'hair': 'Dark'}]
+        )
+
+    def test_refit(self):
+        expected = self.model.p(['passengers'], hair='Blond')
+        self.model.observe(['passengers'], {'hair': 'Blond'}, 1)
+        self.model.fit(make_relations())
+        self.assertEqual(len(self.model.feedback_), 0)
+        self.assertEqual(self.model.p(['passengers'], hair='Blond'), expected)
+
+    def test_unhashable(self):
+        self.model.observe(['passengers'], {'hair': ['Blond']}, 1)
+        self.assertEqual(len(self.model.feedback_), 0)
+
+
+class TestSubsets(unittest.TestCase):
+
+    def setUp(self):
+        self.model = rbn.RecursiveBayesianNetwork().fit(make_relations())
+        self.tables = ['flights', 'passengers', 'routes']
+        self.query = {'passengers__hair': 'Blond', 'passengers__gender': 'Male',
+                      'routes__destination': 'Boston'}
+
+    def test_same_as_p(self):
+        estimates = self.model.p_subsets(self.tables, self.query)
+        self.assertEqual(len(estimates), 6)
+        self.assertEqual(estimates[frozenset(['flights'])], 1.)
+        self.assertAlmostEqual(
+            estimates[frozenset(['passengers'])],
+            self.model.p(['passengers'], hair='Blond', gender='Male')
+        )
+        self.assertAlmostEqual(
+            estimates[frozenset(['flights', 'routes'])],
+            self.model.p(['flights', 'routes'], routes__destination='Boston')
+        )
+        self.assertAlmostEqual(
+            estimates[frozenset(self.tables)],
+            self.model.p(self.tables, **self.query)
+        )
+
+    def test_disconnected(self):
+        estimates = self.model.p_subsets(['passengers', 'routes'], self.query)
+        self.assertEqual(set(estimates), {frozenset(['passengers']), frozenset(['routes'])})
+
+    def test_memoized(self):
+        steiner_tree = bn.BayesianNetwork.steiner_tree
+        calls = []
+
+        def spy(net, nodes):
+            calls.append(sorted(nodes))
+            return steiner_tree(net, nodes)
+
+        with mock.patch.object(bn.BayesianNetwork, 'steiner_tree', spy):
+            self.model.p_subsets(self.tables, self.query)
+
+        # The passengers and the routes each send their messages once and are estimated once,
+        # the flights are estimated for the three subsets in which they have a predicate
+        self.assertEqual(len(calls), 7)
+
+
+class TestCardinality(unittest.TestCase):
+
+    def setUp(self):
+        # American passengers have two bookings each and Swedish passengers one
+        bookings = rel.Relation(
+            name='bookings',
+            data={
+                'passenger_id': [0, 1, 2, 3, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9],
+                'seat': ['A', 'B', 'A', 'C', 'A', 'B', 'B', 'A', 'C', 'A', 'A', 'B', 'C', 'A',
+                         'B']
+            },
+            foreign_keys=[('passenger_id', 'passengers')]
+        )
+        self.model = rbn.RecursiveBayesianNetwork().fit(make_relations() + [bookings])
+        self.tables = ['flights', 'passengers', 'bookings']
+
+    def test_fanouts(self):
+        hist = self.model.bns_['passengers'].nodes['nationality']['dist']
+        swedish, _ = hist.find_bucket('Swedish')
+        self.assertEqual(self.model.fanouts_['bookings']['passengers'][swedish], 5)
+        self.assertEqual(self.model.fanouts_['flights']['passengers'][swedish], 9)
+        self.assertEqual(self.model.fanouts_['flights']['passengers'].sum(), 16)
+
+    def test_single_host(self):
+        query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        tables = ['flights', 'passengers', 'routes']
+        self.assertAlmostEqual(
+            self.model.estimate_cardinality(tables, **query),
+            self.model.p(tables, **query) * 16
+        )
+
+    def test_shared_relation(self):
+        # The degrees of the bookings are uniform within each nationality, hence the estimates
+        # are exact
+        self.assertAlmostEqual(self.model.estimate_cardinality(self.tables), 23)
+        self.assertAlmostEqual(
+            self.model.estimate_cardinality(self.tables, passengers__nationality='Swedish'),
+            9
+        )
+        self.assertEqual(
+            self.model.estimate_cardinality(self.tables, passengers__nationality='Danish'),
+            0
+        )
+
+    def test_feedback_round_trip(self):
+        # Observing the estimated cardinality leaves the selectivity as it is
+        for query in ({}, {'passengers__nationality': 'Swedish'}, {'seat': 'A'}):
+            p = self.model.p(self.tables, **query)
+            cardinality = self.model.estimate_cardinality(self.tables, **query)
+            self.model.observe(self.tables, query, cardinality)
+            self.assertAlmostEqual(self.model.p(self.tables, **query), p)
+            self.assertEqual(self.model.estimate_cardinality(self.tables, **query), cardinality)
+
+    def test_feedback(self):
+        self.model.observe(self.tables, {'seat': 'A'}, 11)
+        self.assertEqual(self.model.estimate_cardinality(self.tables, seat='A'), 11)
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from phd import checkpoint
+from phd import files
+from phd import rbn
+from phd import rel
+from phd.tests import test_rbn
+
+
+class TestMappedRelation(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.relations = test_rbn.make_relations()
+        self.mapped = [
+            rel.MappedRelation.write(r, os.path.join(self.directory.name, r.name))
+            for r in self.relations
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_metadata(self):
+        passengers, routes, flights = self.mapped
+        self.assertEqual(len(flights), 16)
+        self.assertEqual(routes.columns, ['origin', 'destination', 'minutes'])
+        self.assertEqual(
+            [(fk.from_col, fk.to_rel) for fk in flights.foreign_keys],
+            [('passenger_id', 'passengers'), ('route_id', 'routes')]
+        )
+        self.assertIsInstance(routes.array('minutes'), np.memmap)
+        self.assertEqual(routes[['minutes']].columns, ['minutes'])
+        with self.assertRaises(KeyError):
+            routes[['hair']]
+
+    def test_round_trip(self):
+        for relation, mapped in zip(self.relations, self.mapped):
+            frame = pd.concat(mapped.chunks(chunksize=4))
+            expected = pd.DataFrame(relation).astype(frame.dtypes.to_dict())
+            pd.testing.assert_frame_equal(frame, expected, check_index_type=False)
+
+    def test_write_chunks(self):
+        frame = pd.DataFrame({'x': ['a', None, 'b', 'a'], 'y': [1., np.nan, 3., 4.]})
+        chunks = [frame.iloc[:2], frame.iloc[2:]]
+        mapped = rel.MappedRelation.write(chunks, os.path.join(self.directory.name, 'xy'), 'xy')
+        self.assertEqual(mapped.meta['columns']['x']['categories'], ['a', 'b'])
+        self.assertEqual(list(mapped.take(slice(None))['x']), ['a', None, 'b', 'a'])
+        with self.assertRaises(ValueError):
+            rel.MappedRelation.write(chunks[::-1], os.path.join(self.directory.name, 'yx'))
+
+    def test_sample(self):
+        sample = self.mapped[0].sample(4, random_state=42)
+        self.assertIsInstance(sample, rel.Relation)
+        self.assertEqual(len(sample), 4)
+        self.assertTrue(sample.index.is_monotonic_increasing)
+        pd.testing.assert_frame_equal(
+            pd.DataFrame(sample),
+            pd.DataFrame(self.relations[0]).loc[sample.index]
+        )
+
+    def test_lookup(self):
+        passengers, routes, _ = self.mapped
+        self.assertEqual(
+            list(passengers.lookup([5, 0, np.nan, 42], 'nationality')),
+            ['American', 'Swedish', None, None]
+        )
+        np.testing.assert_array_equal(routes.lookup([1, 7], 'minutes'), [830., np.nan])
+
+    def test_fit(self):
+        expected = rbn.RecursiveBayesianNetwork().fit(self.relations)
+        model = rbn.RecursiveBayesianNetwork().fit(self.mapped)
+        self.assertEqual(model.sizes_, expected.sizes_)
+        tables = ['flights', 'passengers', 'routes']
+        query = {'passengers__nationality': 'Swedish', 'routes__origin': 'Stockholm'}
+        self.assertAlmostEqual(model.p(tables, **query), expected.p(tables, **query))
+
+    def test_files(self):
+        path = self.mapped[1].directory
+        self.assertEqual(files.read_header(path), ['origin', 'destination', 'minutes'])
+        chunks = list(files.read_chunks(path, ['minutes'], chunksize=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 2])
+        self.assertEqual(
+            checkpoint.relation_fingerprint(self.mapped[1]),
+            checkpoint.relation_fingerprint(rel.MappedRelation(path))
+        )
+
+    def test_rewritten_column(self):
+        path = self.mapped[1].directory
+        before = checkpoint.relation_fingerprint(rel.MappedRelation(path))
+        # The column is rewritten in place, meta.json is left untouched
+        column = os.path.join(path, 'minutes.bin')
+        stat = os.stat(column)
+        values = np.fromfile(column, dtype=np.float64)
+        (values + 1).tofile(column)
+        os.utime(column, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        after = checkpoint.relation_fingerprint(rel.MappedRelation(path))
+        self.assertNotEqual(before, after)
@@ -0,0 +1,55 @@
+import unittest
+
+import pandas as pd
+
+from phd import allocation
+from phd import bn
+from phd import histogram
+from phd import rbn
+from phd import report
+from phd.tests import test_bn
+from phd.tests import test_rbn
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.bn = bn.BayesianNetwork().fit(test_bn.make_passengers())
+
+    def test_columns(self):
+        r = self.bn.report()
+        self.assertEqual(list(r.index), list(self.bn.freeze().nodes))
+        self.assertEqual(list(r.columns), report.COLUMNS[1:])
+        self.assertEqual(r['buckets'].sum(), allocation.n_buckets(self.bn))
+        self.assertTrue((r['bytes'] > r['frozen_bytes']).all())
+        self.assertTrue((r['frozen_bytes'] > 0).all())
+        self.assertTrue((r['fit_time'] >= 0).all())
+        self.assertEqual(r.loc[self.bn.root, 'kind'], 'Histogram')
+        self.assertIsNone(r.loc[self.bn.root, 'parent'])
+
+    def test_mcv_coverage(self):
+        # Every value of the passengers has its own bucket
+        self.assertTrue((self.bn.report()['mcv_coverage'] == 1).all())
+        hist = histogram.Histogram(1, 1).fit([1, 1, 2, 3])
+        self.assertAlmostEqual(report.mcv_coverage(hist), .5)
+        hist = histogram.Histogram(0, 2).fit([1, 2, 3, 4])
+        self.assertEqual(report.mcv_coverage(hist), 0.)
+
+    def test_holdout(self):
+        holdout = pd.DataFrame(test_bn.make_passengers())
+        r = self.bn.report(holdout=holdout)
+        self.assertEqual(list(r['median_q_error']), [1.] * len(r))
+        self.assertEqual(list(r['max_q_error']), [1.] * len(r))
+
+    def test_recursive(self):
+        model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+        r = model.report()
+        self.assertEqual(r.index.names, ['relation', 'node'])
+        self.assertEqual(
+            len(r),
+            sum(bn.number_of_nodes() for bn in model.bns_.values())
+        )
+        self.assertEqual(
+            r.groupby(level='relation')['buckets'].sum().to_dict(),
+            {name: allocation.n_buckets(bn) for name, bn in model.bns_.items()}
+        )
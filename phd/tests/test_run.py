@@ -0,0 +1,256 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import pandas as pd
+
+try:
+    import run
+    RUN_IMPORTABLE = True
+except ImportError:
+    RUN_IMPORTABLE = False
+
+
+def make_row(i, query_name='1a'):
+    return {
+        'mother_query_name': query_name,
+        'sql': f'SELECT * FROM title AS t WHERE t.id = {i}',
+        'relations': ('t',),
+        'joins': [],
+        'wheres': ({'eq': ['t.id', i]},),
+        'true_cardinality': 1,
+        'postgres_estimate': 1.,
+        'postgres_optimization_time': .1,
+        'execution_time': .2
+    }
+
+
+@unittest.skipUnless(RUN_IMPORTABLE, 'run.py requires moz_sql_parser')
+class TestResultsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'results.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_buffered(self):
+        with run.ResultsStore(self.path, batch_size=3) as store:
+            for i in range(4):
+                store.add(make_row(i))
+            self.assertEqual(len(store.buffer), 1)
+            self.assertIn(make_row(3)['sql'], store)
+            self.assertIn(make_row(0)['sql'], store)
+            self.assertNotIn(make_row(4)['sql'], store)
+            self.assertEqual(len(store), 4)
+
+    def test_resume(self):
+        with run.ResultsStore(self.path) as store:
+            for i in range(5):
+                store.add(make_row(i))
+            store.mark_done('1a')
+        with run.ResultsStore(self.path) as store:
+            self.assertTrue(store.is_done('1a'))
+            self.assertFalse(store.is_done('2a'))
+            self.assertIn(make_row(2)['sql'], store)
+            store.add(make_row(2))
+            results = store.to_frame()
+        self.assertEqual(len(results), 5)
+        self.assertEqual(list(results.columns), list(run.FIELDS))
+        self.assertEqual(results['relations'][0], "('t',)")
+
+    def test_import_csv(self):
+        csv_path = os.path.join(self.directory.name, 'results.csv')
+        pd.DataFrame([make_row(i, '2b') for i in range(10)]).to_csv(csv_path, index=False)
+        with run.ResultsStore(self.path) as store:
+            store.import_csv(csv_path, chunksize=4)
+            self.assertEqual(len(store), 10)
+            self.assertTrue(store.is_done('2b'))
+            self.assertIn(make_row(7)['sql'], store)
+
+
+@unittest.skipUnless(RUN_IMPORTABLE, 'run.py requires moz_sql_parser')
+class TestWorkload(unittest.TestCase):
+
+    def test_read_statements(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'queries.sql')
+            with open(path, 'w') as f:
+                f.write('-- A multi-line query\n')
+                f.write('SELECT COUNT(*)\nFROM title t\nWHERE t.production_year > 2000;\n')
+                f.write('2020-01-01 LOG: SELECT * FROM title t WHERE t.kind_id = 1\n')
+            statements = list(run.read_statements(path))
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[0].endswith('2000'))
+        self.assertEqual(statements[1], 'SELECT * FROM title t WHERE t.kind_id = 1')
+
+    def test_workload_shapes(self):
+        sql = (
+            'SELECT COUNT(*) FROM title t, movie_companies mc '
+            'WHERE t.id = mc.movie_id AND mc.company_type_id = 2 AND t.production_year > 2000'
+        )
+        shapes = list(run.workload_shapes([sql, sql]))
+        self.assertCountEqual(shapes, [
+            (['title'], ['title.production_year']),
+            (['movie_companies'], ['movie_companies.company_type_id']),
+            (['movie_companies', 'title'],
+             ['movie_companies.company_type_id', 'title.production_year'])
+        ])
+
+    def test_single_relation(self):
+        sql = 'SELECT COUNT(*) FROM movie_companies mc WHERE mc.company_type_id=2'
+        shapes = list(run.workload_shapes([sql]))
+        self.assertEqual(shapes, [(['movie_companies'], ['movie_companies.company_type_id'])])
+
+
+@unittest.skipUnless(RUN_IMPORTABLE, 'run.py requires moz_sql_parser')
+class TestSingleScan(unittest.TestCase):
+
+    def setUp(self):
+        self.con = sqlite3.connect(':memory:')
+        self.con.execute('CREATE TABLE title (id INTEGER, production_year INTEGER, '
+                         'kind_id INTEGER)')
+        self.con.execute('CREATE TABLE movie_companies (id INTEGER, movie_id INTEGER, '
+                         'company_type_id INTEGER)')
+        self.con.executemany('INSERT INTO title VALUES (?, ?, ?)', [
+            (i, 1990 + i % 30, None if i % 7 == 0 else i % 3) for i in range(60)
+        ])
+        self.con.executemany('INSERT INTO movie_companies VALUES (?, ?, ?)', [
+            (i, (i * 7) % 70, i % 4) for i in range(150)
+        ])
+        self.graph = run.parse_query_into_graph(
+            'SELECT COUNT(*) FROM title t, movie_companies mc '
+            'WHERE t.id = mc.movie_id AND mc.company_type_id = 2 AND t.production_year > 2000 '
+            'AND t.kind_id = 1'
+        )
+        self.scans = []
+
+    def tearDown(self):
+        self.con.close()
+
+    def execute(self, sql):
+        self.scans.append(sql)
+        return self.con.execute(sql).fetchall()
+
+    def test_same_as_one_query_per_subset(self):
+        counted = list(run.yield_counted_queries(self.graph, self.execute))
+        expected = list(run.yield_queries(self.graph))
+        self.assertEqual([c[:4] for c in counted], expected)
+        for sql, _, _, _, truth, _ in counted:
+            self.assertEqual(truth, self.con.execute(sql.replace('*', 'COUNT(*)')).fetchone()[0])
+        # One scan per join set with predicates: {t}, {mc} and {t, mc}
+        self.assertEqual(len(self.scans), 3)
+        self.assertEqual(len(counted), 3 + 1 + 7)
+
+    def test_done(self):
+        done = {sql for sql, relations, *_ in run.yield_queries(self.graph) if len(relations) == 1}
+        counted = list(run.yield_counted_queries(self.graph, self.execute, done=done.__contains__))
+        self.assertEqual(len(self.scans), 1)
+        self.assertEqual(len(counted), 7)
+
+    def test_errors(self):
+
+        def execute(sql):
+            if 'movie_companies' in sql:
+                raise sqlite3.OperationalError
+            return self.con.execute(sql).fetchall()
+
+        counted = list(run.yield_counted_queries(self.graph, execute,
+                                                 errors=sqlite3.OperationalError))
+        self.assertEqual(len(counted), 3)
+
+    def test_subset_cardinalities(self):
+        rows = [(0, 0, 5), (1, 0, 3), (0, 1, 2), (1, 1, 1)]
+        self.assertEqual(run.subset_cardinalities(rows, 2), [11, 4, 3, 1])
+
+
+@unittest.skipUnless(RUN_IMPORTABLE, 'run.py requires moz_sql_parser')
+class TestFeedback(unittest.TestCase):
+
+    def test_equalities_only(self):
+        graph = run.parse_query_into_graph(
+            "SELECT COUNT(*) FROM title t, movie_companies mc WHERE t.id = mc.movie_id "
+            "AND mc.note = 'x' AND t.production_year > 2000"
+        )
+        sqls = [sql for sql, *_ in run.yield_queries(graph)]
+        results = pd.DataFrame({'sql': sqls, 'true_cardinality': range(len(sqls))})
+        observed = list(run.feedback(results))
+        self.assertEqual(len(observed), 2)
+        for relations, query, truth in observed:
+            self.assertIn('movie_companies', relations)
+            self.assertEqual(query, {'movie_companies.note': 'x'})
+            self.assertEqual(sqls[truth].count("'x'"), 1)
+
+
+@unittest.skipUnless(RUN_IMPORTABLE, 'run.py requires moz_sql_parser')
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        from phd import rbn
+        from phd.tests import test_rbn
+        self.model = rbn.RecursiveBayesianNetwork().fit(test_rbn.make_relations())
+        self.results = pd.DataFrame({
+            'mother_query_name': '1a',
+            'sql': [
+                "SELECT * FROM flights AS f, passengers AS p WHERE f.passenger_id = p.id "
+                "AND p.nationality = 'Swedish'",
+                "SELECT * FROM passengers AS p WHERE p.hair IN ('Blond', 'Dark') "
+                "OR p.gender = 'Male'",
+                "SELECT * FROM routes AS r WHERE r.origin LIKE '%holm'"
+            ],
+            'true_cardinality': [9, 8, 3],
+            'postgres_estimate': [18., 4., 3.],
+            'postgres_optimization_time': [.01, .02, .03]
+        })
+
+    def test_model_query(self):
+        from phd import op
+        self.assertEqual(
+            run.model_query(self.results['sql'][0]),
+            (['flights', 'passengers'], [], {'passengers.nationality': 'Swedish'})
+        )
+        self.assertEqual(
+            run.model_query(self.results['sql'][1]),
+            (
+                ['passengers'],
+                [op.Or({'passengers.hair': op.In(['Blond', 'Dark'])},
+                       {'passengers.gender': 'Male'})],
+                {}
+            )
+        )
+        self.assertEqual(
+            run.as_condition({'or': [{'eq': ['t.kind', {'literal': 'a'}]},
+                                     {'eq': ['t.kind', {'literal': 'b'}]}]}),
+            ('t.kind', op.Or('a', 'b'))
+        )
+        self.assertIsNone(run.model_query(self.results['sql'][2]))
+
+    def test_benchmark(self):
+        bench = run.benchmark(self.model, self.results, model_load_time=.5)
+        self.assertEqual(list(bench['estimate'][:2]), [9., 8.])
+        self.assertTrue(pd.isnull(bench['estimate'][2]))
+        self.assertEqual(list(bench['postgres_q_error']), [2., 2., 1.])
+        self.assertEqual(list(bench['q_error'][:2]), [1., 1.])
+        self.assertTrue((bench['model_load_time'] == .5).all())
+
+        summary = run.summarize(bench)
+        self.assertEqual(summary.loc['q_error', 'count'], 2)
+        self.assertEqual(summary.loc['postgres_q_error', 'count'], 3)
+        self.assertEqual(summary.loc['postgres_optimization_time', 'max'], .03)
+        self.assertIn('p99', summary.columns)
+
+    def test_offline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            model_path = os.path.join(directory, 'model.pkl')
+            csv_path = os.path.join(directory, 'results.csv')
+            output = os.path.join(directory, 'benchmark.csv')
+            self.model.save(model_path)
+            self.results.to_csv(csv_path, index=False)
+            results = run.read_results(os.path.join(directory, 'results.db'), csv_path)
+            summary = run.run_benchmark(model_path, results, output)
+            bench = pd.read_csv(output)
+        self.assertEqual(len(bench), 3)
+        self.assertTrue((bench['model_load_time'] > 0).all())
+        self.assertEqual(summary.loc['estimation_time', 'count'], 2)
@@ -0,0 +1,62 @@
+import copy
+import itertools
+import unittest
+
+from phd import bn
+from phd import cpd
+from phd import histogram
+from phd.tests import test_factor
+
+
+class TestSparseCPD(unittest.TestCase):
+
+    def setUp(self):
+        self.by = ['a', 'a', 'a', 'b', 'b', 'b', 'c', 'c']
+        self.on = [1, 2, 2, 3, 3, 3, 1, 4]
+        self.dense = cpd.CPD(3, 0, 4, 0).fit(self.by, self.on)
+        self.sparse = cpd.SparseCPD(3, 0, 4, 0).fit(self.by, self.on)
+
+    def test_shared_boundaries(self):
+        self.assertEqual([b.left for b in self.sparse.on_hist.buckets], [1, 2, 3, 4])
+        self.assertEqual(len(self.sparse.data), 5)
+
+    def assertSameHistograms(self, h1, h2):
+        self.assertEqual(len(h1), len(h2))
+        for b1, b2 in zip(h1.buckets, h2.buckets):
+            self.assertEqual((b1.left, b1.right), (b2.left, b2.right))
+            self.assertAlmostEqual(float(b1.frequency), float(b2.frequency))
+
+    def test_p(self):
+        for by, on in itertools.product('abc', [0, 1, 2, 3, 4]):
+            self.assertAlmostEqual(self.sparse.p(by, on), float(self.dense.p(by, on)))
+        self.assertEqual(self.sparse.p('d', 1), 0)
+
+    def test_p_by(self):
+        for on in [0, 1, 2, 3, 4]:
+            self.assertSameHistograms(self.sparse.p_by(on), self.dense.p_by(on))
+
+    def test_mul(self):
+        hist = histogram.Histogram(4, 0).fit([1, 1, 2, 3, 4, 4, 4])
+        self.assertSameHistograms(
+            (self.sparse * hist).marginalize(),
+            (self.dense * hist).marginalize()
+        )
+
+    def test_mul_leaves_original_untouched(self):
+        before = copy.copy(self.sparse)
+        self.sparse * histogram.Histogram(4, 0).fit([1, 2])
+        self.assertEqual(self.sparse, before)
+
+
+class TestSparseNetwork(unittest.TestCase):
+
+    def test_same_estimates(self):
+        relation = test_factor.make_correlated()
+        dense = bn.BayesianNetwork(random_state=42).fit(relation.copy())
+        sparse = bn.BayesianNetwork(random_state=42, sparse=True).fit(relation.copy())
+        self.assertIsInstance(sparse.nodes['b']['dist'], cpd.SparseCPD)
+        for cols in itertools.combinations(['a', 'b', 'c', 'd'], 2):
+            for vals in itertools.product(*(sorted(set(relation[c]))[:4] for c in cols)):
+                query = dict(zip(cols, vals))
+                self.assertAlmostEqual(sparse.p(**query), dense.p(**query))
+        self.assertAlmostEqual(sparse.freeze().p(a=3, d='x'), dense.p(a=3, d='x'))